@@ -0,0 +1,164 @@
+import asyncio
+import multiprocessing
+from http import HTTPStatus
+from concurrent.futures import ProcessPoolExecutor
+from quart import current_app as app
+
+from data.spatial import KDTree, kd_tree_layout
+from ..constants import Tables
+from app.settings import (
+    NEAREST_LOCATIONS_VERSION_CHECK_INTERVAL,
+    NEAREST_LOCATIONS_REBUILD_INTERVAL,
+    WEATHER_GRID_ENABLED,
+    WEATHER_GRID_PRECISION,
+)
+
+LOGGER_KEY = "app.location_manager.nearest"
+# bumped on every add, put and delete of a location, so that every worker rebuilds its index
+VERSION_KEY = "locations_version"
+
+
+class nearestLocationIndex:
+    """
+    in-memory KD-tree over the coordinates of all the locations, grouped by weather grid cell
+    too when the grid is enabled. a worker compares its
+    version of the index with the one in redis at most once every
+    NEAREST_LOCATIONS_VERSION_CHECK_INTERVAL seconds, and rebuilds it in the background
+    while the previous index keeps serving. the tree is built in a child process, so that
+    the build does not hold the GIL of the worker, and at most once every
+    NEAREST_LOCATIONS_REBUILD_INTERVAL seconds, so that a burst of changes is one rebuild
+    """
+    def __init__(self) -> None:
+        self.tree = None
+        self.cells = {}
+        self.version = None
+        self.stale = True
+        self.last_check = 0
+        self.last_rebuild = None
+        self.rebuild = None
+        self.executor = None
+
+    async def invalidate(self):
+        """
+        marks the index of every worker stale, called once a location is added, put or deleted
+        """
+        app.logger.info(f"{LOGGER_KEY}.invalidate")
+        self.stale = True
+        try:
+            await app.redis.incr(VERSION_KEY)
+        except Exception as e:
+            # the other workers pick the change up once redis is back or they restart
+            app.logger.error(f"{LOGGER_KEY}.invalidate.exception: {str(e)}")
+
+    async def checkVersion(self):
+        now = asyncio.get_event_loop().time()
+        if self.stale or now - self.last_check < NEAREST_LOCATIONS_VERSION_CHECK_INTERVAL:
+            return
+        self.last_check = now
+        version = await self.getVersion()
+        if version is not None and version != self.version:
+            self.stale = True
+
+    async def getVersion(self):
+        """
+        reads the version through incrby, plain reads may be served by the in-process cache.
+        None if redis is unreachable, the current index keeps serving meanwhile
+        """
+        try:
+            return await app.redis.incrby(VERSION_KEY, 0)
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getVersion.exception: {str(e)}")
+            return None
+
+    async def rebuildIndex(self, delay=0):
+        """
+        loads the coordinates of all the locations from DB and builds the KD-tree in a child
+        process, after waiting delay seconds for the changes that follow
+        """
+        app.logger.info(f"{LOGGER_KEY}.rebuildIndex")
+        await asyncio.sleep(delay)
+        loop = asyncio.get_event_loop()
+        self.last_rebuild = loop.time()
+        try:
+            # the version is read first, a change during the rebuild makes it stale again
+            version = await self.getVersion()
+            self.stale = False
+            table_name = Tables.LOCATION.value["name"]
+            columns = ",".join(Tables.LOCATION.value["get_columns"])
+            query = f"SELECT {columns} FROM {table_name};"
+            locations_data = await app.db.fetch(query)
+
+            coordinates = [(location_data["latitude"], location_data["longitude"]) for location_data in locations_data]
+            if self.executor is None:
+                # spawned, a forked child would inherit the event loop and the connections
+                self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+            points, order, cells_of_locations = await loop.run_in_executor(
+                self.executor, kd_tree_layout, coordinates, WEATHER_GRID_PRECISION if WEATHER_GRID_ENABLED else None
+            )
+            entries = [
+                (location_data["latitude"], location_data["longitude"], location_data)
+                for location_data in locations_data
+            ]
+            self.tree = KDTree(entries, layout=(points, order))
+            if WEATHER_GRID_ENABLED:
+                cells = {}
+                for cell, location_data in zip(cells_of_locations, locations_data):
+                    cells.setdefault(cell, []).append(location_data)
+                self.cells = cells
+            self.version = version
+            self.last_check = loop.time()
+            app.logger.info(f"{LOGGER_KEY}.rebuildIndex.completed: {len(self.tree)}")
+        except Exception:
+            self.stale = True
+            raise
+
+    async def ensureIndex(self):
+        """
+        starts a rebuild of a stale index, and waits for it only when there is no index yet. a
+        rebuild starts at least NEAREST_LOCATIONS_REBUILD_INTERVAL seconds after the previous one
+        """
+        await self.checkVersion()
+        if self.stale and self.rebuild is None:
+            delay = 0
+            if self.tree is not None and self.last_rebuild is not None:
+                delay = max(self.last_rebuild + NEAREST_LOCATIONS_REBUILD_INTERVAL - asyncio.get_event_loop().time(), 0)
+            self.rebuild = asyncio.ensure_future(self.rebuildIndex(delay))
+            self.rebuild.add_done_callback(self.rebuildDone)
+        if self.tree is None:
+            await asyncio.shield(self.rebuild)
+
+    def rebuildDone(self, rebuild):
+        self.rebuild = None
+        if not rebuild.cancelled() and rebuild.exception():
+            app.logger.error(f"{LOGGER_KEY}.rebuildIndex.exception: {str(rebuild.exception())}")
+
+    def close(self):
+        if self.rebuild:
+            self.rebuild.cancel()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def locationsInCell(self, cell):
+        """
+        fetches the locations in the weather grid cell
+        """
+        await self.ensureIndex()
+        return self.cells.get(cell, [])
+
+    async def nearest(self, latitude, longitude, k):
+        """
+        fetches the k locations closest to the coordinate, closest first
+        """
+        app.logger.info(f"{LOGGER_KEY}.nearest")
+        response = {"error": None, "data": [], "status_code": None}
+        try:
+            await self.ensureIndex()
+            response["data"] = [
+                {**location_data, "distance_km": round(distance, 3)}
+                for distance, location_data in self.tree.nearest(latitude, longitude, k)
+            ]
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.nearest.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+        return response
@@ -1,16 +1,17 @@
-import json
-import aiohttp
+import asyncio
 from uuid import uuid4
 from http import HTTPStatus
+from decimal import Decimal
 from datetime import datetime
 from quart import current_app as app
-from geopy.geocoders import Nominatim
 
-from ..constants import Tables, COUNTRY_CODES, COUNTRY_CODES_TO_NAMES
+from ..constants import Tables, Lanes, COUNTRY_CODES, COUNTRY_CODES_TO_NAMES
 from app.settings import (
     OPEN_WEATHER_API_KEY,
     OPEN_WEATHER_API_BASE_URL,
-    OPEN_WEATHER_GEO_PARAMS
+    OPEN_WEATHER_GEO_PARAMS,
+    GEOCODE_CACHE_TTL,
+    GEOCODE_NEGATIVE_TTL,
 )
 
 LOGGER_KEY = "app.location_manager.service"
@@ -35,7 +36,7 @@ class locationManager:
 
         try:
             if self.latitude and self.longitude:
-                valid_lat_long = self.validate_latitude_and_longitude()
+                valid_lat_long = await self.validate_latitude_and_longitude()
                 if not valid_lat_long:
                     response["error"] = f"latitude {self.latitude}, longitude {self.longitude} does not points to {self.city}"
                     response["status_code"] = HTTPStatus.BAD_REQUEST.value
@@ -57,20 +58,20 @@ class locationManager:
                 table_name = Tables.LOCATION.value.get("name")
                 columns = Tables.LOCATION.value["get_columns"].copy()
                 columns = ','.join(columns)
-                where_clause = ""
+                where_clause, args = "", []
                 if self.location_id:
-                    where_clause = f" WHERE location_id='{self.location_id}'"
+                    where_clause, args = " WHERE location_id=$1", [self.location_id]
                 elif self.city:
-                    where_clause = f" WHERE city='{self.city}'"
+                    where_clause, args = " WHERE city=$1", [self.city]
                 
                 select_query = f"SELECT {columns} FROM {table_name}{where_clause};"
-                locations_data = await app.db.execute_raw_select_query(select_query)
+                locations_data = await app.db.fetch(select_query, *args)
 
                 # set the data in redis
                 if locations_data:
                     response["data"] = locations_data
                     if self.location_id:
-                        await app.redis.set(key=self.location_id, value=locations_data)
+                        await app.redis.set(key=self.location_id, value=locations_data, tags=[f"location_{self.location_id}"])
                     else:
                         await app.redis.set(key="all_locations", value=locations_data)
         except Exception as e:
@@ -79,48 +80,195 @@ class locationManager:
             response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
         
         return response
-    
+
+
+    async def fetchLocationsByIds(self, location_ids):
+        """
+        fetches the locations of all the location_ids with one cache and one DB round trip,
+        data is a dict of location_id to location details
+        """
+        app.logger.info(f"{LOGGER_KEY}.fetchLocationsByIds")
+        response = {"error": None, "data": {}, "status_code": None}
+
+        try:
+            # check in cache
+            cached_locations_data = await app.redis.mget(location_ids)
+            missed_location_ids = []
+            for location_id, cached_location_data in zip(location_ids, cached_locations_data):
+                if cached_location_data:
+                    response["data"][location_id] = cached_location_data[0]
+                else:
+                    missed_location_ids.append(location_id)
+
+            if missed_location_ids:
+                # cache miss - get data from DB
+                app.logger.info(f"{LOGGER_KEY}.fetchLocationsByIds.cache_miss: {len(missed_location_ids)}")
+                table_name = Tables.LOCATION.value.get("name")
+                columns = Tables.LOCATION.value["get_columns"].copy()
+                columns = ','.join(columns)
+
+                select_query = f"SELECT {columns} FROM {table_name} WHERE location_id = ANY($1::uuid[]);"
+                locations_data = await app.db.fetch(select_query, missed_location_ids)
+
+                # set the data in redis in the same format as fetchLocations
+                for location_data in locations_data:
+                    response["data"][location_data["location_id"]] = location_data
+                await app.redis.mset(
+                    {location_data["location_id"]: [location_data] for location_data in locations_data},
+                    tags={location_data["location_id"]: [f"location_{location_data['location_id']}"] for location_data in locations_data},
+                )
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.fetchLocationsByIds.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+
+        return response
+
+
+    def geocodeKey(self):
+        """
+        normalized city and country code the geocode of the location is cached under
+        """
+        city = " ".join(self.city.lower().split())
+        country_code = (COUNTRY_CODES.get(self.country) or "") if self.country else ""
+        return city, country_code
+
+
+    async def getCachedGeocode(self):
+        """
+        gets the geocode of the city from redis, or from DB and caches it again, None if
+        it is not cached anywhere. a failure is only logged and taken as a miss, so that the
+        city is geocoded upstream
+        """
+        app.logger.info(f"{LOGGER_KEY}.getCachedGeocode")
+        try:
+            city, country_code = self.geocodeKey()
+            cached_geocode_key = f"geocode_{country_code}_{city}"
+            cached_geocode = await app.redis.get(cached_geocode_key)
+            if cached_geocode:
+                app.logger.info(f"{LOGGER_KEY}.getCachedGeocode.cache_hit")
+                return cached_geocode
+
+            table_name = Tables.GEOCODE.value["name"]
+            columns = ",".join(Tables.GEOCODE.value["get_columns"])
+            query = f"SELECT {columns} FROM {table_name} WHERE city=$1 AND country_code=$2;"
+            geocode = await app.db.fetchrow(query, city, country_code)
+            if geocode:
+                app.logger.info(f"{LOGGER_KEY}.getCachedGeocode.db_hit")
+                await app.redis.set(key=cached_geocode_key, value=geocode, expiry_time=GEOCODE_CACHE_TTL)
+            return geocode
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getCachedGeocode.exception: {str(e)}")
+            return None
+
+
+    async def cacheGeocode(self, geocode):
+        """
+        caches the geocode of the city in DB and redis, or only in redis for the negative TTL
+        when the city does not exist. a failure is only logged, the geocode is used anyway
+        """
+        app.logger.info(f"{LOGGER_KEY}.cacheGeocode")
+        try:
+            city, country_code = self.geocodeKey()
+            cached_geocode_key = f"geocode_{country_code}_{city}"
+            if geocode.get("not_found"):
+                await app.redis.set(key=cached_geocode_key, value=geocode, expiry_time=GEOCODE_NEGATIVE_TTL)
+                return
+
+            table_name = Tables.GEOCODE.value["name"]
+            columns = ",".join(Tables.GEOCODE.value["insert_columns"])
+            query = f"INSERT INTO {table_name} ({columns}) VALUES ($1, $2, $3, $4, $5, $6, $7)"
+            query += " ON CONFLICT (city, country_code) DO UPDATE SET latitude=EXCLUDED.latitude, longitude=EXCLUDED.longitude,"
+            query += " state=EXCLUDED.state, country=EXCLUDED.country, created=EXCLUDED.created;"
+            await app.db.execute(
+                query,
+                city,
+                country_code,
+                Decimal(str(geocode["latitude"])),
+                Decimal(str(geocode["longitude"])),
+                geocode["state"] or None,
+                geocode["country"] or None,
+                datetime.now(),
+            )
+            await app.redis.set(key=cached_geocode_key, value=geocode, expiry_time=GEOCODE_CACHE_TTL)
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.cacheGeocode.exception: {str(e)}")
+
+
+    async def fetchGeocode(self):
+        """
+        Fetches the geocode of the city using openweather geo API, data has not_found set
+        when the city does not exist. the call is deferred with TOO_MANY_REQUESTS when the
+        open weather quota is exhausted
+        """
+        app.logger.info(f"{LOGGER_KEY}.fetchGeocode")
+        response = {"error": None, "data": [], "status_code": None}
+        if app.open_weather_quota and not await app.open_weather_quota.acquire(Lanes.GEOCODING):
+            response["error"] = "open weather quota exhausted, try again later"
+            response["status_code"] = HTTPStatus.TOO_MANY_REQUESTS.value
+            return response
+
+        url = f"{OPEN_WEATHER_API_BASE_URL}/{OPEN_WEATHER_GEO_PARAMS}"
+        if self.country:
+            country_code = COUNTRY_CODES.get(self.country)
+            city_param = f"{self.city},{country_code}"
+        else:
+            city_param = self.city
+        params = {
+            "q": city_param,
+            "appid": OPEN_WEATHER_API_KEY
+        }
+        app.logger.info(f"{LOGGER_KEY}.fetchGeocode.url: {url}")
+        status_code, response_text = await app.http_client.get_json(url, params=params)
+        app.logger.info(f"{LOGGER_KEY}.fetchGeocode.status_code: {status_code}")
+        if status_code != HTTPStatus.OK.value:
+            # api failure handled, and not cached
+            app.logger.error(f"{LOGGER_KEY}.fetchGeocode.error: {response_text}")
+            response["error"] = response_text["message"]
+            response["status_code"] = HTTPStatus.FAILED_DEPENDENCY.value
+            return response
+
+        if response_text:
+            country_code = response_text[0].get("country","")
+            response["data"] = {
+                "latitude": response_text[0].get("lat"),
+                "longitude": response_text[0].get("lon"),
+                "state": response_text[0].get("state","").lower(),
+                "country": COUNTRY_CODES_TO_NAMES.get(country_code, "").lower(),
+            }
+        else:
+            response["data"] = {"not_found": True}
+        await self.cacheGeocode(response["data"])
+        return response
+
 
     async def setLatLong(self):
         """
-        Fetches lat long using openweather geo API
+        Sets lat long of the city from the geocode cache, or using openweather geo API
         """
         app.logger.info(f"{LOGGER_KEY}.setLatLong")
         response = {"error": None, "data": [], "status_code": None}
         try:
-            url = f"{OPEN_WEATHER_API_BASE_URL}/{OPEN_WEATHER_GEO_PARAMS}"
-            if self.country:
-                country_code = COUNTRY_CODES.get(self.country)
-                city_param = f"{self.city},{country_code}"
+            geocode = await self.getCachedGeocode()
+            if not geocode:
+                geocode_response = await self.fetchGeocode()
+                if geocode_response.get("error"):
+                    return geocode_response
+                geocode = geocode_response["data"]
+
+            if geocode.get("not_found"):
+                response["error"] = "city does not exists"
+                response["status_code"] = HTTPStatus.BAD_REQUEST.value
             else:
-                city_param = self.city
-            params = {
-                "q": city_param,
-                "appid": OPEN_WEATHER_API_KEY
-            }
-            app.logger.info(f"{LOGGER_KEY}.setLatLong.url: {url}")
-            async with aiohttp.ClientSession() as client:
-                geo_location_response = await client.get(url, params=params)
-                status_code = geo_location_response.status
-                response_text = await geo_location_response.text()
-                response_text = json.loads(response_text)
-                app.logger.info(f"{LOGGER_KEY}.setLatLong.status_code: {status_code}")
-                if status_code != HTTPStatus.OK.value:
-                    # api failure handled
-                    app.logger.error(f"{LOGGER_KEY}.setLatLong.error: {response_text}")
-                    response["error"] = response_text["message"]
-                    response["status_code"] = HTTPStatus.FAILED_DEPENDENCY.value
-                else:
-                    if response_text:
-                        # set the object data
-                        self.latitude = response_text[0].get("lat")
-                        self.longitude = response_text[0].get("lon")
-                        self.state = response_text[0].get("state","").lower()
-                        country_code = response_text[0].get("country","")
-                        self.country = COUNTRY_CODES_TO_NAMES.get(country_code, "").lower()
-                    else:
-                        response["error"] = "city does not exists"
-                        response["status_code"] = HTTPStatus.BAD_REQUEST.value
+                # set the object data
+                self.latitude = geocode["latitude"]
+                self.longitude = geocode["longitude"]
+                self.state = geocode["state"] or ""
+                self.country = geocode["country"] or ""
+        except asyncio.TimeoutError:
+            app.logger.error(f"{LOGGER_KEY}.setLatLong.timeout")
+            response["error"] = "open weather geo API timed out"
+            response["status_code"] = HTTPStatus.GATEWAY_TIMEOUT.value
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.setLatLong.exception: {str(e)}")
             response["error"] = str(e)
@@ -150,17 +298,24 @@ class locationManager:
             columns = ",".join(columns)
 
             # query to insert the location
-            query = f"INSERT INTO {table_name} ({columns}) VALUES ('{self.location_id}', '{self.city}', {self.latitude}, {self.longitude}"
-            query += f",'{self.state}'" if self.state else f", null"
-            query += f",'{self.country}'" if self.country else f", null"
-            query += f",'{datetime.now()}'"
-            query += f",'{datetime.now()}');"
-
-            insert_response = await app.db.execute_insert_or_update_query(query)
+            query = f"INSERT INTO {table_name} ({columns}) VALUES ($1, $2, $3, $4, $5, $6, $7, $8);"
+            now = datetime.now()
+            insert_response = await app.db.execute(
+                query,
+                self.location_id,
+                self.city,
+                Decimal(str(self.latitude)),
+                Decimal(str(self.longitude)),
+                self.state or None,
+                self.country or None,
+                now,
+                now,
+            )
             app.logger.info(f"{LOGGER_KEY}.addLocation.insert_response: {insert_response}")
             response["data"] = self.location_id
             # delete the cache
             await app.redis.delete_without_pattern("all_locations")
+            await app.location_index.invalidate()
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.addLocation.exception: {str(e)}")
             response["error"] = str(e)
@@ -184,25 +339,26 @@ class locationManager:
                     return set_lat_long_response
 
             table_name = Tables.LOCATION.value.get("name")
-            columns = Tables.LOCATION.value["insert_columns"].copy()
-            columns.remove("created")
-            columns = ",".join(columns)
-
-            where_clause = f" WHERE location_id='{self.location_id}';"
 
             # query to put the new location
-            query = f"UPDATE {table_name} SET city='{self.city}', latitude={self.latitude}, longitude={self.longitude}"
-            query += f", state='{self.state}'" if self.state else f", null"
-            query += f", country='{self.country}'" if self.country else f", null"
-            query += f", updated='{datetime.now()}'"
-            query += where_clause
-
-            update_response = await app.db.execute_insert_or_update_query(query)
+            query = f"UPDATE {table_name} SET city=$2, latitude=$3, longitude=$4, state=$5, country=$6, updated=$7 WHERE location_id=$1;"
+            update_response = await app.db.execute(
+                query,
+                self.location_id,
+                self.city,
+                Decimal(str(self.latitude)),
+                Decimal(str(self.longitude)),
+                self.state or None,
+                self.country or None,
+                datetime.now(),
+            )
             app.logger.info(f"{LOGGER_KEY}.putLocation.update_response: {update_response}")
             response["data"] = self.location_id
             
-            # delete the cache
-            await app.redis.delete_without_pattern(self.location_id)
+            # delete the cache of the location, its forecast carries the city name
+            await app.redis.delete_without_pattern("all_locations")
+            await app.redis.invalidate_tags([f"location_{self.location_id}"])
+            await app.location_index.invalidate()
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.putLocation.exception: {str(e)}")
             response["error"] = str(e)
@@ -220,13 +376,15 @@ class locationManager:
 
         try:
             table_name = Tables.LOCATION.value.get("name")
-            query = f"DELETE FROM {table_name} WHERE location_id='{self.location_id}'"
-            delete_response = await app.db.execute_insert_or_update_query(query)
+            query = f"DELETE FROM {table_name} WHERE location_id=$1"
+            delete_response = await app.db.execute(query, self.location_id)
             app.logger.info(f"{LOGGER_KEY}.deleteLocation.response: {delete_response}")
             response["data"] = self.location_id
 
-            # delete the cache
-            await app.redis.delete_without_pattern(self.location_id)
+            # delete the cache of the location, its forecast and history
+            await app.redis.delete_without_pattern("all_locations")
+            await app.redis.invalidate_tags([f"location_{self.location_id}"])
+            await app.location_index.invalidate()
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.deleteLocation.exception: {str(e)}")
             response["error"] = str(e)
@@ -235,18 +393,12 @@ class locationManager:
         return response
         
 
-    def validate_latitude_and_longitude(self):
+    async def validate_latitude_and_longitude(self):
         """
         check if given latitude and longitude points to the given city or not
         """
         app.logger.info(f"{LOGGER_KEY}.validate_latitude_and_longitude")
 
-        # Initialize the geolocator
-        geolocator = Nominatim(user_agent="my_geocoder")
-
-        # Reverse geocode the coordinates to get the address
-        location = geolocator.reverse((self.latitude, self.longitude), language="en")
-
-        # Check if the city name is present in the address
-        return self.city.lower() in location.address.lower()
+        # Reverse geocode the coordinates and check the city is named there
+        return await app.reverse_geocoder.contains_city(self.latitude, self.longitude, self.city)
 
@@ -1,5 +1,5 @@
 from http import HTTPStatus
-from quart import Blueprint, current_app as app
+from quart import Blueprint, Response, current_app as app, stream_with_context
 from quart_schema import validate_request, validate_querystring
 
 from app.location_manager.service import locationManager
@@ -10,6 +10,8 @@ from app.validator import (
     AddLocation,
     PutLocation,
     GetHistory,
+    GetBatchForecast,
+    GetNearestLocations,
 )
 
 bp = Blueprint(SERVICE_NAME, __name__, url_prefix=BASE_ROUTE)
@@ -24,6 +26,52 @@ async def health_check():
     return {"message": "OK"}
 
 
+@bp.route("/public/stats", methods=["GET"])
+async def stats():
+    """
+    usage stats of the shared upstream connection pool, the in-process cache, the
+    redis circuit breaker, the in-process rate limiter, the weather write-behind queue and
+    the open weather quota
+    """
+    local_cache = app.redis.local_cache
+    rate_limiter = app.rate_limiter if app.rate_limiter is not app.redis else None
+    return {
+        "upstream_http_pool": app.http_client.pool_stats(),
+        "local_cache": local_cache.stats() if local_cache is not None else None,
+        "redis_circuit_breaker": app.redis.circuit_breaker.stats(),
+        "local_rate_limiter": rate_limiter.stats() if rate_limiter is not None else None,
+        "weather_write_behind": app.weather_writer.stats() if app.weather_writer is not None else None,
+        "open_weather_quota": app.open_weather_quota.stats() if app.open_weather_quota is not None else None,
+    }
+
+
+@bp.route("/locations/nearest", methods=["GET"])
+@rate_limit(API_REQUEST_LIMIT, API_REQUEST_PERIOD)
+@validate_querystring(GetNearestLocations)
+async def get_nearest_locations(**kwargs):
+    """
+    get the k locations closest to the coordinate, closest first
+    """
+    app.logger.info(f"{LOGGER_KEY}.get_nearest_locations")
+    query_args = kwargs.get("query_args")
+    nearest_response = await app.location_index.nearest(
+        float(query_args.lat), float(query_args.lon), int(query_args.k)
+    )
+    if nearest_response.get("error"):
+        return send_api_response(
+            f"Failed to fetch the nearest locations: {nearest_response['error']}",
+            False,
+            status_code=nearest_response.get("status_code")
+        )
+
+    return send_api_response(
+        f"nearest locations retrieved successfully",
+        True,
+        data=nearest_response["data"],
+        status_code=HTTPStatus.OK.value
+    )
+
+
 @bp.route("/locations", methods=["GET"])
 @bp.route("/locations/<location_id>", methods= ["GET"])
 @rate_limit(API_REQUEST_LIMIT, API_REQUEST_PERIOD)
@@ -209,12 +257,42 @@ async def get_forecast(**kwargs):
     )
 
 
+@bp.route("/weather", methods=["GET"])
+@rate_limit(API_REQUEST_LIMIT, API_REQUEST_PERIOD)
+@validate_querystring(GetBatchForecast)
+async def get_batch_forecast(**kwargs):
+    """
+    get forecast of multiple comma separated location_ids in one call, or the latest
+    reading of every location when location_ids is not given
+    """
+    app.logger.info(f"{LOGGER_KEY}.get_batch_forecast")
+    query_args = kwargs.get("query_args")
+    weather_manager = weatherManager(query_args.dict())
+
+    # fetches the current forecast of all the locations
+    forecast_data_response = await weather_manager.getBatchForecast()
+    if forecast_data_response.get("error"):
+        return send_api_response(
+            f"failed to fetch the forecasts: {forecast_data_response.get('error')}",
+            False,
+            status_code=forecast_data_response.get("status_code")
+        )
+
+    return send_api_response(
+        f"forecasts retrieved successfully",
+        True,
+        data= forecast_data_response.get("data"),
+        status_code=HTTPStatus.OK.value
+    )
+
+
 @bp.route("/history/<location_id>", methods=["GET"])
 @rate_limit(API_REQUEST_LIMIT, API_REQUEST_PERIOD)
 @validate_querystring(GetHistory)
 async def get_history(**kwargs):
     """
-    get the history of last 7 or 15 or 30 days
+    get the history of last 1 to 30 days, only its summary with summary_only=true and
+    streamed as NDJSON with stream=true
     """
     app.logger.info(f"{LOGGER_KEY}.get_history")
     query_args = kwargs.get("query_args")
@@ -222,6 +300,18 @@ async def get_history(**kwargs):
     query_args['location_id'] = kwargs.get("location_id")
 
     weather_manager = weatherManager(query_args)
+    if weather_manager.stream and not weather_manager.summary_only:
+        # the summary comes first so that its errors get a proper response
+        history_summary_response = await weather_manager.getHistorySummary()
+        if history_summary_response.get("error"):
+            return send_api_response(
+                f"Failed to fetch the history: {history_summary_response['error']}",
+                False,
+                status_code=history_summary_response.get("status_code")
+            )
+        history_stream = stream_with_context(weather_manager.streamHistory)(history_summary_response["data"])
+        return Response(history_stream, mimetype="application/x-ndjson")
+
     history_data_response = await weather_manager.getHistory()
     if history_data_response.get("error"):
         return send_api_response(
@@ -1,4 +1,5 @@
 import json
+import asyncio
 import traceback
 from pydantic.error_wrappers import ValidationError
 from quart import Quart, g, request
@@ -6,12 +7,23 @@ from quart_schema import QuartSchema, RequestSchemaValidationError
 
 from . import settings
 from data.database import Postgres
-from data.redis import RedisCache
+from data.redis import RedisCache, LocalCache, Codec
+from data.http_client import HttpClient
+from data.rate_limiter import LocalRateLimiter
+from data.write_behind import WriteBehindQueue
+from data.quota import OutboundQuota
+from data.geocoder import NominatimReverseGeocoder, OfflineReverseGeocoder
 from app.routes import bp
+from app.constants import Lanes, MAX_HISTORY_DAYS
+from app.weather_manager.scheduler import forecastScheduler
+from app.weather_manager.maintenance import weatherMaintenance
+from app.weather_manager.service import insert_weather_records
+from app.location_manager.nearest import nearestLocationIndex
 from app.utils import (
     get_logger,
     VerifyEnv,
     get_request_id,
+    run_in_background,
     send_api_response,
     MissingEnvConfigsException,
 )
@@ -42,20 +54,46 @@ async def _init():
         error = f"unable to verify these config {str(verify_envs[1])}"
         raise MissingEnvConfigsException(message=error)
 
+    # the readings of the history window are never dropped
+    if app.config.get("WEATHER_MAINTENANCE_ENABLED") and app.config.get("WEATHER_RAW_RETENTION_DAYS") < MAX_HISTORY_DAYS:
+        raise ValueError(f"WEATHER_RAW_RETENTION_DAYS must be at least {MAX_HISTORY_DAYS} days of history")
+
     await _init_redis()
     app.logger.info("redis initialized")
 
+    _init_rate_limiter()
+
     await _init_db()
     app.logger.info("all dbs initialized")
 
     await _setup_db()
     app.logger.info("DB setup completed")
 
+    _init_weather_writer()
+
+    await _init_reverse_geocoder()
+
+    await _init_http_client()
+    app.logger.info("upstream http client initialized")
+
+    _init_open_weather_quota()
+
+    app.location_index = nearestLocationIndex()
+
     _register_blueprints()
 
+    _init_forecast_scheduler()
+
+    _init_weather_maintenance()
+
 
 @app.after_serving
 async def _terminate():
+    await _stop_forecast_scheduler()
+    _stop_weather_maintenance()
+    app.location_index.close()
+    await _stop_weather_writer()
+    await app.http_client.close()
     await app.db.close()
     await app.redis.close()
 
@@ -98,14 +136,178 @@ async def _setup_db():
     return
 
 
+# starting the write-behind queue of weather readings
+def _init_weather_writer():
+    app.weather_writer = None
+    if not app.config.get("WEATHER_WRITE_BEHIND_ENABLED"):
+        return
+    app.weather_writer = WriteBehindQueue(
+        insert_weather_records,
+        max_size=app.config.get("WEATHER_WRITE_BEHIND_QUEUE_SIZE"),
+        batch_size=app.config.get("WEATHER_WRITE_BEHIND_BATCH_SIZE"),
+        flush_interval=app.config.get("WEATHER_WRITE_BEHIND_FLUSH_INTERVAL"),
+    )
+    app.weather_writer_task = run_in_background(app.weather_writer.run)
+    app.logger.info("weather write-behind queue started")
+    return
+
+
+async def _stop_weather_writer():
+    # the queued readings are written before the DB pool closes
+    if not app.weather_writer:
+        return
+    await app.weather_writer.close()
+    await app.weather_writer_task
+    app.logger.info(f"weather write-behind queue drained: {app.weather_writer.stats()}")
+    return
+
+
 # initializing redis
 async def _init_redis():
-    app.redis = RedisCache(app.config.get("APP_NAME") + "_" + app.config.get("ENV"))
+    local_cache = None
+    local_cache_conf = app.config.get("LOCAL_CACHE")
+    if local_cache_conf["ENABLED"]:
+        local_cache = LocalCache(
+            max_entries=local_cache_conf["MAX_ENTRIES"],
+            max_bytes=local_cache_conf["MAX_BYTES"],
+            expire_time=local_cache_conf["EXPIRE_TIME"],
+        )
+    codec_conf = app.config.get("CACHE_CODEC")
+    codec = Codec(
+        serializer=codec_conf["SERIALIZER"],
+        compression=codec_conf["COMPRESSION"],
+        compress_threshold=codec_conf["COMPRESS_THRESHOLD"],
+        compression_level=codec_conf["COMPRESSION_LEVEL"],
+    )
     redis_conf = app.config.get("REDIS")
+    redis_kwargs = {
+        "min_pool_size": redis_conf["MIN_POOL_SIZE"],
+        "max_pool_size": redis_conf["MAX_POOL_SIZE"],
+        "connect_timeout": redis_conf["CONNECT_TIMEOUT"],
+        "command_timeout": redis_conf["COMMAND_TIMEOUT"],
+        "failure_threshold": redis_conf["BREAKER_FAILURE_THRESHOLD"],
+        "backoff_base": redis_conf["BACKOFF_BASE"],
+        "backoff_max": redis_conf["BACKOFF_MAX"],
+    }
+    app.redis = RedisCache(
+        app.config.get("APP_NAME") + "_" + app.config.get("ENV"), local_cache=local_cache, codec=codec, **redis_kwargs
+    )
     await app.redis.connect(host=redis_conf["HOST"], port=redis_conf["PORT"])
     return
 
 
+# initializing rate limiter
+def _init_rate_limiter():
+    app.rate_limiter = app.redis
+    if app.config.get("RATE_LIMIT_MODE") == "local":
+        app.rate_limiter = LocalRateLimiter(max_keys=app.config.get("RATE_LIMIT_MAX_KEYS"))
+    app.logger.info(f"rate limiter initialized: {app.config.get('RATE_LIMIT_MODE')}")
+    return
+
+
+# initializing upstream http client
+async def _init_http_client():
+    http_conf = app.config.get("UPSTREAM_HTTP")
+    http_kwargs = {
+        "limit": http_conf["LIMIT"],
+        "limit_per_host": http_conf["LIMIT_PER_HOST"],
+        "dns_cache_ttl": http_conf["DNS_CACHE_TTL"],
+        "keepalive_timeout": http_conf["KEEPALIVE_TIMEOUT"],
+        "connect_timeout": http_conf["CONNECT_TIMEOUT"],
+        "read_timeout": http_conf["READ_TIMEOUT"],
+    }
+    app.http_client = HttpClient(**http_kwargs)
+    await app.http_client.connect()
+    return
+
+
+# initializing the budget of open weather calls
+def _init_open_weather_quota():
+    app.open_weather_quota = None
+    if not app.config.get("OPEN_WEATHER_QUOTA_ENABLED"):
+        return
+    app.open_weather_quota = OutboundQuota(
+        app.redis,
+        "open_weather_quota",
+        limit=app.config.get("OPEN_WEATHER_QUOTA_LIMIT"),
+        period=app.config.get("OPEN_WEATHER_QUOTA_PERIOD"),
+        reserves={
+            Lanes.FORECAST: 0,
+            Lanes.GEOCODING: app.config.get("OPEN_WEATHER_QUOTA_GEOCODING_RESERVE"),
+            Lanes.BACKGROUND: app.config.get("OPEN_WEATHER_QUOTA_BACKGROUND_RESERVE"),
+        },
+        waits={
+            Lanes.FORECAST: app.config.get("OPEN_WEATHER_QUOTA_FORECAST_WAIT"),
+            Lanes.GEOCODING: app.config.get("OPEN_WEATHER_QUOTA_GEOCODING_WAIT"),
+            Lanes.BACKGROUND: app.config.get("OPEN_WEATHER_QUOTA_BACKGROUND_WAIT"),
+        },
+    )
+    app.logger.info("open weather quota initialized")
+    return
+
+
+# initializing reverse geocoder
+async def _init_reverse_geocoder():
+    mode = app.config.get("REVERSE_GEOCODER_MODE")
+    if mode == "offline":
+        dataset_path = app.config.get("REVERSE_GEOCODER_DATASET")
+        try:
+            loop = asyncio.get_event_loop()
+            app.reverse_geocoder = await loop.run_in_executor(
+                None, OfflineReverseGeocoder.load, dataset_path, app.config.get("REVERSE_GEOCODER_NEIGHBOURS")
+            )
+            app.logger.info("reverse geocoder initialized: offline")
+            return
+        except (OSError, ValueError) as e:
+            # offline mode is chosen to avoid the network, it never falls back to nominatim
+            app.logger.error(f"offline reverse geocoder dataset not loaded: {str(e)}")
+            raise
+
+    app.reverse_geocoder = NominatimReverseGeocoder(
+        timeout=app.config.get("REVERSE_GEOCODER_TIMEOUT"),
+        precision=app.config.get("REVERSE_GEOCODER_PRECISION"),
+        max_entries=app.config.get("REVERSE_GEOCODER_CACHE_SIZE"),
+    )
+    app.logger.info("reverse geocoder initialized: nominatim")
+    return
+
+
+# starting the refresh ahead of forecasts
+def _init_forecast_scheduler():
+    app.forecast_scheduler = None
+    if not app.config.get("REFRESH_AHEAD_ENABLED"):
+        return
+    app.forecast_scheduler = forecastScheduler()
+    app.forecast_scheduler_task = run_in_background(app.forecast_scheduler.run)
+    app.logger.info("forecast scheduler started")
+    return
+
+
+async def _stop_forecast_scheduler():
+    if not app.forecast_scheduler:
+        return
+    app.forecast_scheduler_task.cancel()
+    await app.forecast_scheduler.stop()
+    return
+
+
+# starting the partition maintenance and retention of weather
+def _init_weather_maintenance():
+    app.weather_maintenance_task = None
+    if not app.config.get("WEATHER_MAINTENANCE_ENABLED"):
+        return
+    app.weather_maintenance_task = run_in_background(weatherMaintenance().run)
+    app.logger.info("weather maintenance started")
+    return
+
+
+def _stop_weather_maintenance():
+    if not app.weather_maintenance_task:
+        return
+    app.weather_maintenance_task.cancel()
+    return
+
+
 # registering blueprints
 def _register_blueprints():
     app.register_blueprint(bp)
@@ -13,7 +13,33 @@ BASE_ROUTE = getenv("BASE_ROUTE")
 SERVICE_NAME = getenv("SERVICE_NAME")
 
 HEADERS = {"Content-Type": "application/json"}
-REDIS = {"HOST": getenv("REDIS_HOST"), "PORT": getenv("REDIS_PORT")}
+REDIS = {
+    "HOST": getenv("REDIS_HOST"),
+    "PORT": getenv("REDIS_PORT"),
+    "MIN_POOL_SIZE": int(getenv("REDIS_MIN_POOL_SIZE", "1")),
+    "MAX_POOL_SIZE": int(getenv("REDIS_MAX_POOL_SIZE", "10")),
+    "CONNECT_TIMEOUT": float(getenv("REDIS_CONNECT_TIMEOUT", "1")),  # in seconds
+    "COMMAND_TIMEOUT": float(getenv("REDIS_COMMAND_TIMEOUT", "0.5")),  # in seconds
+    "BREAKER_FAILURE_THRESHOLD": int(getenv("REDIS_BREAKER_FAILURE_THRESHOLD", "5")),
+    "BACKOFF_BASE": float(getenv("REDIS_BACKOFF_BASE", "0.5")),  # in seconds
+    "BACKOFF_MAX": float(getenv("REDIS_BACKOFF_MAX", "30")),  # in seconds
+}
+
+# IN-PROCESS CACHE CONFIGS, first tier in front of redis
+LOCAL_CACHE = {
+    "ENABLED": getenv("LOCAL_CACHE_ENABLED", "false").lower() == "true",
+    "MAX_ENTRIES": int(getenv("LOCAL_CACHE_MAX_ENTRIES", "10000")),
+    "MAX_BYTES": int(getenv("LOCAL_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    "EXPIRE_TIME": int(getenv("LOCAL_CACHE_EXPIRE_TIME", "5")),  # in seconds
+}
+
+# CACHE CODEC CONFIGS, serializer is json, orjson or msgpack and compression is none, zlib or lz4
+CACHE_CODEC = {
+    "SERIALIZER": getenv("CACHE_SERIALIZER", "orjson"),
+    "COMPRESSION": getenv("CACHE_COMPRESSION", "zlib"),
+    "COMPRESS_THRESHOLD": int(getenv("CACHE_COMPRESS_THRESHOLD", "1024")),  # in bytes
+    "COMPRESSION_LEVEL": int(getenv("CACHE_COMPRESSION_LEVEL", "1")),
+}
 
 # DB CONFIGS
 DB_CONFIGS = {
@@ -28,6 +54,16 @@ DB_CONFIGS = {
 WEATHER_SERVICE_BASE_URL = getenv("WEATHER_SERVICE_BASE_URL")
 OPEN_WEATHER_API_BASE_URL = getenv("OPEN_WEATHER_API_BASE_URL")
 
+# UPSTREAM HTTP CLIENT CONFIGS
+UPSTREAM_HTTP = {
+    "LIMIT": int(getenv("UPSTREAM_HTTP_LIMIT", "100")),
+    "LIMIT_PER_HOST": int(getenv("UPSTREAM_HTTP_LIMIT_PER_HOST", "20")),
+    "DNS_CACHE_TTL": int(getenv("UPSTREAM_HTTP_DNS_CACHE_TTL", "300")),  # in seconds
+    "KEEPALIVE_TIMEOUT": float(getenv("UPSTREAM_HTTP_KEEPALIVE_TIMEOUT", "30")),  # in seconds
+    "CONNECT_TIMEOUT": float(getenv("UPSTREAM_HTTP_CONNECT_TIMEOUT", "3")),  # in seconds
+    "READ_TIMEOUT": float(getenv("UPSTREAM_HTTP_READ_TIMEOUT", "10")),  # in seconds
+}
+
 # CONST PARAMS
 OPEN_WEATHER_GEO_PARAMS = getenv("OPEN_WEATHER_GEO_PARAMS")
 OPEN_WEATHER_API_PARAMS = getenv("OPEN_WEATHER_API_PARAMS")
@@ -37,4 +73,74 @@ OPEN_WEATHER_API_KEY = getenv("OPEN_WEATHER_API_KEY")
 
 # RATE LIMIT CONFIGS
 API_REQUEST_LIMIT = int(getenv("API_REQUEST_LIMIT", "5"))
-API_REQUEST_PERIOD = int(getenv("API_REQUEST_PERIOD", "60"))
\ No newline at end of file
+API_REQUEST_PERIOD = int(getenv("API_REQUEST_PERIOD", "60"))
+# redis shares the limits between all the workers, local keeps them in each worker
+RATE_LIMIT_MODE = getenv("RATE_LIMIT_MODE", "redis").lower()
+RATE_LIMIT_MAX_KEYS = int(getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# BATCH FORECAST CONFIGS
+BATCH_FORECAST_MAX_LOCATIONS = int(getenv("BATCH_FORECAST_MAX_LOCATIONS", "50"))
+BATCH_FORECAST_UPSTREAM_CONCURRENCY = int(getenv("BATCH_FORECAST_UPSTREAM_CONCURRENCY", "5"))
+
+# REFRESH AHEAD CONFIGS
+REFRESH_AHEAD_ENABLED = getenv("REFRESH_AHEAD_ENABLED", "false").lower() == "true"
+REFRESH_AHEAD_INTERVAL = int(getenv("REFRESH_AHEAD_INTERVAL", "3000"))  # in seconds, below the 3600s forecast TTL
+REFRESH_AHEAD_CONCURRENCY = int(getenv("REFRESH_AHEAD_CONCURRENCY", "5"))
+REFRESH_AHEAD_LEADER_TTL = int(getenv("REFRESH_AHEAD_LEADER_TTL", "30"))  # in seconds
+
+# CACHE STALE-WHILE-REVALIDATE CONFIGS, served stale between the soft and the hard TTL
+FORECAST_SOFT_TTL = int(getenv("FORECAST_SOFT_TTL", "3600"))  # in seconds
+FORECAST_HARD_TTL = int(getenv("FORECAST_HARD_TTL", "7200"))  # in seconds
+HISTORY_SOFT_TTL = int(getenv("HISTORY_SOFT_TTL", "21600"))  # in seconds
+HISTORY_HARD_TTL = int(getenv("HISTORY_HARD_TTL", "43200"))  # in seconds
+
+# HISTORY STREAM CONFIGS, readings fetched from the cursor and sent per chunk
+HISTORY_STREAM_CHUNK_SIZE = int(getenv("HISTORY_STREAM_CHUNK_SIZE", "500"))
+
+# FORECAST REFRESH CONFIGS
+FORECAST_LOCK_TIMEOUT = int(getenv("FORECAST_LOCK_TIMEOUT", "10"))  # in seconds
+FORECAST_LOCK_WAIT = float(getenv("FORECAST_LOCK_WAIT", "5"))  # in seconds
+
+# WEATHER RETENTION CONFIGS, weather is partitioned by month of created
+WEATHER_MAINTENANCE_ENABLED = getenv("WEATHER_MAINTENANCE_ENABLED", "false").lower() == "true"
+WEATHER_MAINTENANCE_INTERVAL = int(getenv("WEATHER_MAINTENANCE_INTERVAL", "86400"))  # in seconds
+WEATHER_PARTITIONS_AHEAD = int(getenv("WEATHER_PARTITIONS_AHEAD", "3"))  # in months
+WEATHER_RAW_RETENTION_DAYS = int(getenv("WEATHER_RAW_RETENTION_DAYS", "90"))  # in days, at least MAX_HISTORY_DAYS
+
+# WEATHER WRITE-BEHIND CONFIGS, readings are queued and written in batches when enabled
+WEATHER_WRITE_BEHIND_ENABLED = getenv("WEATHER_WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WEATHER_WRITE_BEHIND_QUEUE_SIZE = int(getenv("WEATHER_WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WEATHER_WRITE_BEHIND_BATCH_SIZE = int(getenv("WEATHER_WRITE_BEHIND_BATCH_SIZE", "500"))
+WEATHER_WRITE_BEHIND_FLUSH_INTERVAL = float(getenv("WEATHER_WRITE_BEHIND_FLUSH_INTERVAL", "1"))  # in seconds
+
+# REVERSE GEOCODER CONFIGS, mode is nominatim or offline
+REVERSE_GEOCODER_MODE = getenv("REVERSE_GEOCODER_MODE", "nominatim").lower()
+REVERSE_GEOCODER_DATASET = getenv("REVERSE_GEOCODER_DATASET", "./data/cities15000.txt")
+REVERSE_GEOCODER_NEIGHBOURS = int(getenv("REVERSE_GEOCODER_NEIGHBOURS", "5"))
+REVERSE_GEOCODER_PRECISION = int(getenv("REVERSE_GEOCODER_PRECISION", "3"))  # in decimals of a degree
+REVERSE_GEOCODER_CACHE_SIZE = int(getenv("REVERSE_GEOCODER_CACHE_SIZE", "10000"))
+REVERSE_GEOCODER_TIMEOUT = float(getenv("REVERSE_GEOCODER_TIMEOUT", "5"))  # in seconds
+
+# FORWARD GEOCODE CACHE CONFIGS, cities that do not exist are cached for the negative TTL
+GEOCODE_CACHE_TTL = int(getenv("GEOCODE_CACHE_TTL", "2592000"))  # in seconds
+GEOCODE_NEGATIVE_TTL = int(getenv("GEOCODE_NEGATIVE_TTL", "600"))  # in seconds
+
+# NEAREST LOCATIONS CONFIGS
+NEAREST_LOCATIONS_MAX_K = int(getenv("NEAREST_LOCATIONS_MAX_K", "50"))
+NEAREST_LOCATIONS_VERSION_CHECK_INTERVAL = float(getenv("NEAREST_LOCATIONS_VERSION_CHECK_INTERVAL", "1"))  # in seconds
+NEAREST_LOCATIONS_REBUILD_INTERVAL = float(getenv("NEAREST_LOCATIONS_REBUILD_INTERVAL", "5"))  # in seconds
+
+# WEATHER GRID CONFIGS, when enabled the locations in the same geohash cell share one forecast
+WEATHER_GRID_ENABLED = getenv("WEATHER_GRID_ENABLED", "false").lower() == "true"
+WEATHER_GRID_PRECISION = int(getenv("WEATHER_GRID_PRECISION", "6"))  # in geohash characters, 6 is about 1.2 x 0.6 km
+
+# OPEN WEATHER QUOTA CONFIGS, a budget of calls shared by all the workers when enabled. the
+# reserves are the calls geocoding and background refreshes leave for the lanes above them
+OPEN_WEATHER_QUOTA_ENABLED = getenv("OPEN_WEATHER_QUOTA_ENABLED", "false").lower() == "true"
+OPEN_WEATHER_QUOTA_LIMIT = int(getenv("OPEN_WEATHER_QUOTA_LIMIT", "60"))  # calls per period
+OPEN_WEATHER_QUOTA_PERIOD = float(getenv("OPEN_WEATHER_QUOTA_PERIOD", "60"))  # in seconds
+OPEN_WEATHER_QUOTA_GEOCODING_RESERVE = int(getenv("OPEN_WEATHER_QUOTA_GEOCODING_RESERVE", "5"))
+OPEN_WEATHER_QUOTA_BACKGROUND_RESERVE = int(getenv("OPEN_WEATHER_QUOTA_BACKGROUND_RESERVE", "20"))
+OPEN_WEATHER_QUOTA_FORECAST_WAIT = float(getenv("OPEN_WEATHER_QUOTA_FORECAST_WAIT", "2"))  # in seconds
+OPEN_WEATHER_QUOTA_GEOCODING_WAIT = float(getenv("OPEN_WEATHER_QUOTA_GEOCODING_WAIT", "5"))  # in seconds
+OPEN_WEATHER_QUOTA_BACKGROUND_WAIT = float(getenv("OPEN_WEATHER_QUOTA_BACKGROUND_WAIT", "5"))  # in seconds
@@ -1,47 +1,69 @@
+import math
 import logging
 import asyncio
 from http import HTTPStatus
 from uuid import uuid4
 from functools import wraps
 from typing import Optional, Any
-from quart import current_app as app, g, request
+from quart import current_app as app, g, request, make_response
 
 from .settings import LOG_LEVEL, SERVICE_NAME
 
 
-# Dictionary to track request timestamps for rate limiting
-request_timestamps = {}
-def rate_limit(limit, interval):
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            ip_address = request.remote_addr
-            endpoint = request.path
-
-            if ip_address not in request_timestamps:
-                request_timestamps[ip_address] = {}
+# references of the running background tasks, so they are not garbage collected
+background_tasks = set()
+def run_in_background(coroutine_function, *args, **kwargs):
+    """
+    runs the coroutine function in a task within the app context, outside of the request
+    """
+    app_object = app._get_current_object()
 
-            if endpoint not in request_timestamps[ip_address]:
-                request_timestamps[ip_address][endpoint] = []
+    async def runner():
+        async with app_object.app_context():
+            try:
+                await coroutine_function(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                app_object.logger.error(f"run_in_background.{coroutine_function.__name__}.exception: {str(e)}")
 
-            current_time = asyncio.get_event_loop().time()
+    task = asyncio.ensure_future(runner())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
-            # Remove timestamps older than the interval
-            request_timestamps[ip_address][endpoint] = [
-                timestamp for timestamp in request_timestamps[ip_address][endpoint] if
-                current_time - timestamp < interval
-            ]
 
-            if len(request_timestamps[ip_address][endpoint]) >= limit:
-                return send_api_response(
+def rate_limit(limit, interval):
+    """
+    allows limit requests every interval seconds per client IP and route, shared by all
+    the workers through redis, or per worker with RATE_LIMIT_MODE local. routes are keyed
+    by their template, so /weather/<location_id> is a single limit whatever the location_id.
+    requests are let through while redis is unreachable
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            route = request.url_rule.rule if request.url_rule else request.path
+            key = f"rate_limit_{request.remote_addr}_{request.method}_{route}"
+            throttle = await app.rate_limiter.throttle(key, limit, interval)
+            if throttle is None:
+                return await func(*args, **kwargs)
+
+            allowed, remaining, retry_after, reset = throttle
+            if allowed:
+                response = await make_response(await func(*args, **kwargs))
+            else:
+                response = await make_response(send_api_response(
                     "Rate limit exceeded. Try again later.",
                     False,
                     status_code=HTTPStatus.TOO_MANY_REQUESTS.value
-                )
+                ))
+                response.headers["Retry-After"] = str(math.ceil(retry_after))
 
-            # Record the current timestamp
-            request_timestamps[ip_address][endpoint].append(current_time)
-            return await func(*args, **kwargs)
+            response.headers["RateLimit-Limit"] = str(limit)
+            response.headers["RateLimit-Remaining"] = str(remaining)
+            response.headers["RateLimit-Reset"] = str(math.ceil(reset))
+            return response
         return wrapper
     return decorator
 
@@ -1,3 +1,4 @@
+from uuid import UUID
 from typing import Optional, List
 from pydantic import (
     BaseModel,
@@ -5,7 +6,8 @@ from pydantic import (
     root_validator,
 )
 
-from app.constants import COUNTRY_CODES, STATE_NAME_TO_CODES
+from app.constants import COUNTRY_CODES, STATE_NAME_TO_CODES, MAX_HISTORY_DAYS
+from app.settings import BATCH_FORECAST_MAX_LOCATIONS, NEAREST_LOCATIONS_MAX_K
 
 class AddLocation(BaseModel):
     city: str = Field(...)
@@ -59,10 +61,67 @@ class PutLocation(BaseModel):
 
 class GetHistory(BaseModel):
     days: Optional[str] = None
+    summary_only: Optional[str] = None
+    stream: Optional[str] = None
 
     @root_validator(pre=True)
     def validator(cls, values):
         days = values.get("days")
-        if days not in ['7','15','30']:
-            raise ValueError("history of last 7, 15 and 30 days can be accessed")
+        if not (days and days.isdigit() and 1 <= int(days) <= MAX_HISTORY_DAYS):
+            raise ValueError(f"history of last 1 to {MAX_HISTORY_DAYS} days can be accessed")
+        summary_only = values.get("summary_only")
+        if summary_only not in [None, 'true', 'false']:
+            raise ValueError("summary_only can be true or false")
+        stream = values.get("stream")
+        if stream not in [None, 'true', 'false']:
+            raise ValueError("stream can be true or false")
+        return values
+
+
+class GetBatchForecast(BaseModel):
+    location_ids: Optional[List[str]] = None
+
+    @root_validator(pre=True)
+    def validator(cls, values):
+        location_ids = values.get("location_ids")
+        if location_ids is None:
+            # current weather of all the locations
+            return values
+        if not location_ids or not isinstance(location_ids, str):
+            raise ValueError("comma separated location_ids are required")
+
+        # normalised to the lowercase hyphenated form the locations are keyed by
+        normalised_location_ids = []
+        for location_id in filter(None, map(str.strip, location_ids.split(","))):
+            try:
+                normalised_location_ids.append(str(UUID(location_id)))
+            except ValueError:
+                raise ValueError(f"wrong location_id {location_id}")
+
+        # remove the duplicates keeping the order
+        location_ids = list(dict.fromkeys(normalised_location_ids))
+        if len(location_ids) > BATCH_FORECAST_MAX_LOCATIONS:
+            raise ValueError(f"forecast of at most {BATCH_FORECAST_MAX_LOCATIONS} locations can be fetched at once")
+
+        values["location_ids"] = location_ids
+        return values
+
+
+class GetNearestLocations(BaseModel):
+    lat: Optional[str] = None
+    lon: Optional[str] = None
+    k: Optional[str] = None
+
+    @root_validator(pre=True)
+    def validator(cls, values):
+        try:
+            latitude, longitude = float(values.get("lat")), float(values.get("lon"))
+        except (TypeError, ValueError):
+            raise ValueError("lat and lon are required")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("lat must be between -90 and 90 and lon between -180 and 180")
+        k = values.get("k") or "5"
+        if not (k.isdigit() and 1 <= int(k) <= NEAREST_LOCATIONS_MAX_K):
+            raise ValueError(f"k can be 1 to {NEAREST_LOCATIONS_MAX_K}")
+        values["k"] = k
         return values
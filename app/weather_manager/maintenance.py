@@ -0,0 +1,126 @@
+import re
+import asyncio
+from datetime import date, timedelta
+from quart import current_app as app
+
+from ..constants import Tables, SUMMARY_METRICS
+from app.settings import (
+    WEATHER_MAINTENANCE_INTERVAL,
+    WEATHER_PARTITIONS_AHEAD,
+    WEATHER_RAW_RETENTION_DAYS,
+)
+
+LOGGER_KEY = "app.weather_manager.maintenance"
+MAINTENANCE_LOCK_KEY = "weather_maintenance"
+PARTITION_NAME = re.compile(r"^weather_(\d{4})_(\d{2})$")
+# the longest the detach waits for the queries on weather, it blocks the queries queued behind it
+DETACH_LOCK_TIMEOUT = "5s"
+
+
+def _downsample_query(partition_name):
+    """
+    builds the insert of the hourly rollups of the readings in the partition, the rollups
+    already downsampled by an earlier run that failed before the drop are kept
+    """
+    table_name = Tables.WEATHER_HOURLY.value["name"]
+    columns = ",".join(Tables.WEATHER_HOURLY.value["insert_columns"])
+    aggregates = ["location_id", "date_trunc('hour', created)", "COUNT(*)", "MIN(created)", "MAX(created)"]
+    for metric in SUMMARY_METRICS:
+        aggregates += [
+            f"COUNT({metric})",
+            f"COALESCE(SUM({metric}), 0)",
+            f"COALESCE(SUM({metric}::FLOAT * {metric}), 0)",
+            f"MIN({metric})",
+            f"MAX({metric})",
+            f"(ARRAY_AGG({metric} ORDER BY created))[1]",
+            f"(ARRAY_AGG({metric} ORDER BY created DESC))[1]",
+        ]
+
+    query = f"INSERT INTO {table_name} ({columns}) SELECT {','.join(aggregates)} FROM {partition_name}"
+    query += " WHERE location_id IS NOT NULL GROUP BY location_id, date_trunc('hour', created)"
+    query += " ON CONFLICT (location_id, hour) DO NOTHING;"
+    return query
+
+
+class weatherMaintenance:
+    """
+    keeps the monthly partitions of weather ahead of time and drops the partitions older than
+    WEATHER_RAW_RETENTION_DAYS, once downsampled to hourly rollups. runs once every
+    WEATHER_MAINTENANCE_INTERVAL in whichever worker takes the lock in redis first
+    """
+
+    async def createPartitions(self):
+        """
+        creates the partitions of this month and the next WEATHER_PARTITIONS_AHEAD months
+        """
+        app.logger.info(f"{LOGGER_KEY}.createPartitions")
+        query = "SELECT create_weather_partition((date_trunc('month', LOCALTIMESTAMP) + INTERVAL '1 month' * n)::DATE)"
+        query += " FROM generate_series(0, $1::INTEGER) AS n;"
+        await app.db.fetch(query, WEATHER_PARTITIONS_AHEAD)
+
+    async def getExpiredPartitions(self):
+        """
+        partitions whose every reading is older than WEATHER_RAW_RETENTION_DAYS, with whether
+        they are still attached to weather. a detached one is left by a run that failed before
+        the drop
+        """
+        table_name = Tables.WEATHER.value["name"]
+        query = "SELECT c.relname, i.inhparent IS NOT NULL AS attached FROM pg_class c"
+        query += " LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = $1::TEXT::regclass"
+        query += " WHERE c.relkind = 'r' AND pg_table_is_visible(c.oid) AND c.relname LIKE $1 || '\\_%';"
+        partitions = await app.db.fetch(query, table_name)
+
+        cutoff = date.today() - timedelta(days=WEATHER_RAW_RETENTION_DAYS)
+        expired_partitions = []
+        for partition in partitions:
+            match = PARTITION_NAME.match(partition["relname"])
+            if not match:
+                continue
+            year, month = int(match.group(1)), int(match.group(2))
+            month_end = date(year + month // 12, month % 12 + 1, 1)
+            if month_end <= cutoff:
+                expired_partitions.append(partition)
+        return sorted(expired_partitions, key=lambda partition: partition["relname"])
+
+    async def dropExpiredPartitions(self):
+        """
+        downsamples every expired partition to hourly rollups, then detaches and drops it. only
+        the detach locks weather, in a transaction of its own, the downsampling reads the
+        partition alone
+        """
+        app.logger.info(f"{LOGGER_KEY}.dropExpiredPartitions")
+        table_name = Tables.WEATHER.value["name"]
+        for partition in await self.getExpiredPartitions():
+            partition_name = partition["relname"]
+            downsampled = await app.db.execute(_downsample_query(partition_name))
+            if partition["attached"]:
+                async with app.db.transaction() as connection:
+                    await connection.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}';")
+                    await connection.execute(f"ALTER TABLE {table_name} DETACH PARTITION {partition_name};")
+            async with app.db.transaction() as connection:
+                await connection.execute(f"DROP TABLE {partition_name};")
+            app.logger.info(f"{LOGGER_KEY}.dropExpiredPartitions.dropped: {partition_name} {downsampled}")
+
+    async def runCycle(self):
+        app.logger.info(f"{LOGGER_KEY}.runCycle")
+        await self.createPartitions()
+        await self.dropExpiredPartitions()
+        app.logger.info(f"{LOGGER_KEY}.runCycle.completed")
+
+    async def run(self):
+        """
+        runs a maintenance cycle every WEATHER_MAINTENANCE_INTERVAL, the lock is left to expire
+        so that the other workers skip the cycles in between
+        """
+        app.logger.info(f"{LOGGER_KEY}.run")
+        while True:
+            try:
+                # no maintenance while redis is unreachable, the setup creates the partitions of
+                # this and the next month on every start
+                if await app.redis.acquire_lock(MAINTENANCE_LOCK_KEY, WEATHER_MAINTENANCE_INTERVAL, fail_open=False):
+                    await self.runCycle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                app.logger.error(f"{LOGGER_KEY}.run.exception: {str(e)}")
+            await asyncio.sleep(WEATHER_MAINTENANCE_INTERVAL)
@@ -0,0 +1,143 @@
+import asyncio
+from http import HTTPStatus
+from quart import current_app as app
+
+from app.constants import Lanes
+from app.location_manager.service import locationManager
+from app.weather_manager.service import weatherManager, forecast_key
+from app.settings import (
+    REFRESH_AHEAD_INTERVAL,
+    REFRESH_AHEAD_CONCURRENCY,
+    REFRESH_AHEAD_LEADER_TTL,
+)
+
+LOGGER_KEY = "app.weather_manager.scheduler"
+LEADER_KEY = "refresh_ahead_leader"
+
+
+class forecastScheduler:
+    """
+    refreshes the cached forecast of every location before it expires, spreading the
+    refreshes evenly over REFRESH_AHEAD_INTERVAL. only the worker holding the leader
+    lock in redis refreshes
+    """
+    def __init__(self) -> None:
+        self.leader_token = None
+        self.last_renewal = 0
+        self.semaphore = asyncio.Semaphore(REFRESH_AHEAD_CONCURRENCY)
+
+    async def isLeader(self):
+        """
+        acquires the leadership or renews it once a third of its TTL has passed
+        """
+        now = asyncio.get_event_loop().time()
+        if self.leader_token and now - self.last_renewal < REFRESH_AHEAD_LEADER_TTL / 3:
+            return True
+
+        if self.leader_token:
+            renewed = await app.redis.extend_lock(LEADER_KEY, self.leader_token, REFRESH_AHEAD_LEADER_TTL)
+            if not renewed:
+                app.logger.warning(f"{LOGGER_KEY}.isLeader.leadership_lost")
+                self.leader_token = None
+
+        if not self.leader_token:
+            # no leader while redis is unreachable, the forecasts still refresh on demand
+            self.leader_token = await app.redis.acquire_lock(LEADER_KEY, REFRESH_AHEAD_LEADER_TTL, fail_open=False)
+            if self.leader_token:
+                app.logger.info(f"{LOGGER_KEY}.isLeader.leadership_acquired")
+
+        if self.leader_token:
+            self.last_renewal = now
+        return bool(self.leader_token)
+
+    async def refreshLocation(self, location_details):
+        """
+        fetches the real time forecast of the location and resets its cache, in the lowest
+        priority lane of the open weather quota. a refresh deferred by the quota is retried in
+        the next cycle, the cached forecast is served stale meanwhile
+        """
+        async with self.semaphore:
+            weather_manager = weatherManager({"location_id": location_details["location_id"]})
+            refresh_response = await weather_manager.coalesceForecastRefresh(
+                location_details, check_db=False, lane=Lanes.BACKGROUND
+            )
+            if refresh_response.get("status_code") == HTTPStatus.TOO_MANY_REQUESTS.value:
+                app.logger.warning(f"{LOGGER_KEY}.refreshLocation.deferred: {location_details['location_id']}")
+            elif refresh_response.get("error"):
+                app.logger.error(
+                    f"{LOGGER_KEY}.refreshLocation.error: {location_details['location_id']} {refresh_response['error']}"
+                )
+
+    async def sleepAsLeader(self, seconds):
+        """
+        sleeps in steps of a third of the leader TTL, renewing the leadership between them
+        so that it does not expire while waiting for the next refresh
+        :return False as soon as the leadership is lost:
+        """
+        deadline = asyncio.get_event_loop().time() + seconds
+        while True:
+            remaining = deadline - asyncio.get_event_loop().time()
+            if remaining <= 0:
+                return True
+            await asyncio.sleep(min(remaining, REFRESH_AHEAD_LEADER_TTL / 3))
+            if not await self.isLeader():
+                return False
+
+    async def runCycle(self):
+        """
+        starts the refresh of every location once, evenly spaced over REFRESH_AHEAD_INTERVAL
+        """
+        app.logger.info(f"{LOGGER_KEY}.runCycle")
+        locations_response = await locationManager().fetchLocations()
+        if locations_response.get("error"):
+            app.logger.error(f"{LOGGER_KEY}.runCycle.error: {locations_response['error']}")
+        # one refresh per grid cell, it is written for every location in the cell
+        locations_data = list({
+            forecast_key(location_details): location_details for location_details in locations_response.get("data") or []
+        }.values())
+        if not locations_data:
+            await asyncio.sleep(REFRESH_AHEAD_LEADER_TTL / 3)
+            return
+
+        spacing = REFRESH_AHEAD_INTERVAL / len(locations_data)
+        refreshes = []
+        try:
+            for location_details in locations_data:
+                if not await self.isLeader():
+                    break
+                refreshes.append(asyncio.ensure_future(self.refreshLocation(location_details)))
+                if not await self.sleepAsLeader(spacing):
+                    app.logger.warning(f"{LOGGER_KEY}.runCycle.stopped")
+                    break
+
+            await asyncio.gather(*refreshes)
+        except asyncio.CancelledError:
+            for refresh in refreshes:
+                refresh.cancel()
+            raise
+        app.logger.info(f"{LOGGER_KEY}.runCycle.completed: {len(refreshes)}")
+
+    async def run(self):
+        """
+        runs the refresh cycles while this worker is the leader
+        """
+        app.logger.info(f"{LOGGER_KEY}.run")
+        while True:
+            try:
+                if await self.isLeader():
+                    await self.runCycle()
+                else:
+                    await asyncio.sleep(REFRESH_AHEAD_LEADER_TTL / 3)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                app.logger.error(f"{LOGGER_KEY}.run.exception: {str(e)}")
+                await asyncio.sleep(REFRESH_AHEAD_LEADER_TTL / 3)
+
+    async def stop(self):
+        """
+        gives up the leadership so another worker can take over right away
+        """
+        if self.leader_token:
+            await app.redis.release_lock(LEADER_KEY, self.leader_token)
+            self.leader_token = None
@@ -1,20 +1,188 @@
 import json
-import aiohttp
+import math
+import asyncio
 from uuid import uuid4
 from http import HTTPStatus
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 from quart import current_app as app
 
-from ..constants import Tables, UNIT, Units
+from ..constants import Tables, UNIT, Units, Lanes, SUMMARY_METRICS, SUMMARY_PERCENTILES, ROLLUP_STATS, MAX_HISTORY_DAYS
 from app.location_manager.service import locationManager
+from app.utils import run_in_background
+from data.redis import read_soft_ttl_value, make_soft_ttl_value
+from data.spatial import geohash_encode, geohash_decode
 from app.settings import (
     OPEN_WEATHER_API_KEY,
     OPEN_WEATHER_API_BASE_URL,
-    OPEN_WEATHER_API_PARAMS
+    OPEN_WEATHER_API_PARAMS,
+    FORECAST_LOCK_TIMEOUT,
+    FORECAST_LOCK_WAIT,
+    BATCH_FORECAST_UPSTREAM_CONCURRENCY,
+    FORECAST_SOFT_TTL,
+    FORECAST_HARD_TTL,
+    HISTORY_SOFT_TTL,
+    HISTORY_HARD_TTL,
+    HISTORY_STREAM_CHUNK_SIZE,
+    WEATHER_GRID_ENABLED,
+    WEATHER_GRID_PRECISION,
 )
 
 LOGGER_KEY = "app.wealth_manager.service"
 
+# cache refreshes in flight in this worker, keyed by cache key
+_inflight_refreshes = {}
+
+
+def _daily_rollup_query():
+    """
+    builds the upsert that adds a reading to the rollup of its day, $1 is the location_id,
+    $2 the time of the reading and the metrics follow in the order of SUMMARY_METRICS
+    """
+    table_name = Tables.WEATHER_DAILY.value["name"]
+    columns = ["location_id", "day", "count", "first_created", "last_created"]
+    values = ["$1", "$2::TIMESTAMP::DATE", "1", "$2::TIMESTAMP", "$2::TIMESTAMP"]
+    updates = [
+        f"count={table_name}.count+1",
+        f"first_created=LEAST({table_name}.first_created, EXCLUDED.first_created)",
+        f"last_created=GREATEST({table_name}.last_created, EXCLUDED.last_created)",
+    ]
+    for position, metric in enumerate(SUMMARY_METRICS, start=3):
+        value = f"${position}::INTEGER"
+        columns += [f"{metric}_{stat}" for stat in ROLLUP_STATS]
+        values += [
+            f"({value} IS NOT NULL)::INTEGER",
+            f"COALESCE({value}, 0)",
+            f"COALESCE({value}::FLOAT * {value}, 0)",
+            value,
+            value,
+            value,
+            value,
+        ]
+        updates += [
+            f"{metric}_count={table_name}.{metric}_count+EXCLUDED.{metric}_count",
+            f"{metric}_sum={table_name}.{metric}_sum+EXCLUDED.{metric}_sum",
+            f"{metric}_sum_sq={table_name}.{metric}_sum_sq+EXCLUDED.{metric}_sum_sq",
+            f"{metric}_min=LEAST({table_name}.{metric}_min, EXCLUDED.{metric}_min)",
+            f"{metric}_max=GREATEST({table_name}.{metric}_max, EXCLUDED.{metric}_max)",
+            # a late reading can still be the first or the last of its day
+            f"{metric}_first=CASE WHEN EXCLUDED.first_created < {table_name}.first_created"
+            f" THEN EXCLUDED.{metric}_first ELSE {table_name}.{metric}_first END",
+            f"{metric}_last=CASE WHEN EXCLUDED.last_created >= {table_name}.last_created"
+            f" THEN EXCLUDED.{metric}_last ELSE {table_name}.{metric}_last END",
+        ]
+
+    query = f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({','.join(values)})"
+    query += f" ON CONFLICT (location_id, day) DO UPDATE SET {','.join(updates)};"
+    return query
+
+
+def _latest_weather_query():
+    """
+    builds the upsert that makes a weather record the latest reading of its location, a late
+    reading never replaces a newer one
+    """
+    table_name = Tables.WEATHER_LATEST.value["name"]
+    columns = Tables.WEATHER_LATEST.value["insert_columns"]
+    updates = ",".join(f"{column}=EXCLUDED.{column}" for column in columns[1:])
+    query = f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ($2, $1, $3, $4, $5, $6, $7, $8, $9, $10, $11)"
+    query += f" ON CONFLICT (location_id) DO UPDATE SET {updates} WHERE {table_name}.created <= EXCLUDED.created;"
+    return query
+
+
+DAILY_ROLLUP_QUERY = _daily_rollup_query()
+LATEST_WEATHER_QUERY = _latest_weather_query()
+
+
+async def insert_weather_records(records):
+    """
+    writes the weather records, tuples in the order of the weather insert_columns, with one
+    COPY and updates the latest readings and the daily rollups in the same transaction
+    """
+    table_name = Tables.WEATHER.value["name"]
+    columns = Tables.WEATHER.value["insert_columns"]
+    daily_args = []
+    for record in records:
+        values = dict(zip(columns, record))
+        daily_args.append((values["location_id"], values["created"], *[values[metric] for metric in SUMMARY_METRICS]))
+
+    async with app.db.transaction() as connection:
+        copy_response = await connection.copy_records_to_table(table_name, records=records, columns=columns)
+        await connection.executemany(LATEST_WEATHER_QUERY, records)
+        await connection.executemany(DAILY_ROLLUP_QUERY, daily_args)
+    app.logger.info(f"{LOGGER_KEY}.insert_weather_records.copy_response: {copy_response}")
+
+
+def forecast_cell(location_details):
+    """
+    the weather grid cell of the location, None when the grid is disabled
+    """
+    if not WEATHER_GRID_ENABLED:
+        return None
+    return geohash_encode(location_details["latitude"], location_details["longitude"], WEATHER_GRID_PRECISION)
+
+
+def forecast_key(location_details):
+    """
+    the cache key of the forecast of the location, the locations in the same grid cell
+    share one forecast when the grid is enabled
+    """
+    cell = forecast_cell(location_details)
+    if cell:
+        return f"weather_cell_{cell}"
+    return f"weather_{location_details['location_id']}"
+
+
+async def forecast_tags(location_details):
+    """
+    the tags of the cached forecast of the location. a grid cell is tagged with every location
+    in it, so that a put or delete of any of them drops the forecast of the cell
+    """
+    cell = forecast_cell(location_details)
+    location_ids = {location_details["location_id"]}
+    if cell:
+        location_ids.update(location_data["location_id"] for location_data in await app.location_index.locationsInCell(cell))
+    return [f"location_{location_id}" for location_id in sorted(location_ids)]
+
+
+async def cell_location_ids(cell, location_id):
+    """
+    the ids of the locations in the grid cell, location_id first. the index of the worker can
+    lag a put or delete, so its members are checked against their coordinates in DB
+    """
+    members = [
+        location_data["location_id"]
+        for location_data in await app.location_index.locationsInCell(cell)
+        if location_data["location_id"] != location_id
+    ]
+    if not members:
+        return [location_id]
+    table_name = Tables.LOCATION.value["name"]
+    query = f"SELECT location_id::VARCHAR, latitude, longitude FROM {table_name} where location_id = ANY($1::uuid[]);"
+    locations_data = await app.db.fetch(query, members)
+    current_members = {
+        location_data["location_id"] for location_data in locations_data
+        if geohash_encode(location_data["latitude"], location_data["longitude"], WEATHER_GRID_PRECISION) == cell
+    }
+    return [location_id] + [member for member in members if member in current_members]
+
+
+async def _coalesce(key, coroutine_function, *args):
+    """
+    runs a single refresh per key in this worker, concurrent callers wait for the one
+    in flight and get the same result
+    """
+    refresh = _inflight_refreshes.get(key)
+    if refresh is None:
+        refresh = asyncio.ensure_future(coroutine_function(*args))
+        _inflight_refreshes[key] = refresh
+        refresh.add_done_callback(lambda _: _inflight_refreshes.pop(key, None))
+    else:
+        app.logger.info(f"{LOGGER_KEY}._coalesce.joined: {key}")
+
+    # shielded so that a cancelled caller does not cancel the refresh for the others
+    return dict(await asyncio.shield(refresh))
+
+
 class weatherManager:
     def __init__(self, kwargs) -> None:
         self.weather_id = kwargs.get("weather_id")
@@ -27,6 +195,9 @@ class weatherManager:
         self.humidity = kwargs.get("humidity")
         self.windspeed = kwargs.get("windspeed")
         self.days = kwargs.get("days")
+        self.summary_only = kwargs.get("summary_only") == "true"
+        self.stream = kwargs.get("stream") == "true"
+        self.location_ids = kwargs.get("location_ids")
         self.location_manager = locationManager(kwargs)
     
     async def getWeatherData(self):
@@ -36,21 +207,50 @@ class weatherManager:
         app.logger.info(f"{LOGGER_KEY}.getWeatherData")
         response = {"error": None, "data": [], "status_code": None}
         try:
-            table_name = Tables.WEATHER.value["name"]
-            columns = Tables.WEATHER.value["get_columns"].copy()
+            table_name = Tables.WEATHER_LATEST.value["name"]
+            columns = Tables.WEATHER_LATEST.value["get_columns"].copy()
             columns = ",".join(columns)
 
-            query = f"SELECT {columns} FROM {table_name} where location_id='{self.location_id}' and now()-created <= INTERVAL '1 hour' order by created desc limit 1;"
-            weather_data = await app.db.execute_raw_select_query(query)
+            # primary key lookup of the newest reading
+            query = f"SELECT {columns} FROM {table_name} where location_id=$1 and created >= LOCALTIMESTAMP - INTERVAL '1 hour';"
+            weather_data = await app.db.fetchrow(query, self.location_id)
             if weather_data:
-                response["data"] = weather_data[0]
+                response["data"] = weather_data
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.getForecast.exception: {str(e)}")
             response["error"] = str(e)
             response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
         
         return response
-    
+
+
+    async def getLatestWeatherData(self, location_ids, stale=False):
+        """
+        get the latest weather details under an hour old of all the location_ids in one query,
+        or however old they are with stale. data is a dict of location_id to weather details
+        along with their age in seconds
+        """
+        app.logger.info(f"{LOGGER_KEY}.getLatestWeatherData")
+        response = {"error": None, "data": {}, "status_code": None}
+        try:
+            table_name = Tables.WEATHER_LATEST.value["name"]
+            columns = Tables.WEATHER_LATEST.value["get_columns"].copy()
+            columns = ",".join(["location_id::VARCHAR"] + columns)
+            columns += ", EXTRACT(EPOCH FROM LOCALTIMESTAMP - created)::FLOAT AS age"
+
+            query = f"SELECT {columns} FROM {table_name} where location_id = ANY($1::uuid[])"
+            if not stale:
+                query += " and created >= LOCALTIMESTAMP - INTERVAL '1 hour'"
+            query += ";"
+            weather_data = await app.db.fetch(query, location_ids)
+            response["data"] = {row.pop("location_id"): row for row in weather_data}
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getLatestWeatherData.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+
+        return response
+
 
     def setWeatherData(self, weather_data):
         """
@@ -85,14 +285,20 @@ class weatherManager:
         self.windspeed = weather_data["wind"]["speed"]
 
 
-    async def getOpenWeatherData(self, location_details):
+    async def getOpenWeatherData(self, location_details, lane=Lanes.FORECAST):
         """
-        gets weather data from third party API
+        gets weather data from third party API, once the open weather quota grants the call
+        to the lane. the call is deferred with TOO_MANY_REQUESTS when the quota is exhausted
         """
         app.logger.info(f"{LOGGER_KEY}.getOpenWeatherData")
         response = {"error": None, "data": [], "status_code": None}
 
         try:
+            if app.open_weather_quota and not await app.open_weather_quota.acquire(lane):
+                response["error"] = "open weather quota exhausted"
+                response["status_code"] = HTTPStatus.TOO_MANY_REQUESTS.value
+                return response
+
             url = f"{OPEN_WEATHER_API_BASE_URL}/{OPEN_WEATHER_API_PARAMS}"
             params = {
                 "lat": float(location_details.get("latitude")),
@@ -101,17 +307,17 @@ class weatherManager:
                 "appid": OPEN_WEATHER_API_KEY
             }
             app.logger.info(f"{LOGGER_KEY}.getOpenWeatherData.url: {url}")
-            async with aiohttp.ClientSession() as client:
-                api_response = await client.get(url, params=params)
-                status_code = api_response.status
-                response_text = await api_response.text()
-                response_text = json.loads(response_text)
-                app.logger.info(f"{LOGGER_KEY}.getOpenWeatherData.status_code: {status_code}")
-                if status_code != HTTPStatus.OK.value:
-                    app.logger.error(f"{LOGGER_KEY}.getOpenWeatherData.error: {response_text}")
-                    response["error"] = response_text["message"]
-                    response["status_code"] = HTTPStatus.FAILED_DEPENDENCY.value
-                response["data"] = response_text
+            status_code, response_text = await app.http_client.get_json(url, params=params)
+            app.logger.info(f"{LOGGER_KEY}.getOpenWeatherData.status_code: {status_code}")
+            if status_code != HTTPStatus.OK.value:
+                app.logger.error(f"{LOGGER_KEY}.getOpenWeatherData.error: {response_text}")
+                response["error"] = response_text["message"]
+                response["status_code"] = HTTPStatus.FAILED_DEPENDENCY.value
+            response["data"] = response_text
+        except asyncio.TimeoutError:
+            app.logger.error(f"{LOGGER_KEY}.getOpenWeatherData.timeout")
+            response["error"] = "open weather API timed out"
+            response["status_code"] = HTTPStatus.GATEWAY_TIMEOUT.value
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.getOpenWeatherData.exception: {str(e)}")
             response["error"] = str(e)
@@ -120,47 +326,66 @@ class weatherManager:
         return response
 
 
-    async def insertWeatherData(self):
+    async def insertWeatherData(self, location_ids=None):
         """
-        insert weather data into DB
+        insert weather data into DB, along with the latest reading of the location and the
+        rollup of its day. location_ids fans the same reading out to several locations. with
+        the write-behind queue enabled the records are only queued, and written in a batch by
+        the flusher
         """
         app.logger.info(f"{LOGGER_KEY}.insertWeatherData")
         response = {"error": None, "data": [], "status_code": None}
         try:
             if not self.weather_id:
                 self.weather_id = uuid4()
-            
-            table_name = Tables.WEATHER.value["name"]
-            columns = Tables.WEATHER.value["insert_columns"]
-            columns = ",".join(columns)
-            query = f"INSERT INTO {table_name} ({columns}) VALUES ('{self.weather_id}', '{self.location_id}', '{self.current_weather}'"
-            query += f", '{self.description}'" if self.description else ", null"
-            query += f", {self.temperature}" if self.temperature != None else ", null"
-            query += f", {self.feels_like_temperature}" if self.feels_like_temperature != None else ", null"
-            query += f", {self.air_pressure}" if self.air_pressure != None else ", null"
-            query += f", {self.humidity}" if self.humidity != None else ", null"
-            query += f", {self.windspeed}" if self.windspeed != None else ", null"
-            query += f", '{datetime.now()}'"
-            query += f", '{datetime.now()}');"
-
-            insert_response = await app.db.execute_insert_or_update_query(query)
-            app.logger.info(f"{LOGGER_KEY}.insertWeatherData.insert_response: {insert_response}")
+
+            now = datetime.now()
+            records = [
+                self.weatherRecord(self.weather_id if location_id == self.location_id else uuid4(), location_id, now)
+                for location_id in location_ids or [self.location_id]
+            ]
+            if app.weather_writer:
+                # waits only while the queue is full
+                for record in records:
+                    await app.weather_writer.put(record)
+            else:
+                await insert_weather_records(records)
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.insertWeatherData.exception: {str(e)}")
             response["error"] = str(e)
             response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
         
         return response
+
+
+    def weatherRecord(self, weather_id, location_id, created):
+        """
+        the weather record of the location, a tuple in the order of the weather insert_columns
+        """
+        return (
+            weather_id,
+            location_id,
+            self.current_weather,
+            self.description or None,
+            self.temperature,
+            self.feels_like_temperature,
+            self.air_pressure,
+            self.humidity,
+            # the columns are integers, open weather sends decimal wind speeds
+            round(self.windspeed) if self.windspeed is not None else None,
+            created,
+            created,
+        )
     
 
-    async def getRealTimeWeatherData(self, location_details):
+    async def getRealTimeWeatherData(self, location_details, lane=Lanes.FORECAST):
         """
         get the real time weather data
         """
         app.logger.info(f"{LOGGER_KEY}.getRealTimeWeatherData")
         response = {"error": None, "data": [], "status_code": None}
         try:
-            weather_data = await self.getOpenWeatherData(location_details)
+            weather_data = await self.getOpenWeatherData(location_details, lane)
             if weather_data.get("error"):
                 return weather_data
             weather_data["data"]["city"] = location_details["city"]
@@ -173,6 +398,137 @@ class weatherManager:
         return response
 
 
+    def formatWeatherData(self, city):
+        """
+        formats the weather object for the forecast response
+        """
+        return {
+            "city": city,
+            "current_weather": f"{self.current_weather}",
+            "description": self.description,
+            "temperature": f"{self.temperature}{Units.TEMPERATURE.value}",
+            "feels_like_temperature": f"{self.feels_like_temperature}{Units.TEMPERATURE.value}",
+            "air_pressure": f"{self.air_pressure} {Units.AIR_PRESSURE.value}",
+            "humidity": f"{self.humidity}{Units.HUMIDITY.value}",
+            "windspeed": f"{self.windspeed} {Units.WINDSPEED.value}"
+        }
+
+
+    def withCacheAge(self, data, age=0, stale=False):
+        """
+        adds the age of the served data in seconds and whether it is stale and being revalidated
+        """
+        return {**data, "age": round(age), "stale": stale}
+
+
+    def withCity(self, data, location_details):
+        """
+        the forecast of a grid cell is shared by its locations, each is served with its own city
+        """
+        return {**data, "city": location_details.get("city")}
+
+
+    async def waitForCachedForecast(self, cached_weather_data_key):
+        """
+        polls the cache while another worker holds the refresh lock of this location
+        """
+        app.logger.info(f"{LOGGER_KEY}.waitForCachedForecast")
+        deadline = asyncio.get_event_loop().time() + FORECAST_LOCK_WAIT
+        while asyncio.get_event_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+            cached_weather_data = await app.redis.get_with_age(key=cached_weather_data_key)
+            if cached_weather_data and not cached_weather_data[2]:
+                return cached_weather_data[0]
+        return None
+
+
+    async def refreshForecast(self, location_details, check_db=True, lane=Lanes.FORECAST):
+        """
+        refreshes the cached forecast from DB or Open weather API, holding a redis lock
+        so that only one worker refreshes a location at a time.
+        check_db=False skips the DB lookup when the caller already knows it is a miss, and
+        lane is the priority of the Open weather call.
+        with the grid enabled the forecast is fetched for the centre of the grid cell and
+        written for every location in it
+        """
+        app.logger.info(f"{LOGGER_KEY}.refreshForecast")
+        response = {"error": None, "data": [], "status_code": None}
+        cached_weather_data_key = forecast_key(location_details)
+        lock_key = f"lock_{cached_weather_data_key}"
+        lock_token = None
+
+        try:
+            lock_token = await app.redis.acquire_lock(lock_key, FORECAST_LOCK_TIMEOUT)
+            if not lock_token:
+                # another worker is refreshing, wait for it to fill the cache
+                app.logger.info(f"{LOGGER_KEY}.refreshForecast.lock_busy")
+                cached_weather_data = await self.waitForCachedForecast(cached_weather_data_key)
+                if cached_weather_data:
+                    response["data"] = cached_weather_data
+                    return response
+                app.logger.warning(f"{LOGGER_KEY}.refreshForecast.lock_wait_timeout")
+
+            # if cache miss and diff(current_time, last entry) < 1 hour, get from DB
+            weather_data = None
+            if check_db:
+                weather_data = await self.getWeatherData()
+                if weather_data.get("error"):
+                    return weather_data
+                weather_data = weather_data["data"]
+                if weather_data:
+                    self.setWeatherData(weather_data)
+
+            # if it's been more than 1 hour get real time forecast
+            if not weather_data:
+                cell = forecast_cell(location_details)
+                location_ids = None
+                upstream_location_details = location_details
+                if cell:
+                    latitude, longitude = geohash_decode(cell)
+                    upstream_location_details = {**location_details, "latitude": latitude, "longitude": longitude}
+                    location_ids = await cell_location_ids(cell, self.location_id)
+                weather_data_response = await self.getRealTimeWeatherData(upstream_location_details, lane)
+                if weather_data_response.get("error"):
+                    return weather_data_response
+                weather_data = weather_data_response["data"]
+
+                self.setWeatherDataFromOpenWeather(weather_data)
+                insert_response = await self.insertWeatherData(location_ids)
+                if insert_response.get("error"):
+                    return insert_response
+
+            # format the weather data
+            weather_data_formatted = self.formatWeatherData(location_details.get("city"))
+            response["data"] = weather_data_formatted
+
+            # set in redis
+            await app.redis.set_with_soft_ttl(
+                cached_weather_data_key, weather_data_formatted, FORECAST_SOFT_TTL, FORECAST_HARD_TTL,
+                tags=await forecast_tags(location_details)
+            )
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.refreshForecast.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+        finally:
+            if lock_token:
+                await app.redis.release_lock(lock_key, lock_token)
+
+        return response
+
+
+    async def coalesceForecastRefresh(self, location_details, check_db=True, lane=Lanes.FORECAST):
+        """
+        runs a single forecast refresh per location, or grid cell, in this worker, concurrent
+        callers wait for the one in flight and get the same result. only the callers with the
+        same lane and check_db join, a user request never waits on a background refresh that
+        the quota defers or that skips the DB
+        """
+        app.logger.info(f"{LOGGER_KEY}.coalesceForecastRefresh")
+        key = f"{forecast_key(location_details)}_{lane.value}_{check_db}"
+        return await _coalesce(key, self.refreshForecast, location_details, check_db, lane)
+
+
     async def getForecast(self):
         """
         get the forecast for searched location_id
@@ -181,85 +537,233 @@ class weatherManager:
         response = {"error": None, "data": [], "status_code": None}
 
         try:
+            # check the location and the forecast in cache first, in one round trip. the grid
+            # cell of the forecast is only known once the coordinates of the location are
+            cached_keys = [self.location_id] if WEATHER_GRID_ENABLED else [self.location_id, f"weather_{self.location_id}"]
+            cached_location_data, *cached_weather_data = await app.redis.mget(cached_keys)
+
             # get the location details, as city name is required
-            location_data_response = await self.location_manager.fetchLocations()
-            if location_data_response.get("error"):
-                return location_data_response
-            if not location_data_response.get("data"):
-                response["error"] = "location does not exist"
-                response["status_code"] = HTTPStatus.BAD_REQUEST.value
-                return response
-            location_details = location_data_response["data"][0]
+            if cached_location_data:
+                location_details = cached_location_data[0]
+            else:
+                location_data_response = await self.location_manager.fetchLocations()
+                if location_data_response.get("error"):
+                    return location_data_response
+                if not location_data_response.get("data"):
+                    response["error"] = "location does not exist"
+                    response["status_code"] = HTTPStatus.BAD_REQUEST.value
+                    return response
+                location_details = location_data_response["data"][0]
 
-            # check in cache first
-            cached_weather_data_key = f"weather_{self.location_id}"
-            cached_weather_data = await app.redis.get(key=cached_weather_data_key)
+            if WEATHER_GRID_ENABLED:
+                cached_weather_data = await app.redis.mget([forecast_key(location_details)])
+            cached_weather_data = cached_weather_data[0]
 
             if cached_weather_data:
                 # cache hit
-                app.logger.info(f"{LOGGER_KEY}.getForecast.cache_hit")
-                response["data"] = cached_weather_data
+                weather_data, age, stale = read_soft_ttl_value(cached_weather_data)
+                if stale:
+                    # serve the stale forecast and revalidate it in the background
+                    app.logger.info(f"{LOGGER_KEY}.getForecast.stale_cache_hit")
+                    run_in_background(self.coalesceForecastRefresh, location_details, lane=Lanes.BACKGROUND)
+                else:
+                    app.logger.info(f"{LOGGER_KEY}.getForecast.cache_hit")
+                response["data"] = self.withCacheAge(self.withCity(weather_data, location_details), age, stale)
             else:
                 # cache miss
                 app.logger.info(f"{LOGGER_KEY}.getForecast.cache_miss")
+                response = await self.coalesceForecastRefresh(location_details)
+                if response.get("status_code") == HTTPStatus.TOO_MANY_REQUESTS.value:
+                    # serve the last reading however old it is, until the quota refills
+                    app.logger.warning(f"{LOGGER_KEY}.getForecast.quota_exhausted")
+                    stale_weather_response = await self.getLatestWeatherData([self.location_id], stale=True)
+                    weather_data = stale_weather_response["data"].get(self.location_id)
+                    if weather_data:
+                        self.setWeatherData(weather_data)
+                        weather_data_formatted = self.formatWeatherData(location_details.get("city"))
+                        response = {"error": None, "data": None, "status_code": None}
+                        response["data"] = self.withCacheAge(weather_data_formatted, weather_data["age"], True)
+                elif not response.get("error"):
+                    response["data"] = self.withCacheAge(self.withCity(response["data"], location_details))
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getForecast.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+        
+        return response
 
-                # if cache miss and diff(current_time, last entry) < 1 hour, get from DB
-                weather_data = await self.getWeatherData()
-                if weather_data.get("error"):
-                    return weather_data
-                weather_data = weather_data["data"]
+
+    async def getBatchForecast(self):
+        """
+        get the forecast for all the searched location_ids, with one cache round trip,
+        one DB query for the misses and bounded concurrent upstream calls for the rest.
+        errors are reported per location
+        """
+        app.logger.info(f"{LOGGER_KEY}.getBatchForecast")
+        response = {"error": None, "data": {}, "status_code": None}
+
+        if self.location_ids is None:
+            return await self.getAllCurrentWeather()
+
+        try:
+            forecasts = {}
+
+            # get the location details, as city name is required
+            locations_response = await self.location_manager.fetchLocationsByIds(self.location_ids)
+            if locations_response.get("error"):
+                return locations_response
+            locations_details = locations_response["data"]
+            location_ids = []
+            for location_id in self.location_ids:
+                if location_id in locations_details:
+                    location_ids.append(location_id)
+                else:
+                    forecasts[location_id] = {"success": False, "error": "location does not exist"}
+
+            # check in cache first, the locations in the same grid cell share a key
+            cached_weather_data_keys = {
+                location_id: forecast_key(locations_details[location_id]) for location_id in location_ids
+            }
+            unique_keys = list(dict.fromkeys(cached_weather_data_keys.values()))
+            cached_weather_data = dict(zip(unique_keys, await app.redis.mget(unique_keys)))
+            missed_location_ids = []
+            for location_id in location_ids:
+                weather_data = cached_weather_data[cached_weather_data_keys[location_id]]
                 if weather_data:
-                    self.setWeatherData(weather_data)
-                
-                # if it's been more than 1 hour get real time forecast
-                if not weather_data:
-                    weather_data_response = await self.getRealTimeWeatherData(location_details)
-                    if weather_data_response.get("error"):
-                        return weather_data_response
-                    weather_data = weather_data_response["data"]
-                
-                    self.setWeatherDataFromOpenWeather(weather_data)
-                    insert_response = await self.insertWeatherData()
-                    if insert_response.get("error"):
-                        return insert_response
-            
-                # format the weather data
-                weather_data_formatted = {
-                    "city": location_details.get("city"),
-                    "current_weather": f"{self.current_weather}",
-                    "description": self.description,
-                    "temperature": f"{self.temperature}{Units.TEMPERATURE.value}",
-                    "feels_like_temperature": f"{self.feels_like_temperature}{Units.TEMPERATURE.value}",
-                    "air_pressure": f"{self.air_pressure} {Units.AIR_PRESSURE.value}",
-                    "humidity": f"{self.humidity}{Units.HUMIDITY.value}",
-                    "windspeed": f"{self.windspeed} {Units.WINDSPEED.value}"
-                }
-                response["data"] = weather_data_formatted 
+                    weather_data, age, stale = read_soft_ttl_value(weather_data)
+                    if stale:
+                        # serve the stale forecast and revalidate it in the background
+                        weather_manager = weatherManager({"location_id": location_id})
+                        run_in_background(
+                            weather_manager.coalesceForecastRefresh, locations_details[location_id], lane=Lanes.BACKGROUND
+                        )
+                    weather_data = self.withCity(weather_data, locations_details[location_id])
+                    forecasts[location_id] = {"success": True, "data": self.withCacheAge(weather_data, age, stale)}
+                else:
+                    missed_location_ids.append(location_id)
+
+            # cache miss - get the entries under an hour old from DB
+            if missed_location_ids:
+                app.logger.info(f"{LOGGER_KEY}.getBatchForecast.cache_miss: {len(missed_location_ids)}")
+                latest_weather_response = await self.getLatestWeatherData(missed_location_ids)
+                if latest_weather_response.get("error"):
+                    return latest_weather_response
+                cached_weather_data = {}
+                for location_id, weather_data in latest_weather_response["data"].items():
+                    weather_manager = weatherManager({"location_id": location_id})
+                    weather_manager.setWeatherData(weather_data)
+                    weather_data_formatted = weather_manager.formatWeatherData(locations_details[location_id].get("city"))
+                    cached_weather_data[cached_weather_data_keys[location_id]] = make_soft_ttl_value(
+                        weather_data_formatted, FORECAST_SOFT_TTL
+                    )
+                    forecasts[location_id] = {"success": True, "data": self.withCacheAge(weather_data_formatted)}
 
-                # set in redis
-                await app.redis.set(key=cached_weather_data_key, value=weather_data_formatted, expiry_time=3600)
+                # the other locations of a grid cell filled from DB share its reading
+                for location_id in missed_location_ids:
+                    cached_weather_data_key = cached_weather_data_keys[location_id]
+                    if location_id not in forecasts and cached_weather_data_key in cached_weather_data:
+                        weather_data, _, _ = read_soft_ttl_value(cached_weather_data[cached_weather_data_key])
+                        weather_data = self.withCity(weather_data, locations_details[location_id])
+                        forecasts[location_id] = {"success": True, "data": self.withCacheAge(weather_data)}
+                cached_weather_data_tags = {}
+                for location_id in latest_weather_response["data"]:
+                    cached_weather_data_key = cached_weather_data_keys[location_id]
+                    if cached_weather_data_key not in cached_weather_data_tags:
+                        cached_weather_data_tags[cached_weather_data_key] = await forecast_tags(locations_details[location_id])
+                await app.redis.mset(cached_weather_data, expiry_time=FORECAST_HARD_TTL, tags=cached_weather_data_tags)
+
+            # get real time forecast for the rest, once per grid cell
+            upstream_location_ids = {}
+            for location_id in missed_location_ids:
+                if location_id not in forecasts:
+                    upstream_location_ids.setdefault(cached_weather_data_keys[location_id], []).append(location_id)
+            semaphore = asyncio.Semaphore(BATCH_FORECAST_UPSTREAM_CONCURRENCY)
+
+            async def refresh(location_id):
+                async with semaphore:
+                    weather_manager = weatherManager({"location_id": location_id})
+                    return await weather_manager.coalesceForecastRefresh(locations_details[location_id], check_db=False)
+
+            refresh_responses = await asyncio.gather(
+                *[refresh(key_location_ids[0]) for key_location_ids in upstream_location_ids.values()]
+            )
+            deferred_location_ids = []
+            for key_location_ids, refresh_response in zip(upstream_location_ids.values(), refresh_responses):
+                for location_id in key_location_ids:
+                    if refresh_response.get("error"):
+                        forecasts[location_id] = {"success": False, "error": refresh_response["error"]}
+                        if refresh_response.get("status_code") == HTTPStatus.TOO_MANY_REQUESTS.value:
+                            deferred_location_ids.append(location_id)
+                    else:
+                        weather_data = self.withCity(refresh_response["data"], locations_details[location_id])
+                        forecasts[location_id] = {"success": True, "data": self.withCacheAge(weather_data)}
+
+            # serve the last readings however old they are, until the quota refills
+            if deferred_location_ids:
+                app.logger.warning(f"{LOGGER_KEY}.getBatchForecast.quota_exhausted: {len(deferred_location_ids)}")
+                stale_weather_response = await self.getLatestWeatherData(deferred_location_ids, stale=True)
+                for location_id, weather_data in stale_weather_response["data"].items():
+                    weather_manager = weatherManager({"location_id": location_id})
+                    weather_manager.setWeatherData(weather_data)
+                    weather_data_formatted = weather_manager.formatWeatherData(locations_details[location_id].get("city"))
+                    forecasts[location_id] = {
+                        "success": True, "data": self.withCacheAge(weather_data_formatted, weather_data["age"], True)
+                    }
+
+            # report every requested location_id
+            response["data"] = {location_id: forecasts[location_id] for location_id in self.location_ids}
         except Exception as e:
-            app.logger.error(f"{LOGGER_KEY}.getForecast.exception: {str(e)}")
+            app.logger.error(f"{LOGGER_KEY}.getBatchForecast.exception: {str(e)}")
             response["error"] = str(e)
             response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
-        
+
+        return response
+
+
+    async def getAllCurrentWeather(self):
+        """
+        get the latest reading of every location in one query, without calling Open weather.
+        age is the seconds since the reading and it is stale once older than the forecast soft TTL
+        """
+        app.logger.info(f"{LOGGER_KEY}.getAllCurrentWeather")
+        response = {"error": None, "data": {}, "status_code": None}
+
+        try:
+            location_table_name = Tables.LOCATION.value["name"]
+            table_name = Tables.WEATHER_LATEST.value["name"]
+            columns = ",".join(f"w.{column}" for column in Tables.WEATHER_LATEST.value["get_columns"])
+            query = f"SELECT l.location_id::VARCHAR, l.city, {columns}, EXTRACT(EPOCH FROM LOCALTIMESTAMP - w.created)::FLOAT AS age"
+            query += f" FROM {location_table_name} l LEFT JOIN {table_name} w ON w.location_id = l.location_id;"
+            weather_data = await app.db.fetch(query)
+
+            for row in weather_data:
+                if row["age"] is None:
+                    response["data"][row["location_id"]] = {"success": False, "error": "no forecast available yet"}
+                    continue
+                weather_manager = weatherManager({"location_id": row["location_id"]})
+                weather_manager.setWeatherData(row)
+                weather_data_formatted = weather_manager.formatWeatherData(row["city"])
+                response["data"][row["location_id"]] = {
+                    "success": True,
+                    "data": self.withCacheAge(weather_data_formatted, row["age"], row["age"] > FORECAST_SOFT_TTL),
+                }
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getAllCurrentWeather.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+
         return response
 
 
-    async def getHistoricalWeatherData(self):
+    async def getHistoricalWeatherData(self, window_start):
         """
-        get the last 7 or 15 or 30 days data from DB
+        get the readings of the location since the start of the window from DB, oldest first
         """
         app.logger.info(f"{LOGGER_KEY}.getWeatherData")
         response = {"error": None, "data": [], "status_code": None}
         try:
-            table_name = Tables.WEATHER.value["name"]
-            columns = Tables.WEATHER.value["get_columns"].copy()
-            columns = ",".join(columns)
-            interval = f"{self.days} days"
-
-            query = f"SELECT {columns} FROM {table_name} where location_id='{self.location_id}' and now()-created <= INTERVAL '{interval}';"
-            weather_data = await app.db.execute_raw_select_query(query)
+            query = self.historicalWeatherQuery()
+            weather_data = await app.db.fetch(query, self.location_id, datetime.combine(window_start, time.min))
             response["data"] = weather_data
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.getForecast.exception: {str(e)}")
@@ -267,70 +771,247 @@ class weatherManager:
             response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
         return response
 
-    def getAttributeSummary(self, attribute):
-        attribute_summary = {
-            "max": max(attribute),
-            "min": min(attribute),
-            "average": sum(attribute)/len(attribute)
-        }
-        return attribute_summary
 
-    def getSummary(self, history_data):
+    def historicalWeatherQuery(self):
+        table_name = Tables.WEATHER.value["name"]
+        columns = Tables.WEATHER.value["get_columns"].copy()
+        columns = ",".join(columns)
+
+        # created is compared to a constant, so that the (location_id, created) index is used
+        return f"SELECT {columns} FROM {table_name} where location_id=$1 and created >= $2 ORDER BY created;"
+
+
+    async def getDailyRollups(self):
         """
-        drive the summary of out of the history data
+        get the daily rollups of the last MAX_HISTORY_DAYS days from DB, oldest first
         """
-        app.logger.info(f"{LOGGER_KEY}.getSummary")
-        temperature, air_pressure, humidity, windspeed = [],[],[],[]
-        for weather_data in history_data:
-            temperature.append(weather_data["temperature"])
-            air_pressure.append(weather_data["air_pressure"])
-            humidity.append(weather_data["humidity"])
-            windspeed.append(weather_data["windspeed"])
-        
-        summary = {
-            "temperature": self.getAttributeSummary(temperature),
-            "air_pressure": self.getAttributeSummary(air_pressure),
-            "humidity": self.getAttributeSummary(humidity),
-            "windspeed": self.getAttributeSummary(windspeed),
-        }
+        app.logger.info(f"{LOGGER_KEY}.getDailyRollups")
+        response = {"error": None, "data": [], "status_code": None}
+        try:
+            table_name = Tables.WEATHER_DAILY.value["name"]
+            columns = ",".join(Tables.WEATHER_DAILY.value["get_columns"])
+            query = f"SELECT {columns} FROM {table_name} where location_id=$1 and day >= $2 ORDER BY day;"
+            first_day = date.today() - timedelta(days=MAX_HISTORY_DAYS - 1)
+            response["data"] = await app.db.fetch(query, self.location_id, first_day)
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getDailyRollups.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+        return response
+
+
+    async def getPercentiles(self):
+        """
+        get the percentiles of every metric over the readings of every window of the last
+        MAX_HISTORY_DAYS days from DB, in one query. data is a dict of the first day of the
+        window to a dict of metric to the values in the order of SUMMARY_PERCENTILES
+        """
+        app.logger.info(f"{LOGGER_KEY}.getPercentiles")
+        response = {"error": None, "data": {}, "status_code": None}
+        try:
+            table_name = Tables.WEATHER.value["name"]
+            aggregates = ",".join(
+                f"PERCENTILE_CONT($4::FLOAT[]) WITHIN GROUP (ORDER BY w.{metric}) AS {metric}"
+                for metric in SUMMARY_METRICS
+            )
+            # every window joins its own readings, over the (location_id, created) index
+            query = f"SELECT window_start::DATE::VARCHAR AS window_start, {aggregates}"
+            query += f" FROM generate_series($2::DATE, $3::DATE, INTERVAL '1 day') AS window_start"
+            query += f" JOIN {table_name} w ON w.location_id=$1 and w.created >= window_start GROUP BY window_start;"
+            first_day = date.today() - timedelta(days=MAX_HISTORY_DAYS - 1)
+            percentiles = await app.db.fetch(query, self.location_id, first_day, date.today(), SUMMARY_PERCENTILES)
+            response["data"] = {window.pop("window_start"): window for window in percentiles}
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getPercentiles.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+        return response
+
+
+    def mergeDailyRollups(self, daily_rollups, percentiles, readings=None):
+        """
+        derive the summary of the window out of its daily rollups, oldest first, and the
+        cached percentiles of its readings. first and last are taken from the readings when they
+        are loaded, so that they match the history_data returned along
+        """
+        app.logger.info(f"{LOGGER_KEY}.mergeDailyRollups")
+        summary = {}
+        for metric in SUMMARY_METRICS:
+            count = sum(daily_rollup[f"{metric}_count"] for daily_rollup in daily_rollups)
+            if not count:
+                summary[metric] = {"max": None, "min": None, "average": None, "stddev": None, "first": None, "last": None}
+            else:
+                metric_rollups = [daily_rollup for daily_rollup in daily_rollups if daily_rollup[f"{metric}_count"]]
+                average = sum(daily_rollup[f"{metric}_sum"] for daily_rollup in metric_rollups) / count
+                mean_square = sum(daily_rollup[f"{metric}_sum_sq"] for daily_rollup in metric_rollups) / count
+                summary[metric] = {
+                    "max": max(daily_rollup[f"{metric}_max"] for daily_rollup in metric_rollups),
+                    "min": min(daily_rollup[f"{metric}_min"] for daily_rollup in metric_rollups),
+                    "average": average,
+                    # population standard deviation, clamped against rounding errors
+                    "stddev": math.sqrt(max(mean_square - average ** 2, 0)),
+                    # the oldest and newest days with a reading of the metric
+                    "first": metric_rollups[0][f"{metric}_first"],
+                    "last": metric_rollups[-1][f"{metric}_last"],
+                }
+            metric_readings = [reading[metric] for reading in readings or [] if reading[metric] is not None]
+            if metric_readings:
+                summary[metric]["first"] = metric_readings[0]
+                summary[metric]["last"] = metric_readings[-1]
+            for percentile, value in zip(SUMMARY_PERCENTILES, percentiles.get(metric) or [None] * len(SUMMARY_PERCENTILES)):
+                summary[metric][f"p{round(percentile * 100)}"] = value
         return summary
 
 
-    async def getHistory(self):
+    async def refreshHistory(self):
         """
-        fetches the history of last 7 or 15 or 30 days
+        loads the daily rollups of the location and the percentiles of every window from DB
+        and caches them, every window is merged out of the same rollups
         """
-        app.logger.info(f"{LOGGER_KEY}.getHistory")
+        app.logger.info(f"{LOGGER_KEY}.refreshHistory")
+        response = {"error": None, "data": [], "status_code": None}
+
+        try:
+            daily_rollups = await self.getDailyRollups()
+            if daily_rollups.get("error"):
+                return daily_rollups
+            percentiles = await self.getPercentiles()
+            if percentiles.get("error"):
+                return percentiles
+            response["data"] = {
+                "day": date.today().isoformat(),
+                "daily_rollups": daily_rollups["data"],
+                "percentiles": percentiles["data"],
+            }
+            if not daily_rollups["data"]:
+                # nothing to cache until the first reading of the location
+                return response
+
+            # cached rollups will be stale after 6 hours, the new readings are merged in then
+            cached_history_data_key = f"history_{self.location_id}"
+            await app.redis.set_with_soft_ttl(
+                cached_history_data_key, response["data"], HISTORY_SOFT_TTL, HISTORY_HARD_TTL,
+                tags=[f"location_{self.location_id}"]
+            )
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.refreshHistory.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+
+        return response
+
+
+    async def coalesceHistoryRefresh(self):
+        """
+        runs a single history refresh per location in this worker
+        """
+        app.logger.info(f"{LOGGER_KEY}.coalesceHistoryRefresh")
+        return await _coalesce(f"history_{self.location_id}", self.refreshHistory)
+
+
+    def historyWindowStart(self):
+        return date.today() - timedelta(days=int(self.days) - 1)
+
+
+    async def getHistorySummary(self, readings=None):
+        """
+        fetches the summary of the last days, today included, merged out of the cached rollups
+        and percentiles, without reading the weather table. readings are the ones returned
+        along with the summary, if loaded
+        """
+        app.logger.info(f"{LOGGER_KEY}.getHistorySummary")
         response = {"error": None, "data": [], "status_code": None}
 
         try:
-            cached_history_data_key = f"history_{self.location_id}_{self.days}"
-            cached_history_data = await app.redis.get(cached_history_data_key)
+            cached_history_data_key = f"history_{self.location_id}"
+            cached_history_data = await app.redis.get_with_age(cached_history_data_key)
+            if cached_history_data and cached_history_data[0].get("day") != date.today().isoformat():
+                # rollups cached on a previous day miss the window of today
+                app.logger.info(f"{LOGGER_KEY}.getHistorySummary.previous_day")
+                cached_history_data = None
             if cached_history_data:
                 # cache hit
-                app.logger.info(f"{LOGGER_KEY}.getForecast.cache_hit")
-                response["data"] = cached_history_data
+                history_data, age, stale = cached_history_data
+                if stale:
+                    # serve the stale rollups and revalidate them in the background
+                    app.logger.info(f"{LOGGER_KEY}.getHistorySummary.stale_cache_hit")
+                    run_in_background(self.coalesceHistoryRefresh)
+                else:
+                    app.logger.info(f"{LOGGER_KEY}.getHistorySummary.cache_hit")
             else:
                 # cache miss
-                app.logger.info(f"{LOGGER_KEY}.getForecast.cache_miss")
-                history_data = await self.getHistoricalWeatherData()
-                if history_data.get("error"):
-                    return history_data
-                if not history_data.get("data"):
-                    response["error"] = "No history data available"
-                    response["status_code"] = HTTPStatus.OK.value
-                history_data = history_data["data"]
-                summary_response = self.getSummary(history_data)
-                response["data"] = {
-                    "history_data": history_data,
-                    "summary": summary_response
-                }
+                app.logger.info(f"{LOGGER_KEY}.getHistorySummary.cache_miss")
+                refresh_response = await self.coalesceHistoryRefresh()
+                if refresh_response.get("error"):
+                    return refresh_response
+                history_data, age, stale = refresh_response["data"], 0, False
+
+            window_start = self.historyWindowStart()
+            daily_rollups = [
+                daily_rollup for daily_rollup in history_data["daily_rollups"]
+                if daily_rollup["day"] >= window_start.isoformat()
+            ]
+            if not daily_rollups:
+                response["error"] = "No history data available"
+                response["status_code"] = HTTPStatus.OK.value
+                return response
 
-                #cached summary will expire after 6 hour
-                await app.redis.set(key=cached_history_data_key, value=response["data"], expiry_time=21600)
+            percentiles = history_data.get("percentiles", {}).get(window_start.isoformat(), {})
+            summary = self.mergeDailyRollups(daily_rollups, percentiles, readings)
+            response["data"] = self.withCacheAge({"summary": summary}, age, stale)
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.getHistorySummary.exception: {str(e)}")
+            response["error"] = str(e)
+            response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
+
+        return response
+
+
+    async def getHistory(self):
+        """
+        fetches the history of the last days, today included, only its summary with summary_only
+        """
+        app.logger.info(f"{LOGGER_KEY}.getHistory")
+        response = {"error": None, "data": [], "status_code": None}
+
+        try:
+            readings = None
+            if not self.summary_only:
+                raw_history_data = await self.getHistoricalWeatherData(self.historyWindowStart())
+                if raw_history_data.get("error"):
+                    return raw_history_data
+                readings = raw_history_data["data"]
+
+            response = await self.getHistorySummary(readings)
+            if response.get("error") or self.summary_only:
+                return response
+            response["data"]["history_data"] = readings
         except Exception as e:
             app.logger.error(f"{LOGGER_KEY}.getHistory.exception: {str(e)}")
             response["error"] = str(e)
             response["status_code"] = HTTPStatus.INTERNAL_SERVER_ERROR.value
         
-        return response
\ No newline at end of file
+        return response
+
+
+    async def streamHistory(self, history_summary):
+        """
+        streams the readings of the history as NDJSON, one reading per line, straight from a
+        cursor followed by the summary. the lines are sent in chunks of HISTORY_STREAM_CHUNK_SIZE
+        readings, an error once the stream started ends it with an error line
+        """
+        app.logger.info(f"{LOGGER_KEY}.streamHistory")
+        try:
+            query = self.historicalWeatherQuery()
+            window_start = datetime.combine(self.historyWindowStart(), time.min)
+            lines = []
+            async for weather_data in app.db.iterate(query, self.location_id, window_start, prefetch=HISTORY_STREAM_CHUNK_SIZE):
+                lines.append(json.dumps(weather_data) + "\n")
+                if len(lines) == HISTORY_STREAM_CHUNK_SIZE:
+                    yield "".join(lines)
+                    lines = []
+            lines.append(json.dumps(history_summary) + "\n")
+            yield "".join(lines)
+        except Exception as e:
+            app.logger.error(f"{LOGGER_KEY}.streamHistory.exception: {str(e)}")
+            yield json.dumps({"error": str(e)}) + "\n"
@@ -0,0 +1,170 @@
+"""
+Compares the cache codecs on history payloads, the daily rollups and window percentiles as cached
+by refreshHistory.
+
+    python -m benchmarks.cache_codec
+    python -m benchmarks.cache_codec --location-id <location_id>   # real rollups from the DB in .env
+"""
+import json
+import random
+import asyncio
+import argparse
+from timeit import Timer
+from datetime import date, timedelta
+
+from data.redis import Codec, orjson, msgpack, lz4
+from app.constants import SUMMARY_METRICS, SUMMARY_PERCENTILES
+
+HOURS_PER_DAY = 24
+WEATHER = [
+    ("Clear", "clear sky"),
+    ("Clouds", "few clouds"),
+    ("Clouds", "scattered clouds"),
+    ("Clouds", "broken clouds"),
+    ("Rain", "light rain"),
+    ("Mist", "mist"),
+]
+
+
+def synthetic_history(days: int) -> list:
+    """
+    One row an hour, with the columns of the history response.
+    """
+    rows = []
+    temperature = random.randint(5, 30)
+    for _ in range(days * HOURS_PER_DAY):
+        current_weather, description = random.choice(WEATHER)
+        temperature += random.choice((-1, 0, 1))
+        rows.append({
+            "current_weather": current_weather,
+            "description": description,
+            "temperature": temperature,
+            "feels_like_temperature": temperature - random.randint(0, 3),
+            "air_pressure": random.randint(1000, 1030),
+            "humidity": random.randint(20, 100),
+            "windspeed": random.randint(0, 12),
+        })
+    return rows
+
+
+def synthetic_rollups(days: int) -> list:
+    """
+    Daily rollups of one synthetic reading an hour, with the columns of weather_daily.
+    """
+    rows = synthetic_history(days)
+    rollups = []
+    for offset in range(days):
+        day_rows = rows[offset * HOURS_PER_DAY:(offset + 1) * HOURS_PER_DAY]
+        rollup = {"day": (date.today() - timedelta(days=days - 1 - offset)).isoformat(), "count": len(day_rows)}
+        for metric in SUMMARY_METRICS:
+            values = [row[metric] for row in day_rows]
+            rollup.update({
+                f"{metric}_count": len(values),
+                f"{metric}_sum": sum(values),
+                f"{metric}_sum_sq": sum(value * value for value in values),
+                f"{metric}_min": min(values),
+                f"{metric}_max": max(values),
+                f"{metric}_first": values[0],
+                f"{metric}_last": values[-1],
+            })
+        rollups.append(rollup)
+    return rollups
+
+
+async def db_rollups(location_id: str, days: int) -> list:
+    import asyncpg
+    from app.settings import DB_CONFIGS
+    from app.constants import Tables
+
+    connection = await asyncpg.connect(
+        host=DB_CONFIGS["HOST"], port=DB_CONFIGS["PORT"], database=DB_CONFIGS["NAME"],
+        user=DB_CONFIGS["USER"], password=DB_CONFIGS["PASSWORD"],
+    )
+    try:
+        columns = ",".join(Tables.WEATHER_DAILY.value["get_columns"])
+        rows = await connection.fetch(
+            f"SELECT {columns} FROM {Tables.WEATHER_DAILY.value['name']} WHERE location_id=$1 AND day >= $2 ORDER BY day",
+            location_id, date.today() - timedelta(days=days - 1),
+        )
+        return list(map(dict, rows))
+    finally:
+        await connection.close()
+
+
+def window_percentiles(rollups: list) -> dict:
+    """
+    Stand-in for the percentiles of every window, floats of the same count as SUMMARY_PERCENTILES.
+    """
+    percentiles = {}
+    for offset, rollup in enumerate(rollups):
+        window = rollups[offset:]
+        percentiles[rollup["day"]] = {
+            metric: [
+                float(min(day[f"{metric}_min"] for day in window)),
+                sum(day[f"{metric}_sum"] for day in window) / max(sum(day[f"{metric}_count"] for day in window), 1),
+                float(max(day[f"{metric}_max"] for day in window)),
+            ][:len(SUMMARY_PERCENTILES)]
+            for metric in SUMMARY_METRICS
+        }
+    return percentiles
+
+
+def history_payload(rollups: list) -> dict:
+    """
+    Same shape as the value refreshHistory caches.
+    """
+    value = {"daily_rollups": rollups, "percentiles": window_percentiles(rollups)}
+    return {"value": value, "cached_at": 1700000000.0, "soft_ttl": 21600}
+
+
+def codecs() -> list:
+    serializers = ["json"] + ["orjson"] * bool(orjson) + ["msgpack"] * bool(msgpack)
+    compressions = ["none", "zlib"] + ["lz4"] * bool(lz4)
+    return [(serializer, compression) for serializer in serializers for compression in compressions]
+
+
+def measure(function, repeat: int) -> float:
+    """
+    Best of 5 runs, in microseconds per call.
+    """
+    return min(Timer(function).repeat(repeat=5, number=repeat)) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--location-id", help="benchmark the rollups of this location from the DB")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(0)
+    baseline = None
+    print(f"{'days':>4} {'rows':>5} {'codec':<14} {'bytes':>8} {'ratio':>6} {'encode us':>10} {'decode us':>10}")
+    for days in (7, 15, 30):
+        if args.location_id:
+            rows = asyncio.run(db_rollups(args.location_id, days))
+            if not rows:
+                print(f"{days:>4} no history")
+                continue
+        else:
+            rows = synthetic_rollups(days)
+        payload = history_payload(rows)
+        baseline = len(json.dumps(payload).encode())
+
+        for serializer, compression in codecs():
+            codec = Codec(serializer, compression)
+            encoded = codec.encode(payload)
+            assert codec.decode(encoded) == payload
+            encode_time = measure(lambda: codec.encode(payload), args.repeat)
+            decode_time = measure(lambda: codec.decode(encoded), args.repeat)
+            print(
+                f"{days:>4} {len(rows):>5} {serializer + '/' + compression:<14} {len(encoded):>8} "
+                f"{len(encoded) / baseline:>6.2f} {encode_time:>10.1f} {decode_time:>10.1f}"
+            )
+
+        legacy = json.dumps(payload).encode()
+        legacy_time = measure(lambda: json.loads(legacy), args.repeat)
+        print(f"{days:>4} {len(rows):>5} {'legacy json':<14} {len(legacy):>8} {1:>6.2f} {'':>10} {legacy_time:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
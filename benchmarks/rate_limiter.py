@@ -0,0 +1,56 @@
+"""
+Sprays the in-process rate limiter with distinct client IPs and reports its memory and
+the cost of a request as the number of clients grows.
+
+    python -m benchmarks.rate_limiter --clients 2000000 --max-keys 100000
+"""
+import os
+import time
+import argparse
+import resource
+
+from data.rate_limiter import LocalRateLimiter
+
+ROUTE = "/weather/<location_id>"
+LIMIT = 5
+PERIOD = 60
+
+
+def client_key(client: int) -> str:
+    ip_address = f"{client >> 24 & 255}.{client >> 16 & 255}.{client >> 8 & 255}.{client & 255}"
+    return f"rate_limit_{ip_address}_GET_{ROUTE}"
+
+
+def memory_mb() -> float:
+    """
+    Resident memory of the process, the peak where /proc is not available.
+    """
+    if os.path.exists("/proc/self/statm"):
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=2000000)
+    parser.add_argument("--max-keys", type=int, default=100000)
+    parser.add_argument("--report-every", type=int, default=250000)
+    args = parser.parse_args()
+
+    limiter = LocalRateLimiter(max_keys=args.max_keys)
+    print(f"{'clients':>10} {'keys':>8} {'evictions':>10} {'memory MB':>10} {'ns/request':>11}")
+    for clients in range(args.report_every, args.clients + 1, args.report_every):
+        # every batch is new clients, its keys are built upfront so that only the limiter is timed
+        batch = [client_key(client) for client in range(clients - args.report_every, clients)]
+        start_time = time.perf_counter_ns()
+        for key in batch:
+            limiter.hit(key, LIMIT, PERIOD)
+        time_taken = (time.perf_counter_ns() - start_time) / len(batch)
+
+        stats = limiter.stats()
+        print(f"{clients:>10} {stats['keys']:>8} {stats['evictions']:>10} {memory_mb():>10.1f} {time_taken:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
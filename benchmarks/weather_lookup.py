@@ -0,0 +1,107 @@
+"""
+Seeds a copy of the weather table with hourly rows for many locations and times the
+forecast and history lookups as it grows, before (no index, now()-created predicates)
+and after (the (location_id, created) index and range predicates). Uses the DB in .env.
+
+    python -m benchmarks.weather_lookup --sizes 1000000,2000000,4000000
+"""
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from uuid import uuid4
+
+import asyncpg
+
+from app.settings import DB_CONFIGS
+
+TABLE = "weather_benchmark"
+COLUMNS = "current_weather,description,temperature,feels_like_temperature,air_pressure,humidity,windspeed"
+
+QUERIES = {
+    "before": {
+        "forecast": f"SELECT {COLUMNS} FROM {TABLE} where location_id=$1 and now()-created <= INTERVAL '1 hour' order by created desc limit 1;",
+        "history": f"SELECT {COLUMNS} FROM {TABLE} where location_id=$1 and now()-created <= INTERVAL '30 days';",
+    },
+    "after": {
+        "forecast": f"SELECT {COLUMNS} FROM {TABLE} where location_id=$1 and created >= LOCALTIMESTAMP - INTERVAL '1 hour' order by created desc limit 1;",
+        "history": f"SELECT {COLUMNS} FROM {TABLE} where location_id=$1 and created >= LOCALTIMESTAMP - INTERVAL '30 days';",
+    },
+}
+
+# one row an hour per location, going back in time as the table grows
+SEED_QUERY = f"""
+INSERT INTO {TABLE} (weather_id, location_id, current_weather, description, temperature,
+    feels_like_temperature, air_pressure, humidity, windspeed, created, updated)
+SELECT gen_random_uuid(), ($1::uuid[])[1 + i % cardinality($1::uuid[])], 'Clouds', 'scattered clouds',
+    (random() * 40)::int, (random() * 40)::int, 1000 + (random() * 30)::int, (random() * 100)::int,
+    (random() * 12)::int, created, created
+FROM generate_series($2::bigint, $3::bigint - 1) AS i,
+    LATERAL (SELECT LOCALTIMESTAMP - (i / cardinality($1::uuid[])) * INTERVAL '1 hour' AS created) AS t;
+"""
+
+
+async def time_queries(connection, query: str, location_ids: list, lookups: int) -> float:
+    """
+    Median milliseconds of the query over random locations.
+    """
+    timings = []
+    for location_id in random.sample(location_ids, lookups):
+        start_time = time.perf_counter()
+        await connection.fetch(query, location_id)
+        timings.append((time.perf_counter() - start_time) * 1000)
+    return statistics.median(timings)
+
+
+async def run(sizes: list, locations: int, lookups: int, keep: bool):
+    connection = await asyncpg.connect(
+        host=DB_CONFIGS["HOST"], port=DB_CONFIGS["PORT"], database=DB_CONFIGS["NAME"],
+        user=DB_CONFIGS["USER"], password=DB_CONFIGS["PASSWORD"],
+    )
+    try:
+        await connection.execute(f"DROP TABLE IF EXISTS {TABLE}; CREATE TABLE {TABLE} (LIKE weather INCLUDING DEFAULTS);")
+        location_ids = [str(uuid4()) for _ in range(locations)]
+        rows = 0
+
+        print(f"{'rows':>10} {'forecast before':>16} {'forecast after':>15} {'history before':>15} {'history after':>14}   (median ms)")
+        for size in sizes:
+            await connection.execute(f"DROP INDEX IF EXISTS {TABLE}_location_id_created_idx;")
+            await connection.execute(SEED_QUERY, location_ids, rows, size)
+            rows = size
+            await connection.execute(f"ANALYZE {TABLE};")
+
+            results = {}
+            for name, queries in QUERIES.items():
+                if name == "after":
+                    await connection.execute(
+                        f"CREATE INDEX {TABLE}_location_id_created_idx ON {TABLE} (location_id, created DESC); ANALYZE {TABLE};"
+                    )
+                for query_name, query in queries.items():
+                    results[(name, query_name)] = await time_queries(connection, query, location_ids, lookups)
+
+            print(
+                f"{rows:>10} {results[('before', 'forecast')]:>16.2f} {results[('after', 'forecast')]:>15.2f} "
+                f"{results[('before', 'history')]:>15.2f} {results[('after', 'history')]:>14.2f}"
+            )
+    finally:
+        if not keep:
+            await connection.execute(f"DROP TABLE IF EXISTS {TABLE};")
+        await connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000000,2000000,4000000", help="comma separated table sizes to time at")
+    parser.add_argument("--locations", type=int, default=1000)
+    parser.add_argument("--lookups", type=int, default=50)
+    parser.add_argument("--keep", action="store_true", help=f"keep the {TABLE} table")
+    args = parser.parse_args()
+
+    random.seed(0)
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    asyncio.run(run(sizes, args.locations, args.lookups, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import asyncpg
 from functools import wraps
+from contextlib import asynccontextmanager
 from logging import getLogger
 
 logger = getLogger(__name__)
@@ -24,6 +25,7 @@ class Postgres:
         self.keepalives_idle = kwargs.get("keepalives_idle", 5)
         self.keepalives_interval = kwargs.get("keepalives_interval", 4)
         self.max_inactive_connection_lifetime = kwargs.get("max_inactive_connection_lifetime", 90.0)
+        self.statement_cache_size = kwargs.get("statement_cache_size", 100)
 
     async def connect(self):
         """
@@ -38,6 +40,7 @@ class Postgres:
             max_inactive_connection_lifetime=self.max_inactive_connection_lifetime,
             min_size=self.minsize,
             max_size=self.maxsize,
+            statement_cache_size=self.statement_cache_size,
         )
 
     def _establish_connection(func):
@@ -50,6 +53,99 @@ class Postgres:
 
         return wrapper
 
+    @_establish_connection
+    async def fetch(self, query, *args) -> list:
+        """
+        Executes a parameterized select query, the statement is prepared once per connection
+        and reused from asyncpg's statement cache.
+        Args:
+            query: SQL statement with $1, $2... placeholders
+            args: values of the placeholders
+        Returns:
+            A list of dictionaries with each dictionary represented a row.
+        """
+        async with self._pool.acquire() as conn:
+            try:
+                logger.debug("fetch:: %s", query)
+                result = await conn.fetch(query, *args)
+                return list(map(dict, result))
+            except Exception as error:
+                logger.error(f"Fetch Error:: {query} => {error}")
+                raise error
+
+    @_establish_connection
+    async def fetchrow(self, query, *args):
+        """
+        Executes a parameterized select query.
+        Args:
+            query: SQL statement with $1, $2... placeholders
+            args: values of the placeholders
+        Returns:
+            The first row as a dictionary, None if there are no rows.
+        """
+        async with self._pool.acquire() as conn:
+            try:
+                logger.debug("fetchrow:: %s", query)
+                result = await conn.fetchrow(query, *args)
+                return dict(result) if result is not None else None
+            except Exception as error:
+                logger.error(f"Fetchrow Error:: {query} => {error}")
+                raise error
+
+    @_establish_connection
+    async def execute(self, query, *args) -> int:
+        """
+        Executes a parameterized insert, update or delete statement in a transaction.
+        Args:
+            query: SQL statement with $1, $2... placeholders
+            args: values of the placeholders
+        Returns:
+            Number of rows affected
+        """
+        async with self._pool.acquire() as conn, conn.transaction():
+            try:
+                logger.debug("execute:: %s", query)
+                result = await conn.execute(query, *args)
+                return int(float(result.split(" ")[-1]))
+            except Exception as error:
+                logger.error(f"Execute Error:: {query} => {error}")
+                raise error
+
+    async def iterate(self, query, *args, prefetch: int = 500):
+        """
+        Executes a parameterized select query through a server-side cursor, holding at most
+        prefetch rows in memory. The connection is released once the iteration ends or the
+        generator is closed.
+            async for row in app.db.iterate(query, *args):
+                ...
+        Args:
+            query: SQL statement with $1, $2... placeholders
+            args: values of the placeholders
+            prefetch: number of rows fetched from the cursor at a time
+        Returns:
+            An async iterator of dictionaries with each dictionary represented a row.
+        """
+        if not self._pool or self._pool._closed:
+            await self.connect()
+        # a cursor only lives within a transaction
+        async with self._pool.acquire() as conn, conn.transaction():
+            logger.debug("iterate:: %s", query)
+            async for row in conn.cursor(query, *args, prefetch=prefetch):
+                yield dict(row)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Acquires a connection and runs everything executed on it in one transaction,
+        committed when the block exits and rolled back if it raises.
+            async with app.db.transaction() as connection:
+                await connection.execute(query, *args)
+        """
+        if not self._pool or self._pool._closed:
+            await self.connect()
+        async with self._pool.acquire() as conn, conn.transaction():
+            yield conn
+
     @_establish_connection
     async def execute_raw_select_query(self, query) -> list:
         """
@@ -0,0 +1,133 @@
+import csv
+import asyncio
+from functools import partial
+from logging import getLogger
+from collections import OrderedDict
+from geopy.geocoders import Nominatim
+
+from data.spatial import KDTree
+
+logger = getLogger(__name__)
+LOGGER_KEY = "app.geocoder"
+
+# columns of the geonames cities files, https://download.geonames.org/export/dump/
+GEONAMES_NAME = 1
+GEONAMES_ASCII_NAME = 2
+GEONAMES_ALTERNATE_NAMES = 3
+GEONAMES_LATITUDE = 4
+GEONAMES_LONGITUDE = 5
+GEONAMES_COUNTRY_CODE = 8
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+class NominatimReverseGeocoder:
+    """
+    Reverse geocodes through Nominatim. geopy is blocking, so the lookups run in the default
+    executor instead of the event loop, and the addresses are memoized per coordinate rounded
+    to precision decimals, keeping the max_entries most recently used. Concurrent lookups of
+    the same rounded coordinate share one call.
+    """
+
+    def __init__(self, user_agent: str = "my_geocoder", timeout: float = 5, precision: int = 3,
+                 max_entries: int = 10000):
+        self._geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+        self._addresses = OrderedDict()
+        self._inflight = {}
+        self.precision = precision
+        self.max_entries = max_entries
+
+    def _lookup(self, latitude: float, longitude: float):
+        location = self._geolocator.reverse((latitude, longitude), language="en")
+        return location.address if location is not None else None
+
+    async def reverse(self, latitude, longitude):
+        """
+        Finds the address of the coordinate.
+        :return the address, None if nothing is there:
+        """
+        key = (round(float(latitude), self.precision), round(float(longitude), self.precision))
+        if key in self._addresses:
+            self._addresses.move_to_end(key)
+            return self._addresses[key]
+
+        lookup = self._inflight.get(key)
+        if lookup is None:
+            loop = asyncio.get_event_loop()
+            lookup = loop.run_in_executor(None, partial(self._lookup, *key))
+            self._inflight[key] = lookup
+            lookup.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shielded so that a cancelled caller does not cancel the lookup for the others
+        address = await asyncio.shield(lookup)
+
+        # failed lookups raise and are not memoized
+        self._addresses[key] = address
+        self._addresses.move_to_end(key)
+        if len(self._addresses) > self.max_entries:
+            self._addresses.popitem(last=False)
+        return address
+
+    async def contains_city(self, latitude, longitude, city: str) -> bool:
+        """
+        Checks whether the city is named in the address of the coordinate.
+        """
+        address = await self.reverse(latitude, longitude)
+        return address is not None and city.lower() in address.lower()
+
+
+class OfflineReverseGeocoder:
+    """
+    Reverse geocodes without any network call, from a geonames cities file loaded into a
+    KD-tree. The address of a coordinate lists the names of the closest cities,
+    since a coordinate within a city is often closer to one of its suburbs. A city matches
+    a coordinate only if one of its names equals the city, once normalized, as the
+    alternate names hold short names that are part of many others.
+    """
+
+    def __init__(self, tree: KDTree, neighbours: int = 5):
+        self._tree = tree
+        self.neighbours = neighbours
+
+    @classmethod
+    def load(cls, dataset_path: str, neighbours: int = 5):
+        """
+        Loads a geonames cities file, such as cities15000.txt. Malformed rows are skipped,
+        and ValueError is raised if no city is left.
+        """
+        entries = []
+        skipped = 0
+        with open(dataset_path, encoding="utf-8", newline="") as file:
+            for row in csv.reader(file, delimiter="\t", quoting=csv.QUOTE_NONE):
+                try:
+                    names = [row[GEONAMES_NAME], row[GEONAMES_ASCII_NAME], *row[GEONAMES_ALTERNATE_NAMES].split(",")]
+                    address = ", ".join(name for name in dict.fromkeys(names) if name)
+                    address = f"{address}, {row[GEONAMES_COUNTRY_CODE]}"
+                    city_names = frozenset(normalize_name(name) for name in names if name)
+                    entries.append((float(row[GEONAMES_LATITUDE]), float(row[GEONAMES_LONGITUDE]), (address, city_names)))
+                except (IndexError, ValueError):
+                    skipped += 1
+        if skipped:
+            logger.warning(f"{LOGGER_KEY}.OfflineReverseGeocoder.load.skipped: {skipped} malformed rows of {dataset_path}")
+        if not entries:
+            raise ValueError(f"no cities in {dataset_path}")
+        logger.info(f"{LOGGER_KEY}.OfflineReverseGeocoder.load: {len(entries)} cities from {dataset_path}")
+        return cls(KDTree(entries), neighbours=neighbours)
+
+    async def reverse(self, latitude, longitude):
+        """
+        Finds the names of the cities closest to the coordinate.
+        :return the names joined into one address, None if the dataset is empty:
+        """
+        nearest = self._tree.nearest(latitude, longitude, self.neighbours)
+        if not nearest:
+            return None
+        return "; ".join(address for _, (address, _) in nearest)
+
+    async def contains_city(self, latitude, longitude, city: str) -> bool:
+        """
+        Checks whether one of the cities closest to the coordinate is named city.
+        """
+        city = normalize_name(city)
+        return any(city in city_names for _, (_, city_names) in self._tree.nearest(latitude, longitude, self.neighbours))
@@ -0,0 +1,96 @@
+import json
+import aiohttp
+from functools import wraps
+from logging import getLogger
+
+logger = getLogger(__name__)
+LOGGER_KEY = "app.http_client"
+
+
+class HttpClient:
+    def __init__(self, **kwargs):
+        self._session = None
+
+        self.limit = kwargs.get("limit", 100)
+        self.limit_per_host = kwargs.get("limit_per_host", 20)
+        self.dns_cache_ttl = kwargs.get("dns_cache_ttl", 300)
+        self.keepalive_timeout = kwargs.get("keepalive_timeout", 30)
+        self.connect_timeout = kwargs.get("connect_timeout", 3)
+        self.read_timeout = kwargs.get("read_timeout", 10)
+
+    async def connect(self):
+        """
+        Sets up a keep-alive connection pool shared by all the upstream calls.
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def _establish_session(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            self = args[0]
+            if not self._session or self._session.closed:
+                await self.connect()
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+    @_establish_session
+    async def get_json(self, url: str, params: dict = None):
+        """
+        Makes a GET call and decodes the JSON body.
+        Args:
+            url: URL to call
+            params: query params of the call
+        Returns:
+            A tuple of status code and decoded body
+        """
+        async with self._session.get(url, params=params) as response:
+            body = await response.text()
+            logger.debug(f"{LOGGER_KEY}.get_json:: {url} => {response.status}")
+            return response.status, json.loads(body)
+
+    def pool_stats(self) -> dict:
+        """
+        Returns the usage of the connection pool.
+        """
+        if not self._session or self._session.closed:
+            return {"connected": False}
+
+        connector = self._session.connector
+        hosts = {}
+        for key, connections in connector._conns.items():
+            host = f"{key.host}:{key.port}"
+            hosts.setdefault(host, {"idle": 0, "acquired": 0})
+            hosts[host]["idle"] += len(connections)
+        for key, connections in connector._acquired_per_host.items():
+            host = f"{key.host}:{key.port}"
+            hosts.setdefault(host, {"idle": 0, "acquired": 0})
+            hosts[host]["acquired"] += len(connections)
+
+        return {
+            "connected": True,
+            "limit": connector.limit,
+            "limit_per_host": connector.limit_per_host,
+            "acquired": len(connector._acquired),
+            "idle": sum(host["idle"] for host in hosts.values()),
+            "hosts": hosts,
+        }
+
+    async def close(self):
+        """
+        Closes the connection pool.
+        """
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,69 @@
+import random
+import asyncio
+from logging import getLogger
+
+logger = getLogger(__name__)
+LOGGER_KEY = "app.quota"
+
+# the longest a waiting caller sleeps before it checks the bucket again
+MAX_POLL_INTERVAL = 1
+
+
+class OutboundQuota:
+    """
+    Budget of outbound calls shared by all the workers, a token bucket in redis refilling
+    limit calls every period seconds. Every lane has a priority, a lane keeps the reserve
+    tokens of the lanes above it untouched, so once the bucket runs low only the most
+    important calls get through. A caller waits for a token until its deadline, the lanes
+    with a smaller reserve are refilled first and so are served first. Calls are let
+    through while redis is unreachable.
+    """
+
+    def __init__(self, redis, key: str, limit: int, period: float, reserves: dict, waits: dict):
+        """
+        :param redis: RedisCache holding the bucket
+        :param reserves: Dict of lane, an Enum member, to the tokens kept for the lanes of
+        higher priority
+        :param waits: Dict of lane to the seconds a call waits for a token
+        """
+        self._redis = redis
+        self.key = key
+        self.limit = limit
+        self.period = period
+        self.reserves = reserves
+        self.waits = waits
+        self.granted = dict.fromkeys(reserves, 0)
+        self.deferred = dict.fromkeys(reserves, 0)
+
+    async def acquire(self, lane) -> bool:
+        """
+        Takes a call from the budget for the lane, waiting up to the wait of the lane.
+        :return True if the call can be made, False if it has to be deferred:
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + self.waits[lane]
+        while True:
+            token = await self._redis.take_token(self.key, self.limit, self.period, self.reserves[lane])
+            if token is None or token[0]:
+                self.granted[lane] += 1
+                return True
+
+            retry_after = token[2]
+            remaining = deadline - loop.time()
+            if retry_after > remaining:
+                logger.warning(f"{LOGGER_KEY}.acquire.deferred: {lane.value} retry after {retry_after:.2f}s")
+                self.deferred[lane] += 1
+                return False
+            # jittered, the workers waiting on the same bucket do not all poll it at once
+            await asyncio.sleep(min(retry_after * random.uniform(1, 1.2), MAX_POLL_INTERVAL, remaining))
+
+    def stats(self) -> dict:
+        """
+        Returns the calls granted and deferred in this worker, by lane.
+        """
+        return {
+            "limit": self.limit,
+            "period": self.period,
+            "granted": {lane.value: count for lane, count in self.granted.items()},
+            "deferred": {lane.value: count for lane, count in self.deferred.items()},
+        }
@@ -0,0 +1,50 @@
+import time
+from collections import OrderedDict
+
+
+class LocalRateLimiter:
+    """
+    In-process GCRA rate limiter, for the nodes that rate limit without redis. Each key
+    holds a single timestamp, the theoretical arrival time of its next request, and the
+    least recently seen keys are evicted beyond max_keys, so memory and the cost of a
+    request stay constant however many clients there are. An evicted key starts over
+    with its full limit, as it would once idle for the whole period.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self._tats = OrderedDict()
+        self.max_keys = max_keys
+        self.evictions = 0
+
+    def hit(self, key: str, limit: int, period: float, now: float = None):
+        """
+        Counts a request against the rate limit of the key.
+        :param key: Rate limit key
+        :param limit: Number of requests allowed in period
+        :param period: Seconds
+        :return tuple of allowed, remaining requests, seconds to retry after and seconds
+        until the limit is fully restored:
+        """
+        now = time.monotonic() if now is None else now
+        emission_interval = period / limit
+        tat = max(self._tats.get(key, now), now)
+        new_tat = tat + emission_interval
+        if new_tat - now > period:
+            return False, 0, new_tat - now - period, tat - now
+
+        self._tats[key] = new_tat
+        self._tats.move_to_end(key)
+        if len(self._tats) > self.max_keys:
+            self._tats.popitem(last=False)
+            self.evictions += 1
+        remaining = int((period - (new_tat - now)) / emission_interval + 1e-6)
+        return True, remaining, 0.0, new_tat - now
+
+    async def throttle(self, key: str, limit: int, period: float):
+        """
+        Same as RedisCache.throttle, for this node only.
+        """
+        return self.hit(key, limit, period)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._tats), "max_keys": self.max_keys, "evictions": self.evictions}
@@ -1,12 +1,135 @@
 import json
+import zlib
+import asyncio
+from fnmatch import fnmatchcase
+from collections import OrderedDict
 from functools import wraps
 import time
+import random
+from uuid import uuid4
 import aioredis
-from aioredis.errors import ConnectionClosedError
+from aioredis.errors import ConnectionClosedError, PoolClosedError
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 DELIMITER = "~"
 DEFAULT_EXPIRE_TIME = 3600
+DEFAULT_LOCK_TIME = 10
+INVALIDATION_CHANNEL = "local_cache_invalidation"
+SCAN_COUNT = 500
+TAG_PREFIX = "tag_"
+
+# GCRA rate limit, the key holds the theoretical arrival time of the next request. Allows
+# ARGV[2] requests every ARGV[1] seconds, returns allowed, remaining, retry after and reset
+GCRA_SCRIPT = """
+local time = redis.call("time")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local emission_interval = tonumber(ARGV[1]) / tonumber(ARGV[2])
+local delay_tolerance = tonumber(ARGV[1])
+local tat = math.max(tonumber(redis.call("get", KEYS[1]) or now), now)
+local new_tat = tat + emission_interval
+if new_tat - now > delay_tolerance then
+    return {0, 0, tostring(new_tat - now - delay_tolerance), tostring(tat - now)}
+end
+redis.call("set", KEYS[1], tostring(new_tat), "px", math.ceil((new_tat - now) * 1000))
+-- rounding slack, the timestamps lose precision in the subtraction
+local remaining = math.floor((delay_tolerance - (new_tat - now)) / emission_interval + 0.000001)
+return {1, remaining, "0", tostring(new_tat - now)}
+"""
+
+# token bucket, the key holds the tokens left and when they were counted. Refills ARGV[1]
+# tokens every ARGV[2] seconds and takes one only if at least ARGV[3] tokens stay in reserve
+# for the callers of higher priority, returns taken, tokens left and seconds to retry after
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("time")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local capacity = tonumber(ARGV[1])
+local refill_rate = capacity / tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local bucket = redis.call("hmget", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * refill_rate)
+local taken = 0
+local retry_after = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+    taken = 1
+else
+    retry_after = (reserve + 1 - tokens) / refill_rate
+end
+redis.call("hset", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("expire", KEYS[1], math.ceil(tonumber(ARGV[2])))
+return {taken, tostring(tokens), tostring(retry_after)}
+"""
+
+# encoded values start with a header byte, with the high bit set so that it never
+# clashes with the first byte of the plain json values written before the codec
+HEADER_MARKER = 0x80
+SERIALIZERS = {"json": 0, "orjson": 1, "msgpack": 2}
+COMPRESSIONS = {"none": 0, "zlib": 1, "lz4": 2}
+
+# failures that mean redis is unreachable, the cache degrades to misses on these
+CONNECTION_ERRORS = (ConnectionClosedError, PoolClosedError, OSError, asyncio.TimeoutError)
+
+# deletes the lock only if it is still held by the given token
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# extends the expiry of the lock only if it is still held by the given token
+EXTEND_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# adds the keys to the tag set and keeps the set alive as long as its longest lived key
+TAG_KEYS_SCRIPT = """
+redis.call("sadd", KEYS[1], unpack(ARGV, 2))
+if redis.call("ttl", KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call("expire", KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# deletes the keys of the tag sets along with the sets, returns the deleted keys
+INVALIDATE_TAGS_SCRIPT = """
+local deleted = {}
+for _, tag in ipairs(KEYS) do
+    local members = redis.call("smembers", tag)
+    for i = 1, #members, 1000 do
+        redis.call("del", unpack(members, i, math.min(i + 999, #members)))
+    end
+    for _, member in ipairs(members) do
+        deleted[#deleted + 1] = member
+    end
+    redis.call("del", tag)
+end
+-- ARGV[1] is the channel the deleted keys are published on to the local caches, if any
+if ARGV[1] and #deleted > 0 then
+    redis.call("publish", ARGV[1], cjson.encode({keys = deleted}))
+end
+return deleted
+"""
 
 
 def print_redis_log(**msg):
@@ -56,6 +179,344 @@ def log_read_operation(func):
     return wrapper
 
 
+def make_soft_ttl_value(value, soft_ttl: int):
+    """
+    Wraps a value with the time it was cached, to be read with read_soft_ttl_value.
+    """
+    return {"value": value, "cached_at": time.time(), "soft_ttl": soft_ttl}
+
+
+def read_soft_ttl_value(data):
+    """
+    Unwraps a value stored with set_with_soft_ttl.
+    :param data: Decoded value from cache
+    :return tuple of value, age in seconds and whether it is past its soft TTL:
+    """
+    if not isinstance(data, dict) or "cached_at" not in data:
+        # stored without a soft TTL, redis expiry is the only TTL
+        return data, 0, False
+    age = max(time.time() - data["cached_at"], 0)
+    return data["value"], age, age > data["soft_ttl"]
+
+
+class Codec:
+    """
+    Encodes the cached values with serializer, compressing the ones larger than
+    compress_threshold bytes. The header byte records how a value was encoded, so
+    values written with any other settings, or as plain json, are still decoded.
+    Serializers and compressions that are not installed fall back to json and zlib.
+    """
+
+    def __init__(self, serializer: str = "orjson", compression: str = "zlib", compress_threshold: int = 1024, compression_level: int = 1):
+        if (serializer == "orjson" and orjson is None) or (serializer == "msgpack" and msgpack is None):
+            logging.getLogger(__name__).warning("Codec: %s is not installed, using json", serializer)
+            serializer = "json"
+        if compression == "lz4" and lz4 is None:
+            logging.getLogger(__name__).warning("Codec: lz4 is not installed, using zlib")
+            compression = "zlib"
+        if serializer not in SERIALIZERS or compression not in COMPRESSIONS:
+            raise ValueError(f"unknown codec {serializer}/{compression}")
+        self.serializer = serializer
+        self.compression = compression
+        self.compress_threshold = compress_threshold
+        self.compression_level = compression_level
+
+    @staticmethod
+    def serialize(value, serializer: str) -> bytes:
+        if serializer == "orjson":
+            return orjson.dumps(value)
+        if serializer == "msgpack":
+            return msgpack.packb(value)
+        return json.dumps(value).encode()
+
+    @staticmethod
+    def deserialize(data: bytes, serializer: str):
+        if serializer == "orjson":
+            return orjson.loads(data)
+        if serializer == "msgpack":
+            return msgpack.unpackb(data)
+        return json.loads(data)
+
+    def compress(self, data: bytes, compression: str) -> bytes:
+        if compression == "zlib":
+            return zlib.compress(data, self.compression_level)
+        if compression == "lz4":
+            return lz4.frame.compress(data)
+        return data
+
+    @staticmethod
+    def decompress(data: bytes, compression: str) -> bytes:
+        if compression == "zlib":
+            return zlib.decompress(data)
+        if compression == "lz4":
+            return lz4.frame.decompress(data)
+        return data
+
+    def encode(self, value) -> bytes:
+        data = self.serialize(value, self.serializer)
+        compression = self.compression if len(data) > self.compress_threshold else "none"
+        header = HEADER_MARKER | SERIALIZERS[self.serializer] << 4 | COMPRESSIONS[compression]
+        return bytes([header]) + self.compress(data, compression)
+
+    def decode(self, data: bytes):
+        if isinstance(data, str):
+            data = data.encode()
+        if not data[0] & HEADER_MARKER:
+            # plain json, written before the codec
+            return json.loads(data)
+        serializer = _SERIALIZER_NAMES[data[0] >> 4 & 0x07]
+        compression = _COMPRESSION_NAMES[data[0] & 0x0F]
+        return self.deserialize(self.decompress(data[1:], compression), serializer)
+
+
+_SERIALIZER_NAMES = {code: name for name, code in SERIALIZERS.items()}
+_COMPRESSION_NAMES = {code: name for name, code in COMPRESSIONS.items()}
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, short circuiting the calls to
+    redis. Once open, a single trial call is let through after a backoff that doubles,
+    up to backoff_max, every time the trial fails. A successful call closes it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, backoff_base: float = 0.5, backoff_max: float = 30):
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failures = 0
+        self.backoff = backoff_base
+        self.retry_at = 0
+        self.short_circuited = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.failures >= self.failure_threshold
+
+    def allow_request(self) -> bool:
+        if not self.is_open:
+            return True
+        now = time.monotonic()
+        if now < self.retry_at:
+            self.short_circuited += 1
+            return False
+        # half open, hold back the others until the trial call reports back
+        self.retry_at = now + self.backoff
+        return True
+
+    def record_success(self):
+        if self.is_open:
+            RedisCache.logger.info("RedisCache.circuit_breaker closed")
+        self.failures = 0
+        self.backoff = self.backoff_base
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures < self.failure_threshold:
+            return
+        if self.failures > self.failure_threshold:
+            self.backoff = min(self.backoff * 2, self.backoff_max)
+        else:
+            RedisCache.logger.critical("RedisCache.circuit_breaker opened")
+        # jitter so that the workers do not retry in lockstep
+        self.retry_at = time.monotonic() + self.backoff * random.uniform(0.8, 1.2)
+
+    def stats(self) -> dict:
+        return {
+            "open": self.is_open,
+            "failures": self.failures,
+            "backoff": self.backoff,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with a TTL, used as the first tier in front of redis.
+    Values are shared between the callers and must not be mutated.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, expire_time: int = 5):
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.expire_time = expire_time
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """
+        Gets the value of the key, None if missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self.delete(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def set(self, key: str, value, size: int, expiry_time: int = None):
+        """
+        Sets the key, evicting the least recently used keys over the limits.
+        :param size: Size of the value in bytes, as stored in redis
+        :param expiry_time: Seconds after which the key expires, capped to the local TTL
+        """
+        if size > self.max_bytes:
+            return
+        self.delete(key)
+        expiry_time = min(expiry_time or self.expire_time, self.expire_time)
+        self._entries[key] = (time.monotonic() + expiry_time, size, value)
+        self.size += size
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def delete_pattern(self, pattern: str):
+        for key in [key for key in self._entries if fnmatchcase(key, pattern)]:
+            self.delete(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class RedisPipeline:
+    """
+    Queues commands with the namespacing and encoding of RedisCache and sends them in
+    a single round trip when the block exits. The decoded replies, in the order the
+    commands were queued, are in results.
+
+        async with app.redis.pipeline() as pipe:
+            pipe.get("all_locations")
+            pipe.set("weather_1", value, expiry_time=3600)
+        all_locations, _ = pipe.results
+    """
+
+    def __init__(self, cache, transaction: bool = False):
+        self._cache = cache
+        self._pipeline = cache._pool.multi_exec() if transaction else cache._pool.pipeline()
+        self._decoders = []
+        self._logs = []
+        self._hidden = []
+        self._futures = []
+        self._written_keys = []
+        self.results = None
+
+    def _queue(self, future, decoder=None, hidden=False, **log):
+        # replies of queued commands are read from execute, hidden ones are left out of results
+        future.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._futures.append(future)
+        self._decoders.append(decoder)
+        self._logs.append(log)
+        self._hidden.append(hidden)
+
+    def get(self, key: str):
+        custom_key = self._cache._generate_custom_key(key)
+        self._queue(self._pipeline.get(custom_key), lambda data: self._cache.codec.decode(data) if data else None, key=key, operation="get")
+
+    def set(self, key: str, value, expiry_time=None, tags: list = None):
+        custom_key = self._cache._generate_custom_key(key)
+        expiry_time = expiry_time or self._cache.expire_time
+        self._queue(self._pipeline.set(custom_key, self._cache.codec.encode(value), expire=expiry_time), key=key, operation="set", expire_time=expiry_time)
+        self._written_keys.append(custom_key)
+        for tag in tags or []:
+            self.tag(tag, [custom_key], expiry_time)
+
+    def tag(self, tag: str, custom_keys: list, expiry_time: int):
+        """
+        Adds the namespaced keys to the tag, to be deleted together by invalidate_tags.
+        """
+        tag_key = self._cache._generate_tag_key(tag)
+        self._queue(
+            self._pipeline.eval(TAG_KEYS_SCRIPT, keys=[tag_key], args=[expiry_time, *custom_keys]),
+            hidden=True, key=tag_key, operation="tag",
+        )
+
+    def delete(self, *keys):
+        custom_keys = list(map(self._cache._generate_custom_key, keys))
+        self._queue(self._pipeline.delete(*custom_keys), key=",".join(keys), operation="delete")
+        self._written_keys.extend(custom_keys)
+
+    def expire(self, key: str, expiry_time: int = DEFAULT_EXPIRE_TIME):
+        custom_key = self._cache._generate_custom_key(key)
+        self._queue(self._pipeline.expire(custom_key, expiry_time), key=key, operation="expire")
+        self._written_keys.append(custom_key)
+
+    def sadd(self, key: str, member: str, *members):
+        custom_key = self._cache._generate_custom_key(key)
+        self._queue(self._pipeline.sadd(custom_key, member, *members), key=key, operation="sadd")
+
+    def smembers(self, key: str):
+        custom_key = self._cache._generate_custom_key(key)
+        self._queue(self._pipeline.smembers(custom_key, encoding="utf-8"), key=key, operation="smembers")
+
+    async def execute(self):
+        """
+        Sends the queued commands and decodes their replies. The results are all None
+        when redis is unreachable.
+        """
+        circuit_breaker = self._cache.circuit_breaker
+        self.results = [None] * self._hidden.count(False)
+        if not circuit_breaker.allow_request():
+            # the queued commands are never sent
+            for future in self._futures:
+                future.cancel()
+            return self.results
+
+        if self._written_keys and self._cache.local_cache is not None:
+            # the other workers drop the written keys, in the same round trip
+            channel, message = self._cache._invalidation_message(keys=self._written_keys)
+            self._queue(self._pipeline.publish(channel, message), hidden=True, key=channel, operation="publish")
+
+        start_time = time.time_ns()
+        try:
+            replies = await asyncio.wait_for(self._pipeline.execute(), self._cache.command_timeout)
+        except CONNECTION_ERRORS as exception:
+            await self._cache._handle_connection_error(exception)
+            return self.results
+        circuit_breaker.record_success()
+        time_taken = time.time_ns() - start_time
+
+        results = []
+        for reply, decoder, log, hidden in zip(replies, self._decoders, self._logs, self._hidden):
+            if hidden:
+                continue
+            if log["operation"] == "get":
+                log.update(time_taken=time_taken, status="hit" if reply else "miss")
+            print_redis_log(**log)
+            results.append(decoder(reply) if decoder else reply)
+        if self._written_keys:
+            self._cache._drop_local(keys=self._written_keys)
+        self.results = results
+        return results
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            await self.execute()
+
+
 def get_default_logger_():
     extra = {"source": "Redis library"}
     logging.basicConfig(level=logging.INFO, format="%(asctime)s Redis Library: %(message)s")
@@ -73,35 +534,136 @@ class RedisCache:
         self.is_retry_in_progress = False
         self.host = None
         self.port = None
+        self.password = None
+        self.min_pool_size = kwargs.get("min_pool_size", 1)
+        self.max_pool_size = kwargs.get("max_pool_size", 10)
+        self.connect_timeout = kwargs.get("connect_timeout", 1)
+        self.command_timeout = kwargs.get("command_timeout", 0.5)
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=kwargs.get("failure_threshold", 5),
+            backoff_base=kwargs.get("backoff_base", 0.5),
+            backoff_max=kwargs.get("backoff_max", 30),
+        )
+        self.local_cache = kwargs.get("local_cache", None)
+        self.codec = kwargs.get("codec", None) or Codec()
+        self._subscriber = None
+        self._subscriber_task = None
         RedisCache.logger = kwargs.get("logging_handler", None) or get_default_logger_()
 
     def _generate_custom_key(self, text):
         return self.namespace + DELIMITER + text
 
+    def _generate_tag_key(self, tag):
+        return self._generate_custom_key(TAG_PREFIX + tag)
+
     async def connect(self, host: str, port: int, password=None):
         """
-        Setup a connection pool.
+        Setup a connection pool of min_pool_size to max_pool_size connections. The pool
+        replaces the broken connections by itself.
         :param host: Redis host
         :param port: Redis port
         :param loop: Event loop
         """
         self.host = host
         self.port = port
+        self.password = password
 
-        self._pool = await aioredis.create_redis((self.host, self.port), password=password)
+        self._pool = await aioredis.create_redis_pool(
+            (self.host, self.port),
+            password=password,
+            minsize=self.min_pool_size,
+            maxsize=self.max_pool_size,
+            timeout=self.connect_timeout,
+        )
+        if self.local_cache is not None and self._subscriber_task is None:
+            self._subscriber_task = asyncio.ensure_future(self._listen_invalidations())
 
-    def handle_closed_connection(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
+    async def _listen_invalidations(self):
+        """
+        Drops the local cache entries written or deleted by the other workers.
+        """
+        channel_name = self._generate_custom_key(INVALIDATION_CHANNEL)
+        while True:
             try:
-                return await func(*args, **kwargs)
-            except ConnectionClosedError as exception:
-                RedisCache.logger.critical("RedisCache ConnectionClosedError: %s", exception)
-                self = args[0]
-                await self.retry_connection()
-                raise exception
+                self._subscriber = await aioredis.create_redis((self.host, self.port), password=self.password)
+                (channel,) = await self._subscriber.subscribe(channel_name)
+                # anything written while unsubscribed may be stale
+                self.local_cache.clear()
+                while await channel.wait_message():
+                    message = await channel.get_json()
+                    for key in message.get("keys", []):
+                        self.local_cache.delete(key)
+                    for pattern in message.get("patterns", []):
+                        self.local_cache.delete_pattern(pattern)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:
+                RedisCache.logger.error("RedisCache._listen_invalidations: %s", exception)
+            self.local_cache.clear()
+            await asyncio.sleep(1)
+
+    def _invalidation_message(self, keys: list = None, patterns: list = None) -> tuple:
+        """
+        The channel and the message that make the other workers drop the keys from their
+        local cache.
+        """
+        message = json.dumps({"keys": keys or [], "patterns": patterns or []})
+        return self._generate_custom_key(INVALIDATION_CHANNEL), message
+
+    def _drop_local(self, keys: list = None, patterns: list = None):
+        if self.local_cache is None:
+            return
+        for key in keys or []:
+            self.local_cache.delete(key)
+        for pattern in patterns or []:
+            self.local_cache.delete_pattern(pattern)
+
+    async def _invalidate_local_cache(self, keys: list = None, patterns: list = None):
+        """
+        Drops the keys from the local cache of this and, over pub/sub, all the other workers.
+        Writes go through a pipeline instead, which publishes in the same round trip.
+        :param keys: Namespaced key names
+        :param patterns: Namespaced key patterns
+        """
+        if self.local_cache is None:
+            return
+        self._drop_local(keys=keys, patterns=patterns)
+        await self._pool.publish(*self._invalidation_message(keys=keys, patterns=patterns))
+
+    async def _handle_connection_error(self, exception):
+        RedisCache.logger.critical("RedisCache %s: %s", type(exception).__name__, exception)
+        self.circuit_breaker.record_failure()
+        if isinstance(exception, PoolClosedError):
+            asyncio.ensure_future(self.retry_connection())
+
+    def handle_closed_connection(func=None, *, default=None, timed=True):
+        """
+        Runs the command under command_timeout, unless timed is False. While redis is
+        unreachable the command returns default instead of raising, or
+        default(*args, **kwargs) if it is callable, and calls are short circuited while
+        the circuit breaker is open.
+        """
+
+        def decorator(func):
+            def degraded(args, kwargs):
+                return default(*args, **kwargs) if callable(default) else default
+
+            @wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                if not self.circuit_breaker.allow_request():
+                    return degraded(args, kwargs)
+                try:
+                    command = func(self, *args, **kwargs)
+                    response = await (asyncio.wait_for(command, self.command_timeout) if timed else command)
+                except CONNECTION_ERRORS as exception:
+                    await self._handle_connection_error(exception)
+                    return degraded(args, kwargs)
+                self.circuit_breaker.record_success()
+                return response
 
-        return wrapper
+            return wrapper
+
+        return decorator(func) if func is not None else decorator
 
     @handle_closed_connection
     @log_read_operation
@@ -112,26 +674,115 @@ class RedisCache:
         :return:
         """
         key = self._generate_custom_key(key)
+        if self.local_cache is not None:
+            value = self.local_cache.get(key)
+            if value is not None:
+                return value
         data = await self._pool.get(key)
         if data:
-            return json.loads(data)
+            value = self.codec.decode(data)
+            if self.local_cache is not None:
+                self.local_cache.set(key, value, len(data))
+            return value
         return None
 
+    @handle_closed_connection(default=lambda keys: [None] * len(keys))
+    async def mget(self, keys: list):
+        """
+        Gets the values of all the keys from cache in a single round trip.
+        :param keys: Key names
+        :return list of values in the order of keys, None for the missing ones:
+        """
+        if not keys:
+            return []
+        custom_keys = list(map(self._generate_custom_key, keys))
+        values = [None] * len(keys)
+        if self.local_cache is not None:
+            values = list(map(self.local_cache.get, custom_keys))
+        missed_indexes = [index for index, value in enumerate(values) if value is None]
+        if not missed_indexes:
+            return values
+
+        start_time = time.time_ns()
+        data = await self._pool.mget(*[custom_keys[index] for index in missed_indexes])
+        time_taken = time.time_ns() - start_time
+        for index, value in zip(missed_indexes, data):
+            print_redis_log(key=keys[index], operation="mget", time_taken=time_taken, status="hit" if value else "miss")
+            if value:
+                values[index] = self.codec.decode(value)
+                if self.local_cache is not None:
+                    self.local_cache.set(custom_keys[index], values[index], len(value))
+        return values
+
     @handle_closed_connection
     @log_write_operation
-    async def set(self, key: str, value, expiry_time=None):
+    async def set(self, key: str, value, expiry_time=None, tags: list = None):
         """
         Set a key in a cache.
         :param key: Key name
         :param value: Value of the corresponding key
+        :param tags: Tags to invalidate the key with, see invalidate_tags
         :return:
         """
         if not expiry_time:
             expiry_time = self.expire_time
+        if tags or self.local_cache is not None:
+            # one round trip along with the tags and the invalidation of the local caches
+            async with self.pipeline() as pipe:
+                pipe.set(key, value, expiry_time=expiry_time, tags=tags)
+            return
         key = self._generate_custom_key(key)
-        value = json.dumps(value)
+        value = self.codec.encode(value)
         await self._pool.set(key, value, expire=expiry_time)
 
+    async def mset(self, values: dict, expiry_time=None, expiry_times: dict = None, tags: dict = None):
+        """
+        Set multiple keys in cache in a single round trip.
+        :param values: Dict of key name to value
+        :param expiry_time: Seconds after which the keys expire
+        :param expiry_times: Dict of key name to its own expiry, overrides expiry_time
+        :param tags: Dict of key name to the tags to invalidate it with
+        :return:
+        """
+        if not values:
+            return
+        expiry_times = expiry_times or {}
+        tags = tags or {}
+        async with self.pipeline() as pipe:
+            for key, value in values.items():
+                pipe.set(key, value, expiry_time=expiry_times.get(key, expiry_time), tags=tags.get(key))
+
+    def pipeline(self, transaction: bool = False):
+        """
+        Returns a pipeline to be used as an async context manager, the queued commands are
+        sent in one round trip on exit. With transaction they run in a MULTI/EXEC block.
+        """
+        return RedisPipeline(self, transaction=transaction)
+
+    async def set_with_soft_ttl(self, key: str, value, soft_ttl: int, hard_ttl: int, tags: list = None):
+        """
+        Set a key in cache along with the time it was cached. The value is considered
+        stale after soft_ttl and expires from redis after hard_ttl.
+        :param key: Key name
+        :param value: Value of the corresponding key
+        :param soft_ttl: Seconds after which the value is stale
+        :param hard_ttl: Seconds after which the value expires
+        :param tags: Tags to invalidate the key with, see invalidate_tags
+        :return:
+        """
+        await self.set(key=key, value=make_soft_ttl_value(value, soft_ttl), expiry_time=hard_ttl, tags=tags)
+
+    async def get_with_age(self, key: str):
+        """
+        Gets a value set with set_with_soft_ttl.
+        :param key: Key name
+        :return tuple of value, age in seconds and whether it is stale, None on miss:
+        """
+        data = await self.get(key=key)
+        if data is None:
+            return None
+        return read_soft_ttl_value(data)
+
     @handle_closed_connection
     @log_write_operation
     async def rpush(self, key: str, values):
@@ -168,36 +819,68 @@ class RedisCache:
         key = self._generate_custom_key(key)
         return await self._pool.lpop(key)
 
-    @handle_closed_connection
+    @handle_closed_connection(default=0, timed=False)
     async def delete(self, pattern: str = None, patterns: list = None):
         """
-        Deletes the key matching the given pattern.
+        Deletes the keys matching the given patterns. The keyspace is walked with SCAN
+        and the keys are deleted in batches, so redis is never blocked for long.
+        Prefer invalidate_tags when the keys are known upfront.
         :param pattern: Pattern
-        :return:
+        :param patterns: list of patterns
+        :return number of keys deleted:
         """
-        if pattern:
-            pattern = self._generate_custom_key(pattern)
-            for key in await self._pool.keys(pattern):
-                await self._pool.delete(key)
-
+        patterns = list(map(self._generate_custom_key, ([pattern] if pattern else []) + (patterns or [])))
+        deleted = 0
+        for custom_pattern in patterns:
+            batch = []
+            async for key in self._pool.iscan(match=custom_pattern, count=SCAN_COUNT):
+                batch.append(key)
+                if len(batch) >= SCAN_COUNT:
+                    deleted += await self._pool.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += await self._pool.delete(*batch)
+            print_redis_log(key=custom_pattern, operation="delete")
         if patterns:
-            patterns = list(map(self._generate_custom_key, patterns))
-            combinations = []
-            for pattern in patterns:
-                combinations.extend(await self._pool.keys(pattern))
+            await self._invalidate_local_cache(patterns=patterns)
+        return deleted
 
-            if combinations:
-                await self._pool.delete(combinations[0], *combinations)
+    @handle_closed_connection(default=0)
+    async def invalidate_tags(self, tags: list):
+        """
+        Deletes all the keys set with any of the tags, along with the tags, in one
+        round trip and without scanning the keyspace.
+        :param tags: list of tags
+        :return number of keys deleted:
+        """
+        if not tags:
+            return 0
+        tag_keys = list(map(self._generate_tag_key, tags))
+        # the script publishes the deleted keys to the local caches itself
+        channel = [self._generate_custom_key(INVALIDATION_CHANNEL)] if self.local_cache is not None else []
+        deleted = await self._pool.eval(INVALIDATE_TAGS_SCRIPT, keys=tag_keys, args=channel)
+        deleted = [key.decode() if isinstance(key, bytes) else key for key in deleted]
+        for tag_key in tag_keys:
+            print_redis_log(key=tag_key, operation="invalidate_tag")
+        self._drop_local(keys=deleted)
+        return len(deleted)
 
     @handle_closed_connection
-    async def delete_without_pattern(self, key: str = None):
+    async def delete_without_pattern(self, key: str = None, keys: list = None):
         """
-        Deletes the key.
+        Deletes the key, or all the keys in a single round trip.
         :param key: key
+        :param keys: list of keys
         :return:
         """
-        key = self._generate_custom_key(key)
-        await self._pool.delete(key)
+        keys = ([key] if key else []) + (keys or [])
+        if not keys:
+            return
+        if self.local_cache is not None:
+            async with self.pipeline() as pipe:
+                pipe.delete(*keys)
+            return
+        await self._pool.delete(*map(self._generate_custom_key, keys))
 
     @handle_closed_connection
     @log_write_operation
@@ -243,6 +926,10 @@ class RedisCache:
         """
         if not expiry_time:
             expiry_time = self.expire_time
+        if self.local_cache is not None:
+            async with self.pipeline() as pipe:
+                pipe.expire(key, expiry_time)
+            return
         key = self._generate_custom_key(key)
         await self._pool.expire(key, expiry_time)
 
@@ -333,14 +1020,97 @@ class RedisCache:
         key = self._generate_custom_key(key)
         return await self._pool.lrange(key, start, stop)
 
+    @handle_closed_connection(
+        default=lambda key, expiry_time=DEFAULT_LOCK_TIME, fail_open=True: uuid4().hex if fail_open else None
+    )
+    async def acquire_lock(self, key: str, expiry_time: int = DEFAULT_LOCK_TIME, fail_open: bool = True):
+        """
+        Acquires a lock on the key if no one else is holding it.
+        :param key: Lock name
+        :param expiry_time: Seconds after which the lock releases itself
+        :param fail_open: Whether to hand out the lock while redis is unreachable
+        :return token of the lock if acquired otherwise None:
+        """
+        key = self._generate_custom_key(key)
+        token = uuid4().hex
+        acquired = await self._pool.set(key, token, expire=expiry_time, exist=self._pool.SET_IF_NOT_EXIST)
+        return token if acquired else None
+
+    @handle_closed_connection(default=0)
+    async def release_lock(self, key: str, token: str):
+        """
+        Releases the lock if it is still held by the given token.
+        :param key: Lock name
+        :param token: Token returned by acquire_lock
+        :return 1 if released otherwise 0:
+        """
+        key = self._generate_custom_key(key)
+        return await self._pool.eval(RELEASE_LOCK_SCRIPT, keys=[key], args=[token])
+
+    @handle_closed_connection(default=0)
+    async def extend_lock(self, key: str, token: str, expiry_time: int = DEFAULT_LOCK_TIME):
+        """
+        Extends the expiry of the lock if it is still held by the given token.
+        :param key: Lock name
+        :param token: Token returned by acquire_lock
+        :param expiry_time: Seconds after which the lock releases itself
+        :return 1 if extended otherwise 0:
+        """
+        key = self._generate_custom_key(key)
+        return await self._pool.eval(EXTEND_LOCK_SCRIPT, keys=[key], args=[token, expiry_time])
+
+    @handle_closed_connection
+    async def throttle(self, key: str, limit: int, period: float):
+        """
+        Counts a request against the GCRA rate limit of the key, shared by all the workers.
+        The state is a single timestamp per key, expiring once the limit is fully restored.
+        :param key: Rate limit key
+        :param limit: Number of requests allowed in period
+        :param period: Seconds
+        :return tuple of allowed, remaining requests, seconds to retry after and seconds
+        until the limit is fully restored, None while redis is unreachable:
+        """
+        key = self._generate_custom_key(key)
+        allowed, remaining, retry_after, reset = await self._pool.eval(GCRA_SCRIPT, keys=[key], args=[period, limit])
+        return bool(allowed), remaining, float(retry_after), float(reset)
+
+    @handle_closed_connection
+    async def take_token(self, key: str, capacity: int, period: float, reserve: int = 0):
+        """
+        Takes a token from the bucket of the key, shared by all the workers. The bucket holds
+        up to capacity tokens and refills capacity tokens every period seconds.
+        :param key: Bucket key
+        :param capacity: Number of tokens refilled in period
+        :param period: Seconds
+        :param reserve: Tokens that must stay in the bucket after the take
+        :return tuple of taken, tokens left and seconds to retry after, None while redis is
+        unreachable:
+        """
+        key = self._generate_custom_key(key)
+        taken, tokens, retry_after = await self._pool.eval(
+            TOKEN_BUCKET_SCRIPT, keys=[key], args=[capacity, period, reserve]
+        )
+        return bool(taken), float(tokens), float(retry_after)
+
     async def close(self):
         """
         Closes the connection pool.
         """
+        if self._subscriber_task is not None:
+            self._subscriber_task.cancel()
+            self._subscriber_task = None
+        if self._subscriber is not None:
+            self._subscriber.close()
+            await self._subscriber.wait_closed()
+            self._subscriber = None
         if self._pool is not None:
             self._pool.close()
+            await self._pool.wait_closed()
 
     async def retry_connection(self):
+        """
+        Recreates the connection pool, backing off exponentially between the attempts.
+        """
         RedisCache.logger.info("RedisCache._retry_connection")
 
         if self.is_retry_in_progress:
@@ -350,11 +1120,24 @@ class RedisCache:
             )
 
         self.is_retry_in_progress = True
-
-        self.retry_count += 1
-        RedisCache.logger.info("Retry count: %s", self.retry_count)
-
+        backoff = self.circuit_breaker.backoff_base
         try:
-            await self.connect(host=self.host, port=self.port)
+            # the broken pool still holds its sockets until it is closed
+            if self._pool is not None:
+                try:
+                    self._pool.close()
+                    await self._pool.wait_closed()
+                except Exception as exception:
+                    RedisCache.logger.warning("RedisCache._retry_connection close failed: %s", exception)
+            while True:
+                self.retry_count += 1
+                RedisCache.logger.info("Retry count: %s", self.retry_count)
+                try:
+                    await self.connect(host=self.host, port=self.port, password=self.password)
+                    return
+                except CONNECTION_ERRORS as exception:
+                    RedisCache.logger.critical("RedisCache._retry_connection failed: %s", exception)
+                await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+                backoff = min(backoff * 2, self.circuit_breaker.backoff_max)
         finally:
             self.is_retry_in_progress = False
@@ -0,0 +1,157 @@
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def to_unit_vector(latitude: float, longitude: float) -> tuple:
+    """
+    Converts a coordinate to a point on the unit sphere, the straight line distance between
+    two such points orders them the same as the great circle distance, across the poles and
+    the antimeridian too.
+    """
+    latitude, longitude = math.radians(latitude), math.radians(longitude)
+    return (
+        math.cos(latitude) * math.cos(longitude),
+        math.cos(latitude) * math.sin(longitude),
+        math.sin(latitude),
+    )
+
+
+def chord_to_km(chord: float) -> float:
+    """
+    Converts the straight line distance between two unit vectors to kilometres on the earth.
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 6) -> str:
+    """
+    Encodes a coordinate as the geohash of the cell holding it. Every extra character splits
+    the cell 32 ways, precision 6 cells are about 1.2 km by 0.6 km at the equator.
+    """
+    ranges = [[-180.0, 180.0], [-90.0, 90.0]]
+    values = [float(longitude), float(latitude)]
+    geohash = []
+    bit = 0
+    # the bits alternate between longitude and latitude, starting with longitude
+    for position in range(precision * 5):
+        bounds, value = ranges[position % 2], values[position % 2]
+        middle = (bounds[0] + bounds[1]) / 2
+        bit = bit << 1
+        if value >= middle:
+            bit |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        if position % 5 == 4:
+            geohash.append(GEOHASH_ALPHABET[bit])
+            bit = 0
+    return "".join(geohash)
+
+
+def geohash_decode(geohash: str) -> tuple:
+    """
+    Decodes a geohash to the centre of its cell.
+    :return (latitude, longitude) tuple:
+    """
+    ranges = [[-180.0, 180.0], [-90.0, 90.0]]
+    position = 0
+    for character in geohash:
+        bits = GEOHASH_ALPHABET.index(character)
+        for shift in range(4, -1, -1):
+            bounds = ranges[position % 2]
+            middle = (bounds[0] + bounds[1]) / 2
+            if bits >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            position += 1
+    (longitude_min, longitude_max), (latitude_min, latitude_max) = ranges
+    return (latitude_min + latitude_max) / 2, (longitude_min + longitude_max) / 2
+
+
+def kd_tree_layout(coordinates: list, geohash_precision: int = None) -> tuple:
+    """
+    Computes the points and the node order of a KDTree over the coordinates, in O(n log^2 n).
+    Takes and returns plain lists only, so that it can run in another process.
+    :param coordinates: List of (latitude, longitude) tuples
+    :param geohash_precision: Also encodes the geohash of every coordinate at this precision
+    :return (points, order, geohashes) tuple, geohashes is None without geohash_precision:
+    """
+    points = [to_unit_vector(float(latitude), float(longitude)) for latitude, longitude in coordinates]
+    # implicit tree, the median of every range is its node and splits on the axis of its depth
+    order = list(range(len(points)))
+    stack = [(0, len(order), 0)]
+    while stack:
+        start, end, axis = stack.pop()
+        if end - start <= 1:
+            continue
+        order[start:end] = sorted(order[start:end], key=lambda index: points[index][axis])
+        middle = (start + end) // 2
+        stack.append((start, middle, (axis + 1) % 3))
+        stack.append((middle + 1, end, (axis + 1) % 3))
+
+    geohashes = None
+    if geohash_precision:
+        geohashes = [geohash_encode(latitude, longitude, geohash_precision) for latitude, longitude in coordinates]
+    return points, order, geohashes
+
+
+class KDTree:
+    """
+    Static 3-d tree over coordinates, each carrying an item. Built once in O(n log^2 n) and
+    queried for the k nearest items in O(log n) on average, it is rebuilt rather than
+    updated when the coordinates change.
+    """
+
+    def __init__(self, entries: list, layout: tuple = None):
+        """
+        :param entries: List of (latitude, longitude, item) tuples
+        :param layout: (points, order) of the entries from kd_tree_layout, when built elsewhere
+        """
+        self.items = [item for _, _, item in entries]
+        if layout is None:
+            layout = kd_tree_layout([(latitude, longitude) for latitude, longitude, _ in entries])
+        self.points, self.order = layout[0], layout[1]
+
+    def __len__(self):
+        return len(self.items)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 1) -> list:
+        """
+        Finds the k items closest to the coordinate.
+        :return list of (distance in km, item) tuples, closest first:
+        """
+        if not self.items or k < 1:
+            return []
+
+        target = to_unit_vector(float(latitude), float(longitude))
+        # max heap of the best k so far, as (-squared distance, index)
+        best = []
+        # ranges to search, with the squared distance of their splitting plane from the target
+        stack = [(0, len(self.order), 0, 0.0)]
+        while stack:
+            start, end, axis, bound = stack.pop()
+            if start >= end or (len(best) == k and bound >= -best[0][0]):
+                continue
+            middle = (start + end) // 2
+            index = self.order[middle]
+            point = self.points[index]
+            distance = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-distance, index))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, index))
+
+            difference = target[axis] - point[axis]
+            near, far = ((start, middle), (middle + 1, end)) if difference < 0 else ((middle + 1, end), (start, middle))
+            # the far side is searched only while its splitting plane is closer than the k-th best
+            stack.append((*far, (axis + 1) % 3, difference ** 2))
+            stack.append((*near, (axis + 1) % 3, bound))
+
+        return [
+            (chord_to_km(math.sqrt(-distance)), self.items[index])
+            for distance, index in sorted(best, reverse=True)
+        ]
@@ -0,0 +1,114 @@
+import asyncio
+from logging import getLogger
+
+logger = getLogger(__name__)
+LOGGER_KEY = "app.write_behind"
+
+# put on the queue by close, wakes the flusher up so that it drains and stops
+_CLOSE = object()
+
+
+class WriteBehindQueue:
+    """
+    Buffers records in memory and writes them in batches from a single background flusher,
+    so that the callers do not wait on the write. A batch is flushed once it holds batch_size
+    records or flush_interval seconds after its first record, and put waits while max_size
+    records are queued. A batch that fails is retried max_retries times before it is dropped.
+    """
+
+    def __init__(self, flush, max_size: int = 10000, batch_size: int = 500, flush_interval: float = 1,
+                 max_retries: int = 3):
+        """
+        :param flush: Coroutine function writing a list of records
+        """
+        self._flush = flush
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._closed = False
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.flushed = 0
+        self.batches = 0
+        self.dropped = 0
+
+    async def put(self, record):
+        """
+        Queues the record, waiting while the queue is full.
+        """
+        if self._closed:
+            raise RuntimeError("write-behind queue is closed")
+        await self._queue.put(record)
+
+    async def _next_batch(self):
+        """
+        Waits for the first record, then collects records until the batch is full or
+        flush_interval has passed. Returns None once the queue is closed and drained.
+        """
+        loop = asyncio.get_event_loop()
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if self._closed:
+                # draining, flush whatever is queued right away
+                if self._queue.empty():
+                    break
+                record = self._queue.get_nowait()
+            elif deadline is None:
+                record = await self._queue.get()
+                deadline = loop.time() + self.flush_interval
+            else:
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+            if record is not _CLOSE:
+                batch.append(record)
+
+        if not batch and self._closed:
+            return None
+        return batch
+
+    async def _flush_batch(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._flush(batch)
+                self.flushed += len(batch)
+                self.batches += 1
+                return
+            except Exception as e:
+                logger.error(f"{LOGGER_KEY}._flush_batch.exception: attempt {attempt + 1} {str(e)}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(self.flush_interval * 2 ** attempt)
+
+        logger.error(f"{LOGGER_KEY}._flush_batch.dropped: {len(batch)}")
+        self.dropped += len(batch)
+
+    async def run(self):
+        """
+        Flushes the batches until the queue is closed and drained.
+        """
+        while True:
+            batch = await self._next_batch()
+            if batch is None:
+                return
+            if batch:
+                await self._flush_batch(batch)
+
+    async def close(self):
+        """
+        Stops accepting records, run returns once the queued ones are flushed.
+        """
+        self._closed = True
+        await self._queue.put(_CLOSE)
+
+    def stats(self) -> dict:
+        """
+        Returns the usage of the queue.
+        """
+        return {
+            "queued": self._queue.qsize(),
+            "max_size": self._queue.maxsize,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
@@ -1,3 +1,6 @@
+-- every worker runs the setup on start, one at a time
+SELECT pg_advisory_xact_lock(hashtext('weather_app.db_commands'));
+
 CREATE TABLE IF NOT EXISTS locations (
     location_id UUID PRIMARY KEY,
     city VARCHAR(50) UNIQUE NOT NULL,
@@ -9,8 +12,21 @@ CREATE TABLE IF NOT EXISTS locations (
     updated TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
 );
 
+-- a weather table created before the partitioning is moved aside, its readings are copied
+-- into the partitions below
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('weather') AND relkind = 'r') THEN
+        ALTER TABLE weather RENAME TO weather_unpartitioned;
+        ALTER INDEX IF EXISTS weather_pkey RENAME TO weather_unpartitioned_pkey;
+        ALTER INDEX IF EXISTS weather_location_id_created_idx RENAME TO weather_unpartitioned_location_id_created_idx;
+    END IF;
+END $$;
+
+-- partitioned by month of created, the partitions are created ahead and dropped once older
+-- than the retention by the weather maintenance
 CREATE TABLE IF NOT EXISTS weather (
-    weather_id UUID PRIMARY KEY,
+    weather_id UUID NOT NULL,
     location_id UUID REFERENCES locations(location_id) ON DELETE CASCADE,
     current_weather VARCHAR(50),
     description VARCHAR(100),
@@ -19,6 +35,195 @@ CREATE TABLE IF NOT EXISTS weather (
     air_pressure INTEGER,
     humidity INTEGER,
     windspeed INTEGER,
+    created TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+    updated TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (weather_id, created)
+) PARTITION BY RANGE (created);
+
+CREATE INDEX IF NOT EXISTS weather_location_id_created_idx ON weather (location_id, created DESC);
+
+-- catches the readings of the months without a partition, so that the inserts never fail
+-- while the partitions are not created ahead
+CREATE TABLE IF NOT EXISTS weather_default PARTITION OF weather DEFAULT;
+
+-- creates the partition of weather holding the readings of the month of month_start. the
+-- readings of the month caught by weather_default meanwhile are moved into it
+CREATE OR REPLACE FUNCTION create_weather_partition(month_start DATE) RETURNS VOID AS $$
+DECLARE
+    partition_name TEXT;
+    month_end DATE;
+BEGIN
+    month_start := date_trunc('month', month_start);
+    month_end := (month_start + INTERVAL '1 month')::DATE;
+    partition_name := 'weather_' || to_char(month_start, 'YYYY_MM');
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE weather INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    IF to_regclass('weather_default') IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM weather_default WHERE created >= %L AND created < %L RETURNING *)'
+            ' INSERT INTO %I SELECT * FROM moved',
+            month_start, month_end, partition_name
+        );
+    END IF;
+    EXECUTE format(
+        'ALTER TABLE weather ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, month_end
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_weather_partition((date_trunc('month', LOCALTIMESTAMP) + INTERVAL '1 month' * n)::DATE)
+FROM generate_series(0, 1) AS n;
+
+-- partitions for the months caught by weather_default, when they were not created ahead
+SELECT create_weather_partition(month_start::DATE)
+FROM (SELECT DISTINCT date_trunc('month', created) AS month_start FROM weather_default) AS months;
+
+DO $$
+BEGIN
+    IF to_regclass('weather_unpartitioned') IS NOT NULL THEN
+        PERFORM create_weather_partition(month_start::DATE)
+        FROM (
+            SELECT DISTINCT date_trunc('month', COALESCE(created, updated, LOCALTIMESTAMP)) AS month_start
+            FROM weather_unpartitioned
+        ) AS months;
+        INSERT INTO weather (weather_id, location_id, current_weather, description, temperature,
+            feels_like_temperature, air_pressure, humidity, windspeed, created, updated)
+        SELECT weather_id, location_id, current_weather, description, temperature,
+            feels_like_temperature, air_pressure, humidity, windspeed, COALESCE(created, updated, LOCALTIMESTAMP), updated
+        FROM weather_unpartitioned;
+        DROP TABLE weather_unpartitioned;
+    END IF;
+END $$;
+
+-- newest reading of every location, kept up to date by insertWeatherData
+CREATE TABLE IF NOT EXISTS weather_latest (
+    location_id UUID PRIMARY KEY REFERENCES locations(location_id) ON DELETE CASCADE,
+    weather_id UUID NOT NULL,
+    current_weather VARCHAR(50),
+    description VARCHAR(100),
+    temperature INTEGER NOT NULL,
+    feels_like_temperature INTEGER,
+    air_pressure INTEGER,
+    humidity INTEGER,
+    windspeed INTEGER,
     created TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
     updated TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
-);
\ No newline at end of file
+);
+
+-- backfilled once, from the readings inserted before weather_latest existed
+INSERT INTO weather_latest (location_id, weather_id, current_weather, description, temperature,
+    feels_like_temperature, air_pressure, humidity, windspeed, created, updated)
+SELECT DISTINCT ON (location_id) location_id, weather_id, current_weather, description, temperature,
+    feels_like_temperature, air_pressure, humidity, windspeed, created, updated
+FROM weather
+WHERE location_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM weather_latest)
+ORDER BY location_id, created DESC;
+
+-- count, sum, sum of squares, min, max, first and last of every metric per location and day,
+-- kept up to date by insertWeatherData
+CREATE TABLE IF NOT EXISTS weather_daily (
+    location_id UUID REFERENCES locations(location_id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    count INTEGER NOT NULL,
+    first_created TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    last_created TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    temperature_count INTEGER NOT NULL DEFAULT 0,
+    temperature_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    temperature_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    temperature_min INTEGER,
+    temperature_max INTEGER,
+    temperature_first INTEGER,
+    temperature_last INTEGER,
+    air_pressure_count INTEGER NOT NULL DEFAULT 0,
+    air_pressure_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    air_pressure_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    air_pressure_min INTEGER,
+    air_pressure_max INTEGER,
+    air_pressure_first INTEGER,
+    air_pressure_last INTEGER,
+    humidity_count INTEGER NOT NULL DEFAULT 0,
+    humidity_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    humidity_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    humidity_min INTEGER,
+    humidity_max INTEGER,
+    humidity_first INTEGER,
+    humidity_last INTEGER,
+    windspeed_count INTEGER NOT NULL DEFAULT 0,
+    windspeed_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    windspeed_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    windspeed_min INTEGER,
+    windspeed_max INTEGER,
+    windspeed_first INTEGER,
+    windspeed_last INTEGER,
+    PRIMARY KEY (location_id, day)
+);
+
+-- backfilled once, from the readings inserted before weather_daily existed
+INSERT INTO weather_daily (location_id, day, count, first_created, last_created,
+    temperature_count, temperature_sum, temperature_sum_sq, temperature_min, temperature_max, temperature_first, temperature_last, air_pressure_count, air_pressure_sum, air_pressure_sum_sq, air_pressure_min, air_pressure_max, air_pressure_first, air_pressure_last, humidity_count, humidity_sum, humidity_sum_sq, humidity_min, humidity_max, humidity_first, humidity_last, windspeed_count, windspeed_sum, windspeed_sum_sq, windspeed_min, windspeed_max, windspeed_first, windspeed_last)
+SELECT location_id, created::DATE, COUNT(*), MIN(created), MAX(created),
+    COUNT(temperature), COALESCE(SUM(temperature), 0), COALESCE(SUM(temperature::FLOAT * temperature), 0), MIN(temperature), MAX(temperature),
+    (ARRAY_AGG(temperature ORDER BY created))[1], (ARRAY_AGG(temperature ORDER BY created DESC))[1],
+    COUNT(air_pressure), COALESCE(SUM(air_pressure), 0), COALESCE(SUM(air_pressure::FLOAT * air_pressure), 0), MIN(air_pressure), MAX(air_pressure),
+    (ARRAY_AGG(air_pressure ORDER BY created))[1], (ARRAY_AGG(air_pressure ORDER BY created DESC))[1],
+    COUNT(humidity), COALESCE(SUM(humidity), 0), COALESCE(SUM(humidity::FLOAT * humidity), 0), MIN(humidity), MAX(humidity),
+    (ARRAY_AGG(humidity ORDER BY created))[1], (ARRAY_AGG(humidity ORDER BY created DESC))[1],
+    COUNT(windspeed), COALESCE(SUM(windspeed), 0), COALESCE(SUM(windspeed::FLOAT * windspeed), 0), MIN(windspeed), MAX(windspeed),
+    (ARRAY_AGG(windspeed ORDER BY created))[1], (ARRAY_AGG(windspeed ORDER BY created DESC))[1]
+FROM weather
+WHERE location_id IS NOT NULL AND created IS NOT NULL AND NOT EXISTS (SELECT 1 FROM weather_daily)
+GROUP BY location_id, created::DATE;
+
+-- the same per location and hour, downsampled from the readings of a partition before it is dropped
+CREATE TABLE IF NOT EXISTS weather_hourly (
+    location_id UUID REFERENCES locations(location_id) ON DELETE CASCADE,
+    hour TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    count INTEGER NOT NULL,
+    first_created TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    last_created TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    temperature_count INTEGER NOT NULL DEFAULT 0,
+    temperature_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    temperature_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    temperature_min INTEGER,
+    temperature_max INTEGER,
+    temperature_first INTEGER,
+    temperature_last INTEGER,
+    air_pressure_count INTEGER NOT NULL DEFAULT 0,
+    air_pressure_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    air_pressure_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    air_pressure_min INTEGER,
+    air_pressure_max INTEGER,
+    air_pressure_first INTEGER,
+    air_pressure_last INTEGER,
+    humidity_count INTEGER NOT NULL DEFAULT 0,
+    humidity_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    humidity_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    humidity_min INTEGER,
+    humidity_max INTEGER,
+    humidity_first INTEGER,
+    humidity_last INTEGER,
+    windspeed_count INTEGER NOT NULL DEFAULT 0,
+    windspeed_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    windspeed_sum_sq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    windspeed_min INTEGER,
+    windspeed_max INTEGER,
+    windspeed_first INTEGER,
+    windspeed_last INTEGER,
+    PRIMARY KEY (location_id, hour)
+);
+
+-- coordinates of the cities geocoded by setLatLong, keyed by the normalized city and country code
+CREATE TABLE IF NOT EXISTS geocodes (
+    city VARCHAR(100) NOT NULL,
+    country_code VARCHAR(2) NOT NULL DEFAULT '',
+    latitude DECIMAL NOT NULL,
+    longitude DECIMAL NOT NULL,
+    state VARCHAR(50),
+    country VARCHAR(50),
+    created TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (city, country_code)
+);
@@ -0,0 +1,23 @@
+import os
+from uuid import uuid4
+
+import pytest
+
+from data.redis import RedisCache
+
+
+@pytest.fixture
+def redis_cache():
+    """
+    Coroutine function connecting a RedisCache, in a namespace of its own, to the redis of
+    REDIS_HOST and REDIS_PORT. The test is skipped when redis is unreachable.
+    """
+    async def connect():
+        cache = RedisCache(f"test_{uuid4().hex}")
+        try:
+            await cache.connect(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", "6379")))
+        except OSError as e:
+            pytest.skip(f"redis is unreachable: {str(e)}")
+        return cache
+
+    return connect
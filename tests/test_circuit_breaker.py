@@ -0,0 +1,111 @@
+import asyncio
+import random
+
+import pytest
+
+from data import redis
+from data.redis import RedisCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(redis.time, "monotonic", clock)
+    monkeypatch.setattr(random, "uniform", lambda low, high: 1)
+    return clock
+
+
+@pytest.fixture
+def breaker():
+    return RedisCache("test", failure_threshold=3, backoff_base=1, backoff_max=4).circuit_breaker
+
+
+def test_stays_closed_below_the_threshold(clock, breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open
+    assert breaker.allow_request()
+
+
+def test_success_resets_the_failures(clock, breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_opens_at_the_threshold_and_short_circuits(clock, breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow_request()
+    assert not breaker.allow_request()
+    assert breaker.stats()["short_circuited"] == 2
+
+
+def test_lets_a_single_trial_through_after_the_backoff(clock, breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 1
+    assert breaker.allow_request()
+    # the others wait on the trial
+    assert not breaker.allow_request()
+
+
+def test_failed_trials_double_the_backoff_up_to_the_max(clock, breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    backoffs = []
+    for _ in range(4):
+        clock.now += breaker.backoff
+        assert breaker.allow_request()
+        breaker.record_failure()
+        backoffs.append(breaker.backoff)
+    assert backoffs == [2, 4, 4, 4]
+    clock.now += 3.9
+    assert not breaker.allow_request()
+
+
+def test_successful_trial_closes_it(clock, breaker):
+    for _ in range(4):
+        breaker.record_failure()
+    clock.now += breaker.backoff
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.backoff == 1
+    assert breaker.allow_request()
+
+
+class UnreachablePool:
+    async def get(self, key):
+        raise ConnectionRefusedError("redis is down")
+
+    async def mget(self, *keys):
+        raise ConnectionRefusedError("redis is down")
+
+
+def test_commands_degrade_to_misses_and_open_the_breaker(clock):
+    cache = RedisCache("test", failure_threshold=2)
+    cache._pool = UnreachablePool()
+
+    async def run():
+        assert await cache.get("a") is None
+        assert await cache.mget(["a", "b"]) == [None, None]
+        # short circuited, the pool is not called
+        cache._pool = None
+        assert await cache.get("a") is None
+
+    asyncio.run(run())
+    assert cache.circuit_breaker.is_open
+    assert cache.circuit_breaker.stats()["short_circuited"] == 1
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from data.redis import Codec, HEADER_MARKER, SERIALIZERS, COMPRESSIONS, orjson, msgpack, lz4
+
+VALUE = {"city": "indore", "temperature": 21, "readings": [{"humidity": 40, "windspeed": 3}] * 5}
+LARGE_VALUE = {"history_data": [{"temperature": index % 30, "description": "scattered clouds"} for index in range(500)]}
+
+SERIALIZER_NAMES = ["json"] + ["orjson"] * bool(orjson) + ["msgpack"] * bool(msgpack)
+COMPRESSION_NAMES = ["none", "zlib"] + ["lz4"] * bool(lz4)
+
+
+@pytest.mark.parametrize("serializer", SERIALIZER_NAMES)
+@pytest.mark.parametrize("compression", COMPRESSION_NAMES)
+def test_round_trip(serializer, compression):
+    codec = Codec(serializer=serializer, compression=compression, compress_threshold=1024)
+    for value in (VALUE, LARGE_VALUE):
+        assert codec.decode(codec.encode(value)) == value
+
+
+def test_header_records_the_serializer_and_the_compression():
+    codec = Codec(serializer="json", compression="zlib", compress_threshold=1024)
+    small, large = codec.encode(VALUE), codec.encode(LARGE_VALUE)
+    assert small[0] == HEADER_MARKER | SERIALIZERS["json"] << 4 | COMPRESSIONS["none"]
+    assert large[0] == HEADER_MARKER | SERIALIZERS["json"] << 4 | COMPRESSIONS["zlib"]
+    assert len(large) < len(json.dumps(LARGE_VALUE))
+
+
+def test_decodes_values_written_with_other_settings():
+    written = Codec(serializer="json", compression="zlib", compress_threshold=0).encode(LARGE_VALUE)
+    assert Codec(serializer=SERIALIZER_NAMES[-1], compression="none").decode(written) == LARGE_VALUE
+
+
+@pytest.mark.parametrize("legacy", [json.dumps(VALUE), json.dumps(VALUE).encode(), json.dumps([1, 2]), "3"])
+def test_decodes_plain_json_written_before_the_codec(legacy):
+    assert Codec().decode(legacy) == json.loads(legacy)
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        Codec(serializer="pickle")
+
+
+@pytest.mark.skipif(lz4 is not None, reason="lz4 is installed")
+def test_missing_compression_falls_back_to_zlib():
+    assert Codec(compression="lz4").compression == "zlib"
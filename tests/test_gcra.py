@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+
+def run(redis_cache, test):
+    async def main():
+        cache = await redis_cache()
+        try:
+            await test(cache)
+        finally:
+            await cache.delete(pattern="*")
+            await cache.close()
+
+    asyncio.run(main())
+
+
+def test_allows_the_limit_then_defers(redis_cache):
+    async def test(cache):
+        results = [await cache.throttle("client", limit=5, period=10) for _ in range(6)]
+        assert [allowed for allowed, _, _, _ in results] == [True] * 5 + [False]
+        assert [remaining for _, remaining, _, _ in results] == [4, 3, 2, 1, 0, 0]
+        # a request is restored every period / limit seconds
+        _, _, retry_after, reset = results[-1]
+        assert retry_after == pytest.approx(2, abs=0.1)
+        assert reset == pytest.approx(10, abs=0.1)
+
+    run(redis_cache, test)
+
+
+def test_keys_are_limited_independently(redis_cache):
+    async def test(cache):
+        assert (await cache.throttle("first", limit=1, period=10))[0]
+        assert not (await cache.throttle("first", limit=1, period=10))[0]
+        assert (await cache.throttle("second", limit=1, period=10))[0]
+
+    run(redis_cache, test)
+
+
+def test_requests_are_restored_over_time(redis_cache):
+    async def test(cache):
+        for _ in range(2):
+            assert (await cache.throttle("client", limit=2, period=0.4))[0]
+        assert not (await cache.throttle("client", limit=2, period=0.4))[0]
+        await asyncio.sleep(0.25)
+        assert (await cache.throttle("client", limit=2, period=0.4))[0]
+
+    run(redis_cache, test)
+
+
+def test_state_expires_once_fully_restored(redis_cache):
+    async def test(cache):
+        await cache.throttle("client", limit=2, period=0.2)
+        await asyncio.sleep(0.35)
+        assert await cache.get("client") is None
+
+    run(redis_cache, test)
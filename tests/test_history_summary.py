@@ -0,0 +1,103 @@
+import asyncio
+import statistics
+
+import pytest
+from quart import Quart
+
+from app.constants import SUMMARY_METRICS
+from app.weather_manager.service import weatherManager
+
+# readings per day, oldest first, windspeed is missing on the first and the last day
+DAYS = {
+    "2026-10-01": [
+        {"temperature": 10, "air_pressure": 1010, "humidity": 40, "windspeed": None},
+        {"temperature": 14, "air_pressure": 1012, "humidity": 45, "windspeed": None},
+    ],
+    "2026-10-02": [
+        {"temperature": 18, "air_pressure": 1008, "humidity": 60, "windspeed": 3},
+        {"temperature": 12, "air_pressure": 1011, "humidity": 55, "windspeed": 5},
+        {"temperature": 16, "air_pressure": 1009, "humidity": 50, "windspeed": 4},
+    ],
+    "2026-10-03": [
+        {"temperature": 20, "air_pressure": 1005, "humidity": 35, "windspeed": None},
+    ],
+}
+
+
+def daily_rollup(day, readings):
+    """
+    Same columns as the rollups kept in weather_daily.
+    """
+    rollup = {"day": day, "count": len(readings)}
+    for metric in SUMMARY_METRICS:
+        values = [reading[metric] for reading in readings if reading[metric] is not None]
+        rollup.update({
+            f"{metric}_count": len(values),
+            f"{metric}_sum": sum(values),
+            f"{metric}_sum_sq": sum(value * value for value in values),
+            f"{metric}_min": min(values, default=None),
+            f"{metric}_max": max(values, default=None),
+            f"{metric}_first": values[0] if values else None,
+            f"{metric}_last": values[-1] if values else None,
+        })
+    return rollup
+
+
+@pytest.fixture
+def merge():
+    weather_manager = weatherManager({"location_id": "16dac885-86dc-41d3-bedc-775a5703dc8e"})
+
+    def merge(daily_rollups, percentiles=None, readings=None):
+        # mergeDailyRollups logs through the app
+        async def run():
+            async with Quart(__name__).app_context():
+                return weather_manager.mergeDailyRollups(daily_rollups, percentiles or {}, readings)
+
+        return asyncio.run(run())
+
+    return merge
+
+
+@pytest.fixture
+def daily_rollups():
+    return [daily_rollup(day, readings) for day, readings in DAYS.items()]
+
+
+def test_matches_the_stats_of_the_readings(merge, daily_rollups):
+    summary = merge(daily_rollups)
+    readings = [reading for day_readings in DAYS.values() for reading in day_readings]
+    for metric in SUMMARY_METRICS:
+        values = [reading[metric] for reading in readings if reading[metric] is not None]
+        assert summary[metric]["max"] == max(values)
+        assert summary[metric]["min"] == min(values)
+        assert summary[metric]["average"] == pytest.approx(statistics.fmean(values))
+        assert summary[metric]["stddev"] == pytest.approx(statistics.pstdev(values))
+        assert summary[metric]["first"] == values[0]
+        assert summary[metric]["last"] == values[-1]
+
+
+def test_first_and_last_skip_the_days_without_the_metric(merge, daily_rollups):
+    summary = merge(daily_rollups)
+    assert summary["windspeed"]["first"] == 3
+    assert summary["windspeed"]["last"] == 4
+
+
+def test_first_and_last_come_from_the_returned_readings(merge, daily_rollups):
+    readings = [*DAYS["2026-10-02"], *DAYS["2026-10-03"]]
+    summary = merge(daily_rollups[1:], readings=readings)
+    assert (summary["temperature"]["first"], summary["temperature"]["last"]) == (18, 20)
+    assert (summary["windspeed"]["first"], summary["windspeed"]["last"]) == (3, 4)
+
+
+def test_a_metric_without_readings_is_all_none(merge):
+    summary = merge([daily_rollup("2026-10-01", DAYS["2026-10-01"])])
+    assert summary["windspeed"] == {
+        "max": None, "min": None, "average": None, "stddev": None, "first": None, "last": None,
+        "p50": None, "p90": None, "p99": None,
+    }
+
+
+def test_percentiles_are_reported_per_metric(merge, daily_rollups):
+    summary = merge(daily_rollups, percentiles={"temperature": [15.0, 19.0, 19.9]})
+    assert {key: summary["temperature"][key] for key in ("p50", "p90", "p99")} == {"p50": 15.0, "p90": 19.0, "p99": 19.9}
+    assert summary["humidity"]["p50"] is None
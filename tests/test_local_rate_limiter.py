@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from data.rate_limiter import LocalRateLimiter
+
+
+def test_allows_the_limit_then_defers():
+    limiter = LocalRateLimiter()
+    results = [limiter.hit("client", limit=5, period=10, now=100) for _ in range(6)]
+    assert [allowed for allowed, _, _, _ in results] == [True] * 5 + [False]
+    assert [remaining for _, remaining, _, _ in results] == [4, 3, 2, 1, 0, 0]
+    _, _, retry_after, reset = results[-1]
+    assert retry_after == pytest.approx(2)
+    assert reset == pytest.approx(10)
+
+
+def test_a_request_is_restored_every_emission_interval():
+    limiter = LocalRateLimiter()
+    for _ in range(5):
+        limiter.hit("client", limit=5, period=10, now=100)
+    assert not limiter.hit("client", limit=5, period=10, now=101.9)[0]
+    allowed, remaining, _, _ = limiter.hit("client", limit=5, period=10, now=102)
+    assert allowed and remaining == 0
+    # idle for the whole period, the full limit is back
+    assert limiter.hit("client", limit=5, period=10, now=200)[1] == 4
+
+
+def test_keys_are_limited_independently():
+    limiter = LocalRateLimiter()
+    assert limiter.hit("first", limit=1, period=10, now=100)[0]
+    assert not limiter.hit("first", limit=1, period=10, now=100)[0]
+    assert limiter.hit("second", limit=1, period=10, now=100)[0]
+
+
+def test_least_recently_seen_keys_are_evicted():
+    limiter = LocalRateLimiter(max_keys=2)
+    limiter.hit("first", limit=2, period=10, now=100)
+    limiter.hit("second", limit=2, period=10, now=100)
+    limiter.hit("first", limit=2, period=10, now=100)
+    limiter.hit("third", limit=2, period=10, now=100)
+    assert limiter.stats() == {"keys": 2, "max_keys": 2, "evictions": 1}
+    # evicted, it starts over with its full limit
+    assert limiter.hit("second", limit=2, period=10, now=100)[1] == 1
+    assert limiter.hit("third", limit=2, period=10, now=100)[1] == 0
+
+
+def test_throttle_matches_the_redis_interface():
+    allowed, remaining, retry_after, reset = asyncio.run(LocalRateLimiter().throttle("client", limit=2, period=10))
+    assert (allowed, remaining, retry_after) == (True, 1, 0.0)
+    assert reset == pytest.approx(5)
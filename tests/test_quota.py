@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from app.constants import Lanes
+from data.quota import OutboundQuota
+
+
+def run(redis_cache, test):
+    async def main():
+        cache = await redis_cache()
+        try:
+            await test(cache)
+        finally:
+            await cache.delete(pattern="*")
+            await cache.close()
+
+    asyncio.run(main())
+
+
+def test_bucket_gives_its_capacity_then_defers(redis_cache):
+    async def test(cache):
+        tokens = [await cache.take_token("bucket", capacity=3, period=30) for _ in range(4)]
+        assert [taken for taken, _, _ in tokens] == [True, True, True, False]
+        # a token is refilled every period / capacity seconds
+        assert tokens[-1][2] == pytest.approx(10, abs=0.1)
+
+    run(redis_cache, test)
+
+
+def test_reserve_is_kept_for_the_higher_priorities(redis_cache):
+    async def test(cache):
+        assert (await cache.take_token("bucket", capacity=3, period=30, reserve=2))[0]
+        assert not (await cache.take_token("bucket", capacity=3, period=30, reserve=2))[0]
+        assert (await cache.take_token("bucket", capacity=3, period=30, reserve=0))[0]
+
+    run(redis_cache, test)
+
+
+def test_bucket_refills_over_time(redis_cache):
+    async def test(cache):
+        for _ in range(2):
+            await cache.take_token("bucket", capacity=2, period=0.4)
+        assert not (await cache.take_token("bucket", capacity=2, period=0.4))[0]
+        await asyncio.sleep(0.25)
+        assert (await cache.take_token("bucket", capacity=2, period=0.4))[0]
+
+    run(redis_cache, test)
+
+
+class FakeBucket:
+    """
+    Replies to take_token from a list, as (taken, tokens, retry_after) tuples or None.
+    """
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.reserves = []
+
+    async def take_token(self, key, capacity, period, reserve=0):
+        self.reserves.append(reserve)
+        return self.replies.pop(0)
+
+
+def quota(bucket, wait=1):
+    return OutboundQuota(
+        bucket, "quota", limit=10, period=1,
+        reserves={Lanes.FORECAST: 0, Lanes.GEOCODING: 2, Lanes.BACKGROUND: 5},
+        waits={Lanes.FORECAST: wait, Lanes.GEOCODING: wait, Lanes.BACKGROUND: 0},
+    )
+
+
+def test_acquire_takes_with_the_reserve_of_the_lane():
+    bucket = FakeBucket([(True, 9, 0), (True, 8, 0)])
+    outbound_quota = quota(bucket)
+    assert asyncio.run(outbound_quota.acquire(Lanes.GEOCODING))
+    assert asyncio.run(outbound_quota.acquire(Lanes.BACKGROUND))
+    assert bucket.reserves == [2, 5]
+    assert outbound_quota.stats()["granted"] == {"forecast": 0, "geocoding": 1, "background": 1}
+
+
+def test_acquire_waits_for_a_token_within_the_wait():
+    bucket = FakeBucket([(False, 0, 0.05), (False, 0, 0.05), (True, 0, 0)])
+    assert asyncio.run(quota(bucket).acquire(Lanes.FORECAST))
+    assert not bucket.replies
+
+
+def test_acquire_defers_when_the_token_comes_after_the_wait():
+    bucket = FakeBucket([(False, 0, 5)])
+    outbound_quota = quota(bucket)
+    assert not asyncio.run(outbound_quota.acquire(Lanes.FORECAST))
+    assert outbound_quota.stats()["deferred"]["forecast"] == 1
+
+
+def test_acquire_lets_calls_through_while_redis_is_unreachable():
+    assert asyncio.run(quota(FakeBucket([None])).acquire(Lanes.BACKGROUND))
@@ -0,0 +1,88 @@
+import math
+import random
+
+import pytest
+
+from data.spatial import KDTree, kd_tree_layout, geohash_encode, geohash_decode, EARTH_RADIUS_KM
+
+
+def haversine_km(latitude, longitude, other_latitude, other_longitude):
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude)
+    )
+    a = (
+        math.sin((other_latitude - latitude) / 2) ** 2
+        + math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+@pytest.fixture
+def entries():
+    generator = random.Random(0)
+    return [(generator.uniform(-90, 90), generator.uniform(-180, 180), index) for index in range(2000)]
+
+
+def brute_force(entries, latitude, longitude, k):
+    distances = sorted(
+        (haversine_km(latitude, longitude, entry_latitude, entry_longitude), item)
+        for entry_latitude, entry_longitude, item in entries
+    )
+    return distances[:k]
+
+
+def test_nearest_matches_brute_force(entries):
+    tree = KDTree(entries)
+    generator = random.Random(1)
+    # the poles and the antimeridian included
+    targets = [(90, 0), (-90, 0), (0, 180), (0, -179.99)]
+    targets += [(generator.uniform(-90, 90), generator.uniform(-180, 180)) for _ in range(50)]
+    for latitude, longitude in targets:
+        expected = brute_force(entries, latitude, longitude, 5)
+        found = tree.nearest(latitude, longitude, 5)
+        assert [item for _, item in found] == [item for _, item in expected]
+        assert [distance for distance, _ in found] == pytest.approx([distance for distance, _ in expected], abs=1e-6)
+
+
+def test_nearest_of_an_empty_tree_or_k_below_one():
+    assert KDTree([]).nearest(10, 10, 3) == []
+    assert KDTree([(10, 10, "a")]).nearest(10, 10, 0) == []
+
+
+def test_k_larger_than_the_tree_returns_everything_closest_first():
+    tree = KDTree([(0, 0, "a"), (0, 2, "b"), (0, 1, "c")])
+    assert [item for _, item in tree.nearest(0, 0, 10)] == ["a", "c", "b"]
+
+
+def test_layout_built_elsewhere_gives_the_same_tree(entries):
+    coordinates = [(latitude, longitude) for latitude, longitude, _ in entries]
+    points, order, geohashes = kd_tree_layout(coordinates)
+    assert geohashes is None
+    tree = KDTree(entries, layout=(points, order))
+    assert tree.nearest(12.5, 77.5, 5) == KDTree(entries).nearest(12.5, 77.5, 5)
+
+
+@pytest.mark.parametrize("latitude, longitude, precision, geohash", [
+    (57.64911, 10.40744, 11, "u4pruydqqvj"),
+    (42.6, -5.6, 5, "ezs42"),
+    (-25.382708, -49.265506, 8, "6gkzwgjz"),
+    (0, 0, 6, "s00000"),
+])
+def test_geohash_encode_known_cells(latitude, longitude, precision, geohash):
+    assert geohash_encode(latitude, longitude, precision) == geohash
+
+
+def test_geohash_decode_gives_the_centre_of_the_cell(entries):
+    for latitude, longitude, _ in entries[:200]:
+        geohash = geohash_encode(latitude, longitude, 6)
+        centre_latitude, centre_longitude = geohash_decode(geohash)
+        assert geohash_encode(centre_latitude, centre_longitude, 6) == geohash
+        # a precision 6 cell is 0.0055 degrees of latitude by 0.011 of longitude
+        assert abs(centre_latitude - latitude) <= 0.0055 / 2
+        assert abs(centre_longitude - longitude) <= 0.011 / 2
+
+
+def test_layout_encodes_the_geohashes(entries):
+    coordinates = [(latitude, longitude) for latitude, longitude, _ in entries]
+    _, _, geohashes = kd_tree_layout(coordinates, geohash_precision=6)
+    assert geohashes == [geohash_encode(latitude, longitude, 6) for latitude, longitude in coordinates]
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from data.write_behind import WriteBehindQueue
+
+
+class Writer:
+    """
+    Records the batches it is given, failing the first failures calls.
+    """
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.calls = 0
+        self.failures = failures
+
+    async def __call__(self, batch):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("DB is down")
+        self.batches.append(list(batch))
+
+
+def run(queue, produce):
+    async def main():
+        flusher = asyncio.ensure_future(queue.run())
+        await produce()
+        await queue.close()
+        await asyncio.wait_for(flusher, 5)
+
+    asyncio.run(main())
+
+
+def test_full_batches_are_flushed_and_the_rest_drained_on_close():
+    writer = Writer()
+    queue = WriteBehindQueue(writer, batch_size=3, flush_interval=10)
+
+    async def produce():
+        for record in range(7):
+            await queue.put(record)
+        await asyncio.sleep(0.05)
+
+    run(queue, produce)
+    assert writer.batches == [[0, 1, 2], [3, 4, 5], [6]]
+    assert queue.stats()["flushed"] == 7
+    assert queue.stats()["batches"] == 3
+
+
+def test_a_partial_batch_is_flushed_after_the_interval():
+    writer = Writer()
+    queue = WriteBehindQueue(writer, batch_size=100, flush_interval=0.05)
+
+    async def produce():
+        await queue.put(1)
+        await queue.put(2)
+        await asyncio.sleep(0.2)
+        assert writer.batches == [[1, 2]]
+
+    run(queue, produce)
+
+
+def test_a_failed_batch_is_retried():
+    writer = Writer(failures=2)
+    queue = WriteBehindQueue(writer, batch_size=2, flush_interval=0.01, max_retries=3)
+
+    async def produce():
+        await queue.put(1)
+        await queue.put(2)
+
+    run(queue, produce)
+    assert writer.batches == [[1, 2]]
+    assert queue.stats()["dropped"] == 0
+
+
+def test_a_batch_is_dropped_after_the_retries():
+    writer = Writer(failures=10)
+    queue = WriteBehindQueue(writer, batch_size=2, flush_interval=0.01, max_retries=2)
+
+    async def produce():
+        await queue.put(1)
+        await queue.put(2)
+
+    run(queue, produce)
+    assert writer.calls == 3
+    assert queue.stats()["dropped"] == 2
+
+
+def test_put_waits_while_the_queue_is_full():
+    writer = Writer()
+    queue = WriteBehindQueue(writer, max_size=2, batch_size=10, flush_interval=10)
+
+    async def main():
+        await queue.put(1)
+        await queue.put(2)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(queue.put(3), 0.05)
+
+    asyncio.run(main())
+
+
+def test_put_after_close_is_rejected():
+    queue = WriteBehindQueue(Writer())
+
+    async def main():
+        await queue.close()
+        with pytest.raises(RuntimeError):
+            await queue.put(1)
+
+    asyncio.run(main())